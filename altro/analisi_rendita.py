@@ -9,6 +9,7 @@ import os
 import re
 import sys
 import math
+import numpy as np
 import yaml
 
 if len(sys.argv) >= 2:
@@ -56,6 +57,8 @@ def calcola_pagamento_mutuo_mensile(prestito, anni, tasso):
     MESI_PER_ANNO = 12
     c = tasso / MESI_PER_ANNO
     n = MESI_PER_ANNO * anni
+    if c == 0:
+        return arrotonda_in_alto(prestito / n)
     pagamento_mensile = prestito * (c * (1 + c)**n) / ((1 + c)**n - 1)
     return arrotonda_in_alto(pagamento_mensile)
 
@@ -64,9 +67,34 @@ def calcola_saldo_mutuo(prestito, anni, tasso, anni_trascorsi):
     c = tasso / MESI_PER_ANNO
     n = MESI_PER_ANNO * anni
     p = MESI_PER_ANNO * anni_trascorsi
+    if c == 0:
+        return arrotonda_in_alto(prestito * (n - p) / n)
     saldo = prestito * ((1 + c)**n - (1 + c)**p) / ((1 + c)**n - 1)
     return arrotonda_in_alto(saldo)
 
+def calcola_pagamenti_mutuo_mensili(prestiti, anni, tassi):
+    """Versione vettoriale di calcola_pagamento_mutuo_mensile: accetta array NumPy o Series pandas e restituisce un array int64 arrotondato per eccesso"""
+    MESI_PER_ANNO = 12
+    prestiti = np.asarray(prestiti, dtype=float)
+    c = np.asarray(tassi, dtype=float) / MESI_PER_ANNO
+    n = MESI_PER_ANNO * np.asarray(anni, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crescita = (1 + c)**n
+        pagamenti = np.where(c == 0, prestiti / n, prestiti * (c * crescita) / (crescita - 1))
+    return np.ceil(pagamenti).astype(np.int64)
+
+def calcola_saldi_mutuo(prestiti, anni, tassi, anni_trascorsi):
+    """Versione vettoriale di calcola_saldo_mutuo"""
+    MESI_PER_ANNO = 12
+    prestiti = np.asarray(prestiti, dtype=float)
+    c = np.asarray(tassi, dtype=float) / MESI_PER_ANNO
+    n = MESI_PER_ANNO * np.asarray(anni, dtype=float)
+    p = MESI_PER_ANNO * np.asarray(anni_trascorsi, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crescita = (1 + c)**n
+        saldi = np.where(c == 0, prestiti * (n - p) / n, prestiti * (crescita - (1 + c)**p) / (crescita - 1))
+    return np.ceil(saldi).astype(np.int64)
+
 class Proprietà(object):
     __nome = 'PROPRIETÀ'
     __sorgente = ['venditore', 'catasto']
@@ -10,6 +10,10 @@ from geopy.geocoders import Nominatim
 from geopy.extra.rate_limiter import RateLimiter
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 
+# __NEXT_DATA__ parsing is shared with the enricher; run from the repository
+# root as python -m altro.immo_scraper
+from next_data import estrai_next_data, primo_nodo
+
 zone_mapping = {
     'centro': 'Centro Storico',
     'navigli': 'Navigli',
@@ -164,6 +168,45 @@ class ImmobiliareScraper:
             print(f"Error extracting listing data: {e}")
             return {}
 
+    def extract_listings_from_json(self, html: str) -> List[Dict]:
+        """Extract listings from the page's embedded __NEXT_DATA__ JSON, empty if it has none"""
+        state = estrai_next_data(html)
+        if state is None:
+            return []
+
+        # the search results are the first list of objects carrying a realEstate
+        results = primo_nodo(state, lambda node: isinstance(node, list) and node and
+                             all(isinstance(item, dict) and 'realEstate' in item for item in node))
+        if not results:
+            return []
+
+        def get(node, path, default="N/A"):
+            for key in path.split('.'):
+                if isinstance(node, list):
+                    node = node[0] if node else None
+                node = node.get(key) if isinstance(node, dict) else None
+            return default if node in (None, '') else node
+
+        listings = []
+        for result in results:
+            real_estate = result['realEstate']
+            prop = get(real_estate, 'properties', [{}])
+            prop = prop[0] if isinstance(prop, list) and prop else {}
+            floor = get(prop, 'floor.abbreviation', get(prop, 'floor.value'))
+            features = ' '.join(str(f).lower() for f in get(prop, 'ga4features', []))
+            listings.append({
+                "prezzo": str(get(real_estate, 'price.formattedValue')).strip(),
+                "titolo": str(get(real_estate, 'title')).strip(),
+                "link": get(result, 'seo.url', get(real_estate, 'url')),
+                "foto": get(prop, 'multimedia.photos.urls.small', get(prop, 'photo.urls.small')),
+                "n_locali": str(get(prop, 'rooms')).replace("locali", "").strip(),
+                "metratura": str(get(prop, 'surface')).replace("m²", "").strip(),
+                "bagni": str(get(prop, 'bathrooms')).replace("bagni", "").strip(),
+                "piano": str(floor).replace("Piano", "").strip(),
+                "ascensore": "Sì" if get(prop, 'elevator', False) is True or 'ascensore' in features else "N/A"
+            })
+        return listings
+
     def scrape_listings(self, zone: str, max_pages: int = 1) -> List[Dict]:
         """Scrape multiple pages of listings"""
         all_listings = []
@@ -172,14 +215,20 @@ class ImmobiliareScraper:
             try:
                 print(f"Scraping page {page}...")
                 html = self.get_page(zone,page)
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                listings = soup.find_all("div", class_="nd-mediaObject--colToRow")
                 
-                for listing in listings:
-                    data = self.extract_listing_data(listing)
-                    if data:
-                        all_listings.append(data)
+                # Fast path: the JSON state embedded in the page, DOM scraping as a fallback
+                json_listings = self.extract_listings_from_json(html)
+                if json_listings:
+                    all_listings.extend(json_listings)
+                else:
+                    soup = BeautifulSoup(html, 'html.parser')
+                    
+                    listings = soup.find_all("div", class_="nd-mediaObject--colToRow")
+                    
+                    for listing in listings:
+                        data = self.extract_listing_data(listing)
+                        if data:
+                            all_listings.append(data)
                 
                 time.sleep(0.2)  # Be nice to the server
                 
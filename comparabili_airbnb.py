@@ -0,0 +1,169 @@
+"""
+Comparabili Airbnb per vicinanza geografica.
+
+Gli annunci di listing_clean.csv (con Latitudine/Longitudine) vengono
+proiettati in km attorno al loro centro e messi in una griglia di celle
+quadrate, ordinata per (locali, cella). Per ogni immobile si cercano i
+``k`` annunci più vicini con un numero di locali entro ``tolleranza_locali``,
+leggendo solo le celle attorno al punto: si parte dall'anello di celle
+adiacenti e lo si allarga solo per gli immobili per cui i comparabili
+trovati non bastano a garantire i k più vicini, fino a ``raggio_max_km``.
+Tutti gli immobili si interrogano insieme, con array NumPy.
+
+Il prezzo per notte stimato è la media dei comparabili pesata con
+1 / (distanza + DISTANZA_MINIMA_KM).
+"""
+import numpy as np
+import pandas as pd
+
+
+KM_PER_GRADO = 111.32
+LATO_CELLA_KM = 0.3
+DISTANZA_MINIMA_KM = 0.1
+K = 10
+TOLLERANZA_LOCALI = 1
+RAGGIO_MAX_KM = 3.0
+OCCUPANCY = 0.70
+
+
+class IndiceGeoAirbnb:
+    """
+    Griglia degli annunci Airbnb per la ricerca dei vicini
+
+    Args:
+        df_airbnb (pd.DataFrame): listing_clean.csv con Latitudine e Longitudine
+        lato_cella_km (float): lato delle celle della griglia
+    """
+
+    def __init__(self, df_airbnb, lato_cella_km=LATO_CELLA_KM):
+        df = df_airbnb.dropna(subset=['Latitudine', 'Longitudine', 'Prezzo per Notte']).reset_index(drop=True)
+        self.df = df
+        self.lato = lato_cella_km
+        self.lat0 = float(df['Latitudine'].mean()) if len(df) else 0.0
+        self.lon0 = float(df['Longitudine'].mean()) if len(df) else 0.0
+
+        self.xy = self.proietta(df['Latitudine'].to_numpy(float), df['Longitudine'].to_numpy(float))
+        self.locali = pd.to_numeric(df['Locali'], errors='coerce').fillna(0).to_numpy().astype(np.int64)
+        self.prezzi = df['Prezzo per Notte'].to_numpy(float)
+
+        celle = np.floor(self.xy / self.lato).astype(np.int64)
+        self.origine = celle.min(axis=0) - 1 if len(df) else np.zeros(2, dtype=np.int64)
+        self.dimensioni = celle.max(axis=0) - self.origine + 2 if len(df) else np.ones(2, dtype=np.int64)
+        chiavi = self._chiavi(self.locali, celle)
+        self.ordine = np.argsort(chiavi, kind='stable')
+        self.chiavi = chiavi[self.ordine]
+
+    def __len__(self):
+        return len(self.df)
+
+    def proietta(self, lat, lon):
+        """Coordinate in km (x verso est, y verso nord) rispetto al centro degli annunci"""
+        x = (lon - self.lon0) * KM_PER_GRADO * np.cos(np.radians(self.lat0))
+        y = (lat - self.lat0) * KM_PER_GRADO
+        return np.stack([x, y], axis=-1)
+
+    def _chiavi(self, locali, celle):
+        # celle fuori dalla griglia finiscono su chiavi inesistenti
+        cx = np.clip(celle[..., 0] - self.origine[0], -1, self.dimensioni[0])
+        cy = np.clip(celle[..., 1] - self.origine[1], -1, self.dimensioni[1])
+        fuori = (cx < 0) | (cy < 0) | (cx >= self.dimensioni[0]) | (cy >= self.dimensioni[1])
+        chiavi = (locali * self.dimensioni[0] + cx) * self.dimensioni[1] + cy
+        return np.where(fuori, -1, chiavi)
+
+    def _candidati(self, xy, locali, anello, tolleranza):
+        """(immobile, annuncio) di tutti gli annunci nelle celle entro ``anello`` celle da ogni immobile"""
+        celle = np.floor(xy / self.lato).astype(np.int64)
+        passi = np.arange(-anello, anello + 1)
+        dl, dx, dy = [a.ravel() for a in np.meshgrid(np.arange(-tolleranza, tolleranza + 1), passi, passi, indexing='ij')]
+        vicine = np.stack([celle[:, None, 0] + dx, celle[:, None, 1] + dy], axis=-1)
+        locali_vicini = locali[:, None] + dl
+        chiavi = np.where(locali_vicini >= 0, self._chiavi(locali_vicini, vicine), -1)
+        inizio = np.searchsorted(self.chiavi, chiavi, side='left')
+        fine = np.where(chiavi >= 0, np.searchsorted(self.chiavi, chiavi, side='right'), inizio)
+
+        lunghezze = (fine - inizio).ravel()
+        totale = lunghezze.sum()
+        immobili = np.repeat(np.repeat(np.arange(len(xy)), chiavi.shape[1]), lunghezze)
+        partenze = np.repeat(np.cumsum(lunghezze) - lunghezze, lunghezze)
+        posizioni = np.repeat(inizio.ravel(), lunghezze) + np.arange(totale) - partenze
+        return immobili, self.ordine[posizioni]
+
+    def vicini(self, lat, lon, locali, k=K, tolleranza_locali=TOLLERANZA_LOCALI, raggio_max_km=RAGGIO_MAX_KM):
+        """
+        I ``k`` annunci più vicini a ogni immobile, con locali simili
+
+        Args:
+            lat, lon (array): coordinate degli immobili
+            locali (array): locali degli immobili
+            k (int): comparabili per immobile
+            tolleranza_locali (int): differenza di locali ammessa
+            raggio_max_km (float): distanza oltre la quale non si cerca
+
+        Returns:
+            tuple: (indici, distanze), matrici (immobili x k) con indici
+            nelle righe di ``self.df`` (-1 se mancano comparabili) e
+            distanze in km (inf se mancano), ordinate per distanza
+        """
+        xy = self.proietta(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)).reshape(-1, 2)
+        locali = np.nan_to_num(np.asarray(locali, dtype=float)).astype(np.int64).ravel()
+        n = len(xy)
+        indici = np.full((n, k), -1, dtype=np.int64)
+        distanze = np.full((n, k), np.inf)
+        if not len(self) or not n:
+            return indici, distanze
+
+        da_cercare = np.flatnonzero(np.isfinite(xy).all(axis=1))
+        anello = 1
+        while len(da_cercare):
+            immobili, annunci = self._candidati(xy[da_cercare], locali[da_cercare], anello, tolleranza_locali)
+            d = np.hypot(*(self.xy[annunci] - xy[da_cercare][immobili]).T)
+            tenuti = d <= raggio_max_km
+            immobili, annunci, d = immobili[tenuti], annunci[tenuti], d[tenuti]
+
+            # i primi k per immobile: ordine per (immobile, distanza), poi rango nel gruppo;
+            # d <= raggio_max_km, quindi una sola chiave in virgola mobile basta
+            ordine = np.argsort(immobili * (2 * raggio_max_km) + d, kind='stable')
+            immobili, annunci, d = immobili[ordine], annunci[ordine], d[ordine]
+            inizio_gruppo = np.searchsorted(immobili, np.arange(len(da_cercare)))
+            rango = np.arange(len(immobili)) - inizio_gruppo[immobili]
+            primi = rango < k
+            righe = da_cercare[immobili[primi]]
+            indici[righe, rango[primi]] = annunci[primi]
+            distanze[righe, rango[primi]] = d[primi]
+
+            # esatto se il k-esimo è entro la distanza coperta dall'anello, o se l'anello copre già il raggio massimo
+            coperto = anello * self.lato
+            if coperto >= raggio_max_km:
+                break
+            da_cercare = da_cercare[~(distanze[da_cercare, -1] <= coperto)]
+            indici[da_cercare] = -1
+            distanze[da_cercare] = np.inf
+            anello *= 2
+        return indici, distanze
+
+    def stima(self, lat, lon, locali, k=K, tolleranza_locali=TOLLERANZA_LOCALI, raggio_max_km=RAGGIO_MAX_KM):
+        """
+        Prezzo per notte pesato per distanza e rendita annua di ogni immobile
+
+        Returns:
+            pd.DataFrame: PREZZO_NOTTE, RENDITA_ANNUA, NUMERO_COMPARABILI e
+            DISTANZA_MEDIA_KM per immobile (NaN se non ci sono comparabili)
+        """
+        return self.stima_da_vicini(*self.vicini(lat, lon, locali, k, tolleranza_locali, raggio_max_km))
+
+    def stima_da_vicini(self, indici, distanze):
+        """stima sul risultato di una chiamata a vicini, senza ripetere la ricerca"""
+        trovati = indici >= 0
+        pesi = np.where(trovati, 1 / (distanze + DISTANZA_MINIMA_KM), 0.0)
+        prezzi = np.where(trovati, self.prezzi[np.maximum(indici, 0)], 0.0)
+        somma_pesi = pesi.sum(axis=1)
+        numero = trovati.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            prezzo_notte = (pesi * prezzi).sum(axis=1) / somma_pesi
+            distanza_media = np.where(trovati, distanze, 0.0).sum(axis=1) / numero
+        return pd.DataFrame({
+            'PREZZO_NOTTE': prezzo_notte,
+            'RENDITA_ANNUA': prezzo_notte * 365 * OCCUPANCY,
+            'NUMERO_COMPARABILI': numero,
+            'DISTANZA_MEDIA_KM': distanza_media,
+        })
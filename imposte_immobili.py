@@ -0,0 +1,529 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Imposte e costi di acquisto di immobili italiani, calcolati su tabelle intere.
+
+Le aliquote non sono scritte nel codice ma in regole_fiscali.yml: imposte di
+registro, ipotecaria e catastale o IVA a seconda di prima/seconda casa e di
+venditore privato o costruttore, registro sul valore catastale (prezzo-valore),
+IMU e TARI per comune e cedolare secca ordinaria o a canone concordato,
+confrontata con la tassazione IRPEF ordinaria del canone.
+
+Ogni funzione riceve un DataFrame con una riga per immobile e restituisce
+colonne allineate al suo indice, calcolate con operazioni vettoriali;
+calcola_imposte_immobile fa lo stesso calcolo per un immobile solo.
+
+Colonne lette (quelle assenti prendono i valori DEFAULT delle regole):
+    PREZZO                  prezzo di acquisto (obbligatoria)
+    RENDITA_CATASTALE       rendita non rivalutata; se manca il registro
+                            la stima dal prezzo (CATASTO.RENDITA_SU_PREZZO)
+                            e l'IMU usa il prezzo come base
+    PRIMA_CASA              True/False
+    VENDITORE               PRIVATO o COSTRUTTORE
+    CATEGORIA_CATASTALE     es. A/2
+    COMUNE                  chiave di IMU.ALIQUOTE e TARI.TARIFFE, es. MILANO
+    MQ                      superficie per la quota fissa TARI
+    N_COMPONENTI            componenti del nucleo per la TARI; se manca
+                            si stima da LOCALI
+    AFFITTO_MENSILE         canone per la cedolare secca
+    CANONE_CONCORDATO       True per la cedolare al 10%
+    ALIQUOTA_IMU, ALIQUOTA_CEDOLARE
+                            aliquote che sostituiscono quelle delle regole
+
+uso: python imposte_immobili.py immobiliare_listings_processed.csv [--colonna prezzo=PREZZO] [--out imposte.csv]
+     python imposte_immobili.py immobili.csv --reddito 25000 --reddito 60000 [--regione LOMBARDIA] [--comune MILANO]
+"""
+from __future__ import division
+import os
+import sys
+import argparse
+import functools
+import warnings
+
+import numpy as np
+import pandas as pd
+import yaml
+
+
+FILE_REGOLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regole_fiscali.yml')
+VENDITORI = ['PRIVATO', 'COSTRUTTORE']
+MAX_COMPONENTI = 6
+
+COLONNE_ACQUISTO = [
+    'IMPOSTA_REGISTRO',
+    'IMPOSTA_IPOTECARIA',
+    'IMPOSTA_CATASTALE',
+    'IVA',
+    'SPESE_NOTARILI',
+    'PROVVIGIONE_AGENZIA',
+    'COSTI_ACQUISTO',
+]
+
+
+# tabelle delle regole indicizzate per comune o regione
+TABELLE_PER_NOME = [
+    ('IMU', 'ALIQUOTE'),
+    ('TARI', 'TARIFFE'),
+    ('IRPEF', 'ADDIZIONALI_REGIONALI'),
+    ('IRPEF', 'ADDIZIONALI_COMUNALI'),
+]
+
+
+@functools.lru_cache(maxsize=None)
+def carica_regole(file_regole=FILE_REGOLE):
+    """
+    Legge la tabella delle regole fiscali, una volta per file
+
+    Le chiavi delle TABELLE_PER_NOME si normalizzano come i valori cercati,
+    es. SESTO SAN GIOVANNI diventa SESTOSANGIOVANNI. Il dizionario e'
+    condiviso, non va modificato.
+    """
+    with open(file_regole, 'r') as f:
+        regole = yaml.load(f, Loader=yaml.SafeLoader)
+    for sezione, tabella in TABELLE_PER_NOME:
+        regole[sezione][tabella] = dict((_normalizza(nome), voce) for nome, voce in regole[sezione][tabella].items())
+    return regole
+
+
+def _colonna(tabella, nome, regole):
+    if nome in tabella:
+        return tabella[nome]
+    return pd.Series(regole['DEFAULT'].get(nome), index=tabella.index)
+
+
+def _normalizza(valore):
+    return str(valore).strip().upper().replace(' ', '')
+
+
+def _per_valore(tabella, nome, regole, funzione, tipo=bool):
+    """Applica ``funzione`` una volta per valore distinto della colonna ``nome`` normalizzato"""
+    codici, unici = pd.factorize(_colonna(tabella, nome, regole), use_na_sentinel=False)
+    default = regole['DEFAULT'].get(nome)
+    risultati = [funzione(default if pd.isnull(valore) else valore) for valore in unici]
+    return np.array(risultati, dtype=tipo)[codici]
+
+
+def _numero(tabella, nome):
+    if nome in tabella:
+        return pd.to_numeric(tabella[nome], errors='coerce').to_numpy(dtype=float)
+    return np.full(len(tabella), np.nan)
+
+
+def _vero(valore):
+    if isinstance(valore, (bool, np.bool_, int, float, np.number)):
+        return bool(valore)
+    return _normalizza(valore) in ('TRUE', '1', 'SI', 'SÌ', 'YES')
+
+
+def _costruttore(valore):
+    venditore = _normalizza(valore)
+    if venditore not in VENDITORI:
+        raise ValueError("VENDITORE sconosciuto: %s" % valore)
+    return venditore == 'COSTRUTTORE'
+
+
+def classifica(tabella, regole):
+    """Casi fiscali di ogni riga: venditore costruttore, prima casa effettiva e lusso"""
+    lusso = _per_valore(tabella, 'CATEGORIA_CATASTALE', regole, lambda c: _normalizza(c) in regole['CATEGORIE_LUSSO'])
+    prima_casa = _per_valore(tabella, 'PRIMA_CASA', regole, _vero)
+    return {
+        'COSTRUTTORE': _per_valore(tabella, 'VENDITORE', regole, _costruttore),
+        'PRIMA_CASA': prima_casa & ~lusso,
+        'ABITAZIONE_PRINCIPALE': prima_casa,
+        'LUSSO': lusso,
+    }
+
+
+def valore_catastale(tabella, moltiplicatori, rendita_su_prezzo=None):
+    """
+    Rendita rivalutata per il moltiplicatore di ogni riga
+
+    Dove manca la rendita e' NaN, o con ``rendita_su_prezzo`` la rendita si
+    stima come quella frazione del prezzo.
+    """
+    rendita = _numero(tabella, 'RENDITA_CATASTALE')
+    if rendita_su_prezzo is not None:
+        rendita = np.where(np.isnan(rendita), _numero(tabella, 'PREZZO') * rendita_su_prezzo, rendita)
+    return rendita * moltiplicatori
+
+
+def calcola_costi_acquisto(tabella, regole=None):
+    """
+    Imposte e spese di acquisto di ogni immobile
+
+    Args:
+        tabella (DataFrame): una riga per immobile, vedi le colonne in testa al modulo
+        regole (dict): regole fiscali, di default lette da FILE_REGOLE
+
+    Returns:
+        DataFrame: le colonne COLONNE_ACQUISTO, stesso indice di ``tabella``
+    """
+    regole = regole or carica_regole()
+    acquisto = regole['ACQUISTO']
+    casi = classifica(tabella, regole)
+    prezzo = _numero(tabella, 'PREZZO')
+    costruttore = casi['COSTRUTTORE']
+    prima_casa = casi['PRIMA_CASA']
+
+    # caso di ogni riga, nell'ordine in cui np.select li valuta
+    condizioni = [
+        costruttore & casi['LUSSO'],
+        costruttore & prima_casa,
+        costruttore,
+        prima_casa,
+    ]
+    regimi = [
+        acquisto['COSTRUTTORE']['LUSSO'],
+        acquisto['COSTRUTTORE']['PRIMA_CASA'],
+        acquisto['COSTRUTTORE']['SECONDA_CASA'],
+        acquisto['PRIVATO']['PRIMA_CASA'],
+    ]
+    altrimenti = acquisto['PRIVATO']['SECONDA_CASA']
+
+    def regola(nome):
+        return np.select(condizioni, [r[nome] for r in regimi], default=altrimenti[nome]).astype(float)
+
+    catasto = regole['CATASTO']
+    moltiplicatori = np.where(
+        prima_casa,
+        catasto['MOLTIPLICATORI_REGISTRO']['PRIMA_CASA'],
+        catasto['MOLTIPLICATORI_REGISTRO']['SECONDA_CASA'],
+    ) * (1 + catasto['RIVALUTAZIONE_RENDITA'])
+    base_registro = valore_catastale(tabella, moltiplicatori, catasto['RENDITA_SU_PREZZO'])
+
+    # privato: aliquota sulla base catastale con minimo; costruttore: importo fisso
+    registro = np.where(
+        costruttore,
+        regola('REGISTRO'),
+        np.maximum(regola('REGISTRO') * base_registro, acquisto['REGISTRO_MINIMO']),
+    )
+    costi = pd.DataFrame({
+        'IMPOSTA_REGISTRO': registro,
+        'IMPOSTA_IPOTECARIA': regola('IPOTECARIA'),
+        'IMPOSTA_CATASTALE': regola('CATASTALE'),
+        'IVA': regola('IVA') * prezzo,
+        'SPESE_NOTARILI': acquisto['SPESE_NOTARILI'] * prezzo,
+        'PROVVIGIONE_AGENZIA': acquisto['PROVVIGIONE_AGENZIA'] * prezzo,
+    }, index=tabella.index)
+    costi['COSTI_ACQUISTO'] = costi.sum(axis=1)
+    return costi[COLONNE_ACQUISTO]
+
+
+def _moltiplicatore_imu(categoria, regole):
+    categoria = _normalizza(categoria)
+    moltiplicatori = regole['CATASTO']['MOLTIPLICATORI_IMU']
+    return float(moltiplicatori.get(categoria, moltiplicatori.get(categoria[:1], np.nan)))
+
+
+def _aliquota_imu(comune, regole):
+    aliquote = regole['IMU']['ALIQUOTE']
+    return float(aliquote.get(_normalizza(comune), aliquote['DEFAULT']))
+
+
+def calcola_imu(tabella, regole=None):
+    """
+    IMU annua di ogni immobile
+
+    La base e' la rendita rivalutata per il moltiplicatore della categoria
+    (o del suo gruppo, es. A); senza rendita si usa il prezzo. L'abitazione
+    principale e' esente, tranne le categorie di lusso che pagano l'aliquota
+    ridotta meno la detrazione.
+
+    Returns:
+        Series: IMU annua, stesso indice di ``tabella``
+    """
+    regole = regole or carica_regole()
+    imu = regole['IMU']
+    casi = classifica(tabella, regole)
+    prima_casa = casi['ABITAZIONE_PRINCIPALE']
+
+    moltiplicatori = _per_valore(tabella, 'CATEGORIA_CATASTALE', regole, lambda c: _moltiplicatore_imu(c, regole), float)
+    base = valore_catastale(tabella, moltiplicatori * (1 + regole['CATASTO']['RIVALUTAZIONE_RENDITA']))
+    base = np.where(np.isnan(base), _numero(tabella, 'PREZZO'), base)
+
+    aliquote = _per_valore(tabella, 'COMUNE', regole, lambda c: _aliquota_imu(c, regole), float)
+    sostitutive = _numero(tabella, 'ALIQUOTA_IMU')
+    aliquote = np.where(np.isnan(sostitutive), aliquote, sostitutive)
+
+    importo = np.select(
+        [prima_casa & casi['LUSSO'], prima_casa],
+        [np.maximum(base * imu['ABITAZIONE_PRINCIPALE_LUSSO'] - imu['DETRAZIONE_ABITAZIONE_PRINCIPALE'], 0), 0.0],
+        default=base * aliquote,
+    )
+    return pd.Series(importo, index=tabella.index, name='IMU')
+
+
+def stima_componenti(locali):
+    """Componenti del nucleo stimati dai locali: 1 fino al bilocale, poi uno per locale fino a 4"""
+    return np.clip(np.nan_to_num(np.asarray(locali, dtype=float), nan=1) - 1, 1, 4).astype(np.int64)
+
+
+def _per_componenti(valore):
+    return np.broadcast_to(np.asarray(valore, dtype=float), (MAX_COMPONENTI,))
+
+
+def calcola_tari(tabella, regole=None):
+    """
+    TARI annua di ogni immobile
+
+    Le tariffe del comune di ogni riga (o DEFAULT) diventano matrici
+    (comuni x componenti), lette poi con un solo indice per riga:
+    (quota fissa al mq x MQ + quota variabile) x (1 + tributo provinciale).
+    Oltre MAX_COMPONENTI vale la tariffa dell'ultimo scaglione. I comuni
+    senza voce in TARI.TARIFFE pagano le tariffe DEFAULT, con un avviso.
+
+    Returns:
+        Series: TARI annua, stesso indice di ``tabella``
+    """
+    regole = regole or carica_regole()
+    tariffe = regole['TARI']['TARIFFE']
+    comuni = list(tariffe)
+
+    fissa = np.array([_per_componenti(tariffe[comune]['QUOTA_FISSA_MQ']) for comune in comuni])
+    variabile = np.array([_per_componenti(tariffe[comune]['QUOTA_VARIABILE']) for comune in comuni])
+    provinciale = np.array([float(tariffe[comune].get('TRIBUTO_PROVINCIALE', 0)) for comune in comuni])
+
+    senza_tariffa = set()
+
+    def riga(comune):
+        chiave = _normalizza(comune)
+        if chiave not in tariffe:
+            senza_tariffa.add(str(comune).strip())
+            chiave = 'DEFAULT'
+        return comuni.index(chiave)
+
+    righe = _per_valore(tabella, 'COMUNE', regole, riga, np.int64)
+    if senza_tariffa:
+        warnings.warn("TARI.TARIFFE non ha %s: uso le tariffe DEFAULT" % ', '.join(sorted(senza_tariffa)))
+    componenti = _numero(tabella, 'N_COMPONENTI')
+    componenti = np.where(np.isnan(componenti), stima_componenti(_numero(tabella, 'LOCALI')), componenti)
+    colonne = np.clip(componenti, 1, MAX_COMPONENTI).astype(np.int64) - 1
+    mq = np.nan_to_num(_numero(tabella, 'MQ'))
+
+    importo = (fissa[righe, colonne] * mq + variabile[righe, colonne]) * (1 + provinciale[righe])
+    return pd.Series(importo, index=tabella.index, name='TARI')
+
+
+def aliquota_cedolare(tabella, regole=None):
+    """Aliquota della cedolare secca di ogni immobile"""
+    regole = regole or carica_regole()
+    cedolare = regole['CEDOLARE_SECCA']
+    aliquote = np.where(_per_valore(tabella, 'CANONE_CONCORDATO', regole, _vero), cedolare['CANONE_CONCORDATO'], cedolare['ORDINARIA'])
+    sostitutive = _numero(tabella, 'ALIQUOTA_CEDOLARE')
+    return pd.Series(np.where(np.isnan(sostitutive), aliquote, sostitutive), index=tabella.index, name='ALIQUOTA_CEDOLARE')
+
+
+def imposta_progressiva(imponibile, scaglioni):
+    """
+    Imposta a scaglioni su ogni elemento di ``imponibile``
+
+    Args:
+        imponibile (array): redditi imponibili, di qualsiasi forma
+        scaglioni (list): coppie [soglia, aliquota] in ordine crescente di soglia
+
+    Returns:
+        array: imposta, stessa forma di ``imponibile``
+    """
+    soglie = np.array([soglia for soglia, _ in scaglioni], dtype=float)
+    aliquote = np.array([aliquota for _, aliquota in scaglioni], dtype=float)
+    ampiezze = np.append(soglie[1:], np.inf) - soglie
+    imponibile = np.asarray(imponibile, dtype=float)[..., None]
+    return (np.clip(imponibile - soglie, 0, ampiezze) * aliquote).sum(axis=-1)
+
+
+def imposta_irpef(reddito, regole=None, regione=None, comune=None, detrazioni=0):
+    """IRPEF netta delle ``detrazioni`` (mai negativa) piu' addizionali regionale e comunale su ogni elemento di ``reddito``"""
+    regole = regole or carica_regole()
+    irpef = regole['IRPEF']
+    regione = _normalizza(regione or regole['DEFAULT']['REGIONE'])
+    comune = _normalizza(comune or regole['DEFAULT']['COMUNE_RESIDENZA'])
+    regionale = irpef['ADDIZIONALI_REGIONALI'].get(regione, irpef['ADDIZIONALI_REGIONALI']['DEFAULT'])
+    comunale = irpef['ADDIZIONALI_COMUNALI'].get(comune, irpef['ADDIZIONALI_COMUNALI']['DEFAULT'])
+
+    reddito = np.asarray(reddito, dtype=float)
+    addizionale_comunale = np.where(reddito > comunale['ESENZIONE'], reddito * comunale['ALIQUOTA'], 0.0)
+    irpef_netta = np.maximum(imposta_progressiva(reddito, irpef['SCAGLIONI']) - detrazioni, 0)
+    return irpef_netta + imposta_progressiva(reddito, regionale) + addizionale_comunale
+
+
+def confronta_regimi(tabella, redditi, regole=None, regione=None, comune=None, detrazioni=0):
+    """
+    Cedolare secca contro IRPEF ordinaria per ogni immobile e ogni reddito del proprietario
+
+    Con l'IRPEF il canone (meno la deduzione forfettaria e, a canone
+    concordato, la riduzione) si somma agli altri redditi: l'imposta del
+    canone e' la differenza di IRPEF e addizionali con e senza di esso. Le
+    detrazioni non ancora assorbite dagli altri redditi riducono l'IRPEF sul
+    canone, la cedolare no. Ogni immobile e' valutato da solo sopra gli altri
+    redditi.
+
+    Args:
+        tabella (DataFrame): una riga per immobile con AFFITTO_MENSILE
+        redditi (array): altri redditi annui del proprietario da confrontare
+        regione, comune (str): residenza del proprietario, di default quella delle regole
+        detrazioni (float o array come ``redditi``): detrazioni IRPEF annue del proprietario
+
+    Returns:
+        DataFrame: una riga per (immobile, reddito) con IMPOSTA_IRPEF,
+        IMPOSTA_CEDOLARE, REGIME_MIGLIORE e RISPARMIO
+    """
+    regole = regole or carica_regole()
+    irpef = regole['IRPEF']
+    redditi = np.atleast_1d(np.asarray(redditi, dtype=float))
+
+    canone = _numero(tabella, 'AFFITTO_MENSILE') * 12
+    concordato = _per_valore(tabella, 'CANONE_CONCORDATO', regole, _vero)
+    imponibile = canone * (1 - irpef['DEDUZIONE_FORFETTARIA']) * np.where(concordato, 1 - irpef['RIDUZIONE_CANONE_CONCORDATO'], 1.0)
+
+    # (immobili x redditi): l'imposta sui soli altri redditi si calcola una volta per reddito
+    detrazioni = np.broadcast_to(np.asarray(detrazioni, dtype=float), redditi.shape)
+    imposta_irpef_canone = imposta_irpef(redditi[None, :] + imponibile[:, None], regole, regione, comune, detrazioni[None, :]) - \
+        imposta_irpef(redditi, regole, regione, comune, detrazioni)[None, :]
+    imposta_cedolare = np.broadcast_to((aliquota_cedolare(tabella, regole).to_numpy() * canone)[:, None], imposta_irpef_canone.shape)
+
+    indice = pd.MultiIndex.from_product([tabella.index, redditi], names=[tabella.index.name, 'REDDITO'])
+    return pd.DataFrame({
+        'IMPOSTA_IRPEF': imposta_irpef_canone.ravel(),
+        'IMPOSTA_CEDOLARE': imposta_cedolare.ravel(),
+        'REGIME_MIGLIORE': np.where(imposta_cedolare <= imposta_irpef_canone, 'CEDOLARE_SECCA', 'IRPEF').ravel(),
+        'RISPARMIO': np.abs(imposta_irpef_canone - imposta_cedolare).ravel(),
+    }, index=indice)
+
+
+def calcola_imposte(tabella, regole=None):
+    """
+    Costi di acquisto, IMU, TARI e cedolare secca di ogni immobile in un solo passaggio
+
+    Returns:
+        DataFrame: COLONNE_ACQUISTO, IMU, TARI, ALIQUOTA_CEDOLARE e CEDOLARE_SECCA
+        (annua, NaN senza AFFITTO_MENSILE), stesso indice di ``tabella``
+    """
+    regole = regole or carica_regole()
+    imposte = calcola_costi_acquisto(tabella, regole)
+    imposte['IMU'] = calcola_imu(tabella, regole)
+    imposte['TARI'] = calcola_tari(tabella, regole)
+    imposte['ALIQUOTA_CEDOLARE'] = aliquota_cedolare(tabella, regole)
+    imposte['CEDOLARE_SECCA'] = imposte['ALIQUOTA_CEDOLARE'] * _numero(tabella, 'AFFITTO_MENSILE') * 12
+    return imposte
+
+
+def calcola_imposte_immobile(immobile, regole=None):
+    """
+    calcola_imposte per un solo immobile, senza passare da un DataFrame
+
+    Stesse regole e stessi default di calcola_imposte, valutati una volta:
+    per le tabelle di molti immobili resta piu' veloce calcola_imposte.
+
+    Args:
+        immobile (dict): le colonne in testa al modulo, None o assenti se mancano
+        regole (dict): regole fiscali, di default lette da FILE_REGOLE
+
+    Returns:
+        dict: le voci di calcola_imposte, in float
+    """
+    regole = regole or carica_regole()
+    acquisto = regole['ACQUISTO']
+    catasto = regole['CATASTO']
+    imu = regole['IMU']
+
+    def campo(nome):
+        valore = immobile.get(nome)
+        return regole['DEFAULT'].get(nome) if valore is None or pd.isnull(valore) else valore
+
+    def numero(nome):
+        try:
+            return float(immobile.get(nome))
+        except (TypeError, ValueError):
+            return np.nan
+
+    costruttore = _costruttore(campo('VENDITORE'))
+    lusso = _normalizza(campo('CATEGORIA_CATASTALE')) in regole['CATEGORIE_LUSSO']
+    abitazione_principale = _vero(campo('PRIMA_CASA'))
+    prima_casa = abitazione_principale and not lusso
+    if costruttore:
+        regime = acquisto['COSTRUTTORE']['LUSSO' if lusso else 'PRIMA_CASA' if prima_casa else 'SECONDA_CASA']
+    else:
+        regime = acquisto['PRIVATO']['PRIMA_CASA' if prima_casa else 'SECONDA_CASA']
+
+    prezzo = numero('PREZZO')
+    rendita = numero('RENDITA_CATASTALE')
+    rivalutazione = 1 + catasto['RIVALUTAZIONE_RENDITA']
+    if costruttore:
+        registro = float(regime['REGISTRO'])
+    else:
+        moltiplicatore = catasto['MOLTIPLICATORI_REGISTRO']['PRIMA_CASA' if prima_casa else 'SECONDA_CASA'] * rivalutazione
+        stimata = prezzo * catasto['RENDITA_SU_PREZZO'] if np.isnan(rendita) else rendita
+        registro = max(regime['REGISTRO'] * stimata * moltiplicatore, float(acquisto['REGISTRO_MINIMO']))
+    imposte = {
+        'IMPOSTA_REGISTRO': registro,
+        'IMPOSTA_IPOTECARIA': float(regime['IPOTECARIA']),
+        'IMPOSTA_CATASTALE': float(regime['CATASTALE']),
+        'IVA': regime['IVA'] * prezzo,
+        'SPESE_NOTARILI': acquisto['SPESE_NOTARILI'] * prezzo,
+        'PROVVIGIONE_AGENZIA': acquisto['PROVVIGIONE_AGENZIA'] * prezzo,
+    }
+    imposte['COSTI_ACQUISTO'] = sum(imposte.values())
+
+    base = rendita * _moltiplicatore_imu(campo('CATEGORIA_CATASTALE'), regole) * rivalutazione
+    base = prezzo if np.isnan(base) else base
+    aliquota = numero('ALIQUOTA_IMU')
+    aliquota = _aliquota_imu(campo('COMUNE'), regole) if np.isnan(aliquota) else aliquota
+    if abitazione_principale:
+        imposte['IMU'] = max(base * imu['ABITAZIONE_PRINCIPALE_LUSSO'] - imu['DETRAZIONE_ABITAZIONE_PRINCIPALE'], 0) if lusso else 0.0
+    else:
+        imposte['IMU'] = base * aliquota
+
+    tariffe = regole['TARI']['TARIFFE']
+    comune = campo('COMUNE')
+    tariffa = tariffe.get(_normalizza(comune))
+    if tariffa is None:
+        warnings.warn("TARI.TARIFFE non ha %s: uso le tariffe DEFAULT" % str(comune).strip())
+        tariffa = tariffe['DEFAULT']
+    componenti = numero('N_COMPONENTI')
+    componenti = int(stima_componenti(numero('LOCALI'))) if np.isnan(componenti) else componenti
+    colonna = int(min(max(componenti, 1), MAX_COMPONENTI)) - 1
+    mq = numero('MQ')
+    mq = 0.0 if np.isnan(mq) else mq
+    imposte['TARI'] = float((_per_componenti(tariffa['QUOTA_FISSA_MQ'])[colonna] * mq + _per_componenti(tariffa['QUOTA_VARIABILE'])[colonna])
+                            * (1 + tariffa.get('TRIBUTO_PROVINCIALE', 0)))
+
+    cedolare = regole['CEDOLARE_SECCA']
+    aliquota = numero('ALIQUOTA_CEDOLARE')
+    if np.isnan(aliquota):
+        aliquota = cedolare['CANONE_CONCORDATO'] if _vero(campo('CANONE_CONCORDATO')) else cedolare['ORDINARIA']
+    imposte['ALIQUOTA_CEDOLARE'] = float(aliquota)
+    imposte['CEDOLARE_SECCA'] = aliquota * numero('AFFITTO_MENSILE') * 12
+    return imposte
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='imposte e costi di acquisto di una tabella di immobili')
+    parser.add_argument('tabella', help='CSV con una riga per immobile')
+    parser.add_argument('--regole', default=FILE_REGOLE)
+    parser.add_argument('--colonna', action='append', default=[], metavar='ORIGINE=CAMPO', help='legge CAMPO dalla colonna ORIGINE')
+    parser.add_argument('--reddito', type=float, action='append', default=[], help='altri redditi del proprietario: confronta cedolare e IRPEF')
+    parser.add_argument('--detrazioni', type=float, default=0, help='detrazioni IRPEF annue del proprietario')
+    parser.add_argument('--regione', help='regione di residenza per le addizionali')
+    parser.add_argument('--comune', help='comune di residenza per le addizionali')
+    parser.add_argument('--out', help='scrive la tabella con le imposte in questo CSV')
+    args = parser.parse_args(argv)
+
+    tabella = pd.read_csv(args.tabella)
+    rinominata = tabella.rename(columns=dict(spec.split('=', 1) for spec in args.colonna))
+    regole = carica_regole(args.regole)
+    if args.reddito:
+        regimi = confronta_regimi(rinominata, args.reddito, regole, args.regione, args.comune, args.detrazioni)
+        risultato = tabella.join(regimi.reset_index(level='REDDITO'))
+    else:
+        risultato = pd.concat([tabella, calcola_imposte(rinominata, regole)], axis=1)
+
+    if args.out:
+        risultato.to_csv(args.out, index=False)
+        print("Output: %s" % args.out)
+    else:
+        risultato.to_string(sys.stdout, index=False)
+        sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
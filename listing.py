@@ -38,7 +38,8 @@ def clean_listing():
         colonne_da_mantenere = [
             'listing_url', 'name', 'neighbourhood_cleansed', 'room_type',
             'accommodates', 'bathrooms_text', 'bedrooms', 'price',
-            'picture_url', 'availability_365', 'review_scores_rating'
+            'picture_url', 'availability_365', 'review_scores_rating',
+            'latitude', 'longitude'
         ]
         
         # Crea nuovo DataFrame con solo le colonne selezionate
@@ -56,7 +57,9 @@ def clean_listing():
             'price': 'Prezzo per Notte',
             'picture_url': 'URL Foto',
             'availability_365': 'Giorni Disponibili Anno',
-            'review_scores_rating': 'Rating'
+            'review_scores_rating': 'Rating',
+            'latitude': 'Latitudine',
+            'longitude': 'Longitudine'
         })
         
         # Filtra solo le zone specificate
@@ -83,7 +86,9 @@ def clean_listing():
             'Prezzo per Notte',
             'Occupancy Rate',
             'Rating',
-            'URL Foto'
+            'URL Foto',
+            'Latitudine',
+            'Longitudine'
         ]
         
         df_clean = df_clean[colonne_ordinate]
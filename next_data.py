@@ -0,0 +1,41 @@
+"""
+Stato JSON delle pagine Next.js (lo script __NEXT_DATA__), letto senza
+parser HTML. Solo libreria standard: lo usano sia l'enricher sia
+altro/immo_scraper.py.
+"""
+import json
+from collections import deque
+
+
+def estrai_next_data(html):
+    """
+    Stato JSON della pagina (lo script __NEXT_DATA__ di Next.js), trovato
+    con una ricerca di stringa; None se manca o non è JSON valido
+    """
+    inizio = html.find('id="__NEXT_DATA__"')
+    if inizio < 0:
+        return None
+    inizio = html.find('>', inizio) + 1
+    fine = html.find('</script>', inizio)
+    if not inizio or fine < 0:
+        return None
+    try:
+        return json.loads(html[inizio:fine])
+    except ValueError:
+        return None
+
+
+def primo_nodo(nodo, condizione):
+    """
+    Primo nodo (in ampiezza) di un JSON che soddisfa ``condizione``, None se nessuno
+    """
+    coda = deque([nodo])
+    while coda:
+        corrente = coda.popleft()
+        if condizione(corrente):
+            return corrente
+        if isinstance(corrente, dict):
+            coda.extend(corrente.values())
+        elif isinstance(corrente, list):
+            coda.extend(corrente)
+    return None
@@ -2,34 +2,51 @@
 """
 This script is running numbers and calculate cash flow stats.
 
+Every section is an instance built from a parsed data dict, so a single
+process can analyse any number of deals:
+
+    deal = Deal.from_yaml('data_file.yml')
+    deal.metrics._CAP_RATE
+
 REF: https://www.biggerpockets.com/renewsblog/2010/06/30/introduction-to-real-estate-analysis-investing/
 """
 from __future__ import division
 import os
 import re
+import importlib
 import sys
 import math
+import numpy as np
 import yaml
 
 
-if len(sys.argv) >= 2:
-    data_file = sys.argv[1]
-else:
-    data_file = 'data_file.yml'
-
 OUTPUT_PREFIX = 'https://raw.githubusercontent.com/xiaotdl/rental_property_deal_analysis/master/'
 OUTPUT_DIR = 'result'
-WRITE_TO_OUTPUT_DIR = False
-if len(sys.argv) >= 3 and sys.argv[2]:
-    WRITE_TO_OUTPUT_DIR = True
 
-DATA = None
-print("input: %s" % OUTPUT_PREFIX+data_file)
-with open(data_file, 'r') as f:
-    try:
-        DATA = yaml.load(f, Loader=yaml.SafeLoader)
-    except yaml.YAMLError as e:
-        print("ERROR: %s" % e)
+# bump when a formula changes so cached batch results are recomputed
+MODEL_VERSION = '1'
+
+# subcommand -> module implementing main(argv)
+MODES = {
+    'simulate': 'rental_analysis_simulation',
+    'schedule': 'rental_analysis_amortization',
+    'project': 'rental_analysis_projection',
+    'maxbid': 'rental_analysis_solver',
+    'batch': 'rental_analysis_batch',
+    'export': 'rental_analysis_export',
+    'variable': 'rental_analysis_variable_rate',
+    'portfolio': 'rental_analysis_portfolio',
+    'acquire': 'rental_analysis_optimizer',
+    'sweep': 'rental_analysis_sweep',
+}
+
+
+def load_data(data_file):
+    with open(data_file, 'r') as f:
+        try:
+            return yaml.load(f, Loader=yaml.SafeLoader)
+        except yaml.YAMLError as e:
+            print("ERROR: %s" % e)
 
 
 def roundup(f):
@@ -38,15 +55,16 @@ def roundup(f):
 def rounddown(f):
     return int(f)
 
-def show(klass, debug=False, stream=sys.stdout):
+def show(section, debug=False, stream=sys.stdout):
+    klass = section if isinstance(section, type) else type(section)
     stream.write("== %s ==\n" % getattr(klass, "_%s__name" % klass.__name__))
     if klass.__dict__.get("_%s__attrs_order" % klass.__name__) and debug == False:
         attrs = getattr(klass, "_%s__attrs_order" % klass.__name__)
     else:
-        attrs = sorted(klass.__dict__.keys())
+        attrs = sorted(section.__dict__.keys())
     for attr in attrs:
         if not attr.startswith('__') and not attr.startswith("_"+klass.__name__):
-            value = getattr(klass, attr)
+            value = getattr(section, attr)
             if not callable(value):
                 if not debug:
                     attr = re.sub(r"^_", "", attr)
@@ -59,6 +77,8 @@ def calculate_monthly_mortgage_payment(loan, years, apr):
     MONS_PER_YR = 12
     c = apr/MONS_PER_YR
     n = MONS_PER_YR * years
+    if c == 0:
+        return roundup(loan / n)
     fixed_monthly_payment = loan * (c * (1 + c)**n) / ((1 + c)**n - 1)
     return roundup(fixed_monthly_payment)
 
@@ -68,9 +88,46 @@ def calculate_mortgage_balance(loan, years, apr, years_elapsed):
     c = apr/MONS_PER_YR
     n = MONS_PER_YR * years
     p = MONS_PER_YR * years_elapsed
+    if c == 0:
+        return roundup(loan * (n - p) / n)
     balance = loan * ((1 + c)**n - (1 + c)**p) / ((1 + c)**n - 1)
     return roundup(balance)
 
+def calculate_monthly_mortgage_payments(loans, years, aprs):
+    """Array version of calculate_monthly_mortgage_payment.
+
+    Arguments are NumPy arrays, pandas Series or scalars that broadcast
+    together; returns an int64 array of payments rounded up like roundup().
+    """
+    MONS_PER_YR = 12
+    loans = np.asarray(loans, dtype=float)
+    c = np.asarray(aprs, dtype=float) / MONS_PER_YR
+    n = MONS_PER_YR * np.asarray(years, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + c)**n
+        fixed_monthly_payment = np.where(
+            c == 0,
+            loans / n,
+            loans * (c * growth) / (growth - 1)
+        )
+    return np.ceil(fixed_monthly_payment).astype(np.int64)
+
+def calculate_mortgage_balances(loans, years, aprs, years_elapsed):
+    """Array version of calculate_mortgage_balance, see calculate_monthly_mortgage_payments"""
+    MONS_PER_YR = 12
+    loans = np.asarray(loans, dtype=float)
+    c = np.asarray(aprs, dtype=float) / MONS_PER_YR
+    n = MONS_PER_YR * np.asarray(years, dtype=float)
+    p = MONS_PER_YR * np.asarray(years_elapsed, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + c)**n
+        balance = np.where(
+            c == 0,
+            loans * (n - p) / n,
+            loans * (growth - (1 + c)**p) / (growth - 1)
+        )
+    return np.ceil(balance).astype(np.int64)
+
 
 class Property(object):
     """Property Details: This is information about the physical design of the property, including number of units, square footage, utility metering design, etc"""
@@ -86,13 +143,14 @@ class Property(object):
         'SQFTS',
     ]
 
-    ADDRESS = DATA["PROPERTY"]["ADDRESS"]
-    LINK = DATA["PROPERTY"]["LINK"]
-    DESCRIPTION = DATA["PROPERTY"]["DESCRIPTION"]
-    BEDROOMS = DATA["PROPERTY"]["BEDROOMS"]
-    BATHROOMS = DATA["PROPERTY"]["BATHROOMS"]
-    UNITS = DATA["PROPERTY"]["UNITS"]
-    SQFTS = DATA["PROPERTY"]["SQFTS"]
+    def __init__(self, data):
+        self.ADDRESS = data["PROPERTY"]["ADDRESS"]
+        self.LINK = data["PROPERTY"]["LINK"]
+        self.DESCRIPTION = data["PROPERTY"]["DESCRIPTION"]
+        self.BEDROOMS = data["PROPERTY"]["BEDROOMS"]
+        self.BATHROOMS = data["PROPERTY"]["BATHROOMS"]
+        self.UNITS = data["PROPERTY"]["UNITS"]
+        self.SQFTS = data["PROPERTY"]["SQFTS"]
 
 
 class Purchase(object):
@@ -109,15 +167,16 @@ class Purchase(object):
         '_TOTAL_COST',
     ]
 
-    PURCHASE_PRICE = DATA["PURCHASE"]["PURCHASE_PRICE"]
-    IMPROVEMENT_COST = DATA["PURCHASE"]["IMPROVEMENT_COST"]
-    CLOSING_COST = DATA["PURCHASE"]["CLOSING_COST"]
-    NOTARY_FEES = DATA["PURCHASE"].get("NOTARY_FEES", 0)
-    AGENCY_FEES = DATA["PURCHASE"].get("AGENCY_FEES", 0)
-    REGISTRATION_TAX = DATA["PURCHASE"]["REGISTRATION_TAX"]
-    PRE_RENT_HOLDING_COST = 0
+    def __init__(self, data):
+        self.PURCHASE_PRICE = data["PURCHASE"]["PURCHASE_PRICE"]
+        self.IMPROVEMENT_COST = data["PURCHASE"]["IMPROVEMENT_COST"]
+        self.CLOSING_COST = data["PURCHASE"]["CLOSING_COST"]
+        self.NOTARY_FEES = data["PURCHASE"].get("NOTARY_FEES", 0)
+        self.AGENCY_FEES = data["PURCHASE"].get("AGENCY_FEES", 0)
+        self.REGISTRATION_TAX = data["PURCHASE"]["REGISTRATION_TAX"]
+        self.PRE_RENT_HOLDING_COST = 0
 
-    _TOTAL_COST = PURCHASE_PRICE + IMPROVEMENT_COST + CLOSING_COST + NOTARY_FEES + AGENCY_FEES + REGISTRATION_TAX + PRE_RENT_HOLDING_COST
+        self._TOTAL_COST = self.PURCHASE_PRICE + self.IMPROVEMENT_COST + self.CLOSING_COST + self.NOTARY_FEES + self.AGENCY_FEES + self.REGISTRATION_TAX + self.PRE_RENT_HOLDING_COST
 
 
 class Financing(object):
@@ -134,23 +193,24 @@ class Financing(object):
         '_TOTAL_CASH_OUTLAY',
     ]
 
-    MORTGAGE_LOAN_DOWNPAY_PERCENTAGE = DATA["FINANCING"]["MORTGAGE_LOAN_DOWNPAY_PERCENTAGE"]
-    _MORTGAGE_LOAN_DOWNPAY_PERCENTAGE_FMT = "%.2f%%" % (MORTGAGE_LOAN_DOWNPAY_PERCENTAGE * 100)
-    _MORTGAGE_LOAN_DOWNPAY_AMOUNT = roundup(Purchase.PURCHASE_PRICE * MORTGAGE_LOAN_DOWNPAY_PERCENTAGE)
-
-    _MORTGAGE_LOAN_AMOUNT = roundup(Purchase.PURCHASE_PRICE * (1 - MORTGAGE_LOAN_DOWNPAY_PERCENTAGE))
-    MORTGAGE_LOAN_YRS = DATA["FINANCING"]["MORTGAGE_LOAN_YRS"]
-    MORTGAGE_LOAN_APR = DATA["FINANCING"]["MORTGAGE_LOAN_APR"]
-    _MORTGAGE_LOAN_APR_FMT = "%.2f%%" % (MORTGAGE_LOAN_APR * 100) 
-    _MONTHLY_MORTGAGE_LOAN_PAYMENT = \
-        calculate_monthly_mortgage_payment(
-            _MORTGAGE_LOAN_AMOUNT,
-            MORTGAGE_LOAN_YRS,
-            MORTGAGE_LOAN_APR
-        )
-    _ANNUAL_MORTGAGE_LOAN_PAYMENT = _MONTHLY_MORTGAGE_LOAN_PAYMENT * 12
+    def __init__(self, data, purchase):
+        self.MORTGAGE_LOAN_DOWNPAY_PERCENTAGE = data["FINANCING"]["MORTGAGE_LOAN_DOWNPAY_PERCENTAGE"]
+        self._MORTGAGE_LOAN_DOWNPAY_PERCENTAGE_FMT = "%.2f%%" % (self.MORTGAGE_LOAN_DOWNPAY_PERCENTAGE * 100)
+        self._MORTGAGE_LOAN_DOWNPAY_AMOUNT = roundup(purchase.PURCHASE_PRICE * self.MORTGAGE_LOAN_DOWNPAY_PERCENTAGE)
+
+        self._MORTGAGE_LOAN_AMOUNT = roundup(purchase.PURCHASE_PRICE * (1 - self.MORTGAGE_LOAN_DOWNPAY_PERCENTAGE))
+        self.MORTGAGE_LOAN_YRS = data["FINANCING"]["MORTGAGE_LOAN_YRS"]
+        self.MORTGAGE_LOAN_APR = data["FINANCING"]["MORTGAGE_LOAN_APR"]
+        self._MORTGAGE_LOAN_APR_FMT = "%.2f%%" % (self.MORTGAGE_LOAN_APR * 100)
+        self._MONTHLY_MORTGAGE_LOAN_PAYMENT = \
+            calculate_monthly_mortgage_payment(
+                self._MORTGAGE_LOAN_AMOUNT,
+                self.MORTGAGE_LOAN_YRS,
+                self.MORTGAGE_LOAN_APR
+            )
+        self._ANNUAL_MORTGAGE_LOAN_PAYMENT = self._MONTHLY_MORTGAGE_LOAN_PAYMENT * 12
 
-    _TOTAL_CASH_OUTLAY = _MORTGAGE_LOAN_DOWNPAY_AMOUNT + Purchase.IMPROVEMENT_COST + Purchase.CLOSING_COST + Purchase.NOTARY_FEES + Purchase.AGENCY_FEES + Purchase.REGISTRATION_TAX
+        self._TOTAL_CASH_OUTLAY = self._MORTGAGE_LOAN_DOWNPAY_AMOUNT + purchase.IMPROVEMENT_COST + purchase.CLOSING_COST + purchase.NOTARY_FEES + purchase.AGENCY_FEES + purchase.REGISTRATION_TAX
 
 
 class Income(object):
@@ -168,17 +228,18 @@ class Income(object):
         '_ANNUAL_GROSS_INCOME',
     ]
 
-    MONTHLY_RENT = DATA["INCOME"]["MONTHLY_RENT"]
-    VACANCY_RATE = DATA["INCOME"]["VACANCY_RATE"]
-    _VACANCY_RATE_FMT = "%.2f%%" % (VACANCY_RATE * 100)
-    _MONTHLY_NET_RENT = roundup(MONTHLY_RENT * (1 - VACANCY_RATE))
-    _ANNUAL_NET_RENT = _MONTHLY_NET_RENT * 12
+    def __init__(self, data):
+        self.MONTHLY_RENT = data["INCOME"]["MONTHLY_RENT"]
+        self.VACANCY_RATE = data["INCOME"]["VACANCY_RATE"]
+        self._VACANCY_RATE_FMT = "%.2f%%" % (self.VACANCY_RATE * 100)
+        self._MONTHLY_NET_RENT = roundup(self.MONTHLY_RENT * (1 - self.VACANCY_RATE))
+        self._ANNUAL_NET_RENT = self._MONTHLY_NET_RENT * 12
 
-    MONTHLY_OTHER_INCOME = DATA["INCOME"]["MONTHLY_OTHER_INCOME"]
-    _ANNUAL_OTHER_INCOME = MONTHLY_OTHER_INCOME * 12
+        self.MONTHLY_OTHER_INCOME = data["INCOME"]["MONTHLY_OTHER_INCOME"]
+        self._ANNUAL_OTHER_INCOME = self.MONTHLY_OTHER_INCOME * 12
 
-    _MONTHLY_GROSS_INCOME = _MONTHLY_NET_RENT + MONTHLY_OTHER_INCOME
-    _ANNUAL_GROSS_INCOME = _MONTHLY_GROSS_INCOME * 12
+        self._MONTHLY_GROSS_INCOME = self._MONTHLY_NET_RENT + self.MONTHLY_OTHER_INCOME
+        self._ANNUAL_GROSS_INCOME = self._MONTHLY_GROSS_INCOME * 12
 
 
 class Expenses(object):
@@ -201,45 +262,46 @@ class Expenses(object):
         '_TOTAL_ANNUAL_EXPENSES',
     ]
 
-    PROPERTY_MANAGEMENT_FEE_RATE = DATA["EXPENSES"]["PROPERTY_MANAGEMENT_FEE_RATE"]
-    _PROPERTY_MANAGEMENT_FEE_RATE_FMT = "%.2f%%" % (PROPERTY_MANAGEMENT_FEE_RATE * 100)
-    _MONTHLY_PROPERTY_MANAGEMENT_FEE = int(math.ceil(PROPERTY_MANAGEMENT_FEE_RATE * Income._MONTHLY_NET_RENT))
-    _ANNUAL_PROPERTY_MANAGEMENT_FEE = _MONTHLY_PROPERTY_MANAGEMENT_FEE * 12
+    def __init__(self, data, purchase, income):
+        self.PROPERTY_MANAGEMENT_FEE_RATE = data["EXPENSES"]["PROPERTY_MANAGEMENT_FEE_RATE"]
+        self._PROPERTY_MANAGEMENT_FEE_RATE_FMT = "%.2f%%" % (self.PROPERTY_MANAGEMENT_FEE_RATE * 100)
+        self._MONTHLY_PROPERTY_MANAGEMENT_FEE = int(math.ceil(self.PROPERTY_MANAGEMENT_FEE_RATE * income._MONTHLY_NET_RENT))
+        self._ANNUAL_PROPERTY_MANAGEMENT_FEE = self._MONTHLY_PROPERTY_MANAGEMENT_FEE * 12
 
-    PROPERTY_TAX_RATE = DATA["EXPENSES"]["PROPERTY_TAX_RATE"]
-    _PROPERTY_TAX_RATE_FMT = "%.2f%%" % (PROPERTY_TAX_RATE * 100)
-    _ANNUAL_PROPERTY_TAX = roundup(PROPERTY_TAX_RATE * Purchase.PURCHASE_PRICE)
-    _MONTHLY_PROPERTY_TAX = roundup(_ANNUAL_PROPERTY_TAX / 12)
+        self.PROPERTY_TAX_RATE = data["EXPENSES"]["PROPERTY_TAX_RATE"]
+        self._PROPERTY_TAX_RATE_FMT = "%.2f%%" % (self.PROPERTY_TAX_RATE * 100)
+        self._ANNUAL_PROPERTY_TAX = roundup(self.PROPERTY_TAX_RATE * purchase.PURCHASE_PRICE)
+        self._MONTHLY_PROPERTY_TAX = roundup(self._ANNUAL_PROPERTY_TAX / 12)
 
-    MONTHLY_INSURANCE = DATA["EXPENSES"]["MONTHLY_INSURANCE"]
-    _ANNUAL_INSURANCE = MONTHLY_INSURANCE * 12
+        self.MONTHLY_INSURANCE = data["EXPENSES"]["MONTHLY_INSURANCE"]
+        self._ANNUAL_INSURANCE = self.MONTHLY_INSURANCE * 12
 
-    MONTHLY_HOA = DATA["EXPENSES"]["MONTHLY_HOA"]
-    _ANNUAL_HOA = MONTHLY_HOA * 12
+        self.MONTHLY_HOA = data["EXPENSES"]["MONTHLY_HOA"]
+        self._ANNUAL_HOA = self.MONTHLY_HOA * 12
 
-    # Maintenance & Repair + Grounds Maintenance + Cleaning + Pest Control
-    MONTHLY_MAINTENANCE = DATA["EXPENSES"]["MONTHLY_MAINTENANCE"]
-    _ANNUAL_MAINTENANCE = MONTHLY_MAINTENANCE * 12
+        # Maintenance & Repair + Grounds Maintenance + Cleaning + Pest Control
+        self.MONTHLY_MAINTENANCE = data["EXPENSES"]["MONTHLY_MAINTENANCE"]
+        self._ANNUAL_MAINTENANCE = self.MONTHLY_MAINTENANCE * 12
 
-    MONTHLY_UTILITIES = DATA["EXPENSES"]["MONTHLY_UTILITIES"]
-    _ANNUAL_UTILITIES = MONTHLY_UTILITIES * 12
+        self.MONTHLY_UTILITIES = data["EXPENSES"]["MONTHLY_UTILITIES"]
+        self._ANNUAL_UTILITIES = self.MONTHLY_UTILITIES * 12
 
-    MONTHLY_ADVERTISING = DATA["EXPENSES"]["MONTHLY_ADVERTISING"]
-    _ANNUAL_ADVERTISING = MONTHLY_ADVERTISING * 12
+        self.MONTHLY_ADVERTISING = data["EXPENSES"]["MONTHLY_ADVERTISING"]
+        self._ANNUAL_ADVERTISING = self.MONTHLY_ADVERTISING * 12
 
-    MONTHLY_LANDSCAPING = DATA["EXPENSES"]["MONTHLY_LANDSCAPING"]
-    _ANNUAL_LANDSCAPING = MONTHLY_LANDSCAPING * 12
+        self.MONTHLY_LANDSCAPING = data["EXPENSES"]["MONTHLY_LANDSCAPING"]
+        self._ANNUAL_LANDSCAPING = self.MONTHLY_LANDSCAPING * 12
 
-    _TOTAL_ANNUAL_EXPENSES = \
-        _ANNUAL_PROPERTY_MANAGEMENT_FEE + \
-        _ANNUAL_PROPERTY_TAX + \
-        _ANNUAL_INSURANCE + \
-        _ANNUAL_HOA + \
-        _ANNUAL_MAINTENANCE + \
-        _ANNUAL_UTILITIES + \
-        _ANNUAL_ADVERTISING + \
-        _ANNUAL_LANDSCAPING
-    _TOTAL_MONTHLY_EXPENSES = roundup(_TOTAL_ANNUAL_EXPENSES / 12)
+        self._TOTAL_ANNUAL_EXPENSES = \
+            self._ANNUAL_PROPERTY_MANAGEMENT_FEE + \
+            self._ANNUAL_PROPERTY_TAX + \
+            self._ANNUAL_INSURANCE + \
+            self._ANNUAL_HOA + \
+            self._ANNUAL_MAINTENANCE + \
+            self._ANNUAL_UTILITIES + \
+            self._ANNUAL_ADVERTISING + \
+            self._ANNUAL_LANDSCAPING
+        self._TOTAL_MONTHLY_EXPENSES = roundup(self._TOTAL_ANNUAL_EXPENSES / 12)
 
 
 class Misc(object):
@@ -251,17 +313,18 @@ class Misc(object):
         '_EQUITY_ACCURAL_AMOUNT',
     ]
 
-    PROPERTY_APPRECIATION_RATE = DATA["MISC"]["PROPERTY_APPRECIATION_RATE"]
-    _PROPERTY_APPRECIATION_RATE_FMT = "%.2f%%" % (PROPERTY_APPRECIATION_RATE * 100)
-    _PROPERTY_APPRECIATION_AMOUNT = roundup(PROPERTY_APPRECIATION_RATE * Purchase._TOTAL_COST)
-    _EQUITY_ACCURAL_AMOUNT = \
-        Financing._MORTGAGE_LOAN_AMOUNT - \
-        calculate_mortgage_balance(
-            Financing._MORTGAGE_LOAN_AMOUNT,
-            Financing.MORTGAGE_LOAN_YRS,
-            Financing.MORTGAGE_LOAN_APR,
-            1
-        )
+    def __init__(self, data, purchase, financing):
+        self.PROPERTY_APPRECIATION_RATE = data["MISC"]["PROPERTY_APPRECIATION_RATE"]
+        self._PROPERTY_APPRECIATION_RATE_FMT = "%.2f%%" % (self.PROPERTY_APPRECIATION_RATE * 100)
+        self._PROPERTY_APPRECIATION_AMOUNT = roundup(self.PROPERTY_APPRECIATION_RATE * purchase._TOTAL_COST)
+        self._EQUITY_ACCURAL_AMOUNT = \
+            financing._MORTGAGE_LOAN_AMOUNT - \
+            calculate_mortgage_balance(
+                financing._MORTGAGE_LOAN_AMOUNT,
+                financing.MORTGAGE_LOAN_YRS,
+                financing.MORTGAGE_LOAN_APR,
+                1
+            )
 
 
 class Metrics(object):
@@ -279,35 +342,36 @@ class Metrics(object):
         '_TOTAL_ROI_FMT',
     ]
 
-    _PRICE_PER_SQFT = roundup(Purchase._TOTAL_COST / Property.SQFTS)
-    _COST_PER_UNIT = roundup(Purchase._TOTAL_COST / Property.UNITS)
+    def __init__(self, property, purchase, financing, income, expenses, misc):
+        self._PRICE_PER_SQFT = roundup(purchase._TOTAL_COST / property.SQFTS)
+        self._COST_PER_UNIT = roundup(purchase._TOTAL_COST / property.UNITS)
 
-    # NOI = INCOME - EXPENSES
-    _NOI = Income._ANNUAL_GROSS_INCOME - Expenses._TOTAL_ANNUAL_EXPENSES
+        # NOI = INCOME - EXPENSES
+        self._NOI = income._ANNUAL_GROSS_INCOME - expenses._TOTAL_ANNUAL_EXPENSES
 
-    # CASH_FLOW = NOI - DEBT
-    _CASH_FLOW = _NOI - Financing._ANNUAL_MORTGAGE_LOAN_PAYMENT
-    _MONTHLY_CASH_FLOW = rounddown(_CASH_FLOW / 12)
+        # CASH_FLOW = NOI - DEBT
+        self._CASH_FLOW = self._NOI - financing._ANNUAL_MORTGAGE_LOAN_PAYMENT
+        self._MONTHLY_CASH_FLOW = rounddown(self._CASH_FLOW / 12)
 
-    # DSCR = NOI / DEBT
-    _DSCR = _NOI / Financing._ANNUAL_MORTGAGE_LOAN_PAYMENT
-    _DSCR_FMT = "%.2f%%" % (_DSCR * 100)
+        # DSCR = NOI / DEBT
+        self._DSCR = self._NOI / financing._ANNUAL_MORTGAGE_LOAN_PAYMENT
+        self._DSCR_FMT = "%.2f%%" % (self._DSCR * 100)
 
-    # ROI = CASH_FLOW / INVESTMENT_BASIS
-    # ----------------------------------
-    # CAP_RATE = NOI / TOTAL_COST
-    # CASH_ROI = CASH_ON_CASH_RETURN = CASH_FLOW / TOTAL_OUT_OF_POCKET
-    # TOTAL_ROI = (CASH_FLOW + PROPERTY_APPRECIATION + EQUITY_ACCURAL + TAX_CONSEQUENCES) / TOTAL_COST
-    _CAP_RATE = _NOI / Purchase._TOTAL_COST # EXPECT: 10%+
-    _CAP_RATE_FMT = "%.2f%%" % (_CAP_RATE * 100)
+        # ROI = CASH_FLOW / INVESTMENT_BASIS
+        # ----------------------------------
+        # CAP_RATE = NOI / TOTAL_COST
+        # CASH_ROI = CASH_ON_CASH_RETURN = CASH_FLOW / TOTAL_OUT_OF_POCKET
+        # TOTAL_ROI = (CASH_FLOW + PROPERTY_APPRECIATION + EQUITY_ACCURAL + TAX_CONSEQUENCES) / TOTAL_COST
+        self._CAP_RATE = self._NOI / purchase._TOTAL_COST # EXPECT: 10%+
+        self._CAP_RATE_FMT = "%.2f%%" % (self._CAP_RATE * 100)
 
-    _CASH_ROI = _CASH_FLOW / Financing._TOTAL_CASH_OUTLAY # EXPECT: 10%+
-    _CASH_ROI_FMT = "%.2f%%" % (_CASH_ROI * 100)
+        self._CASH_ROI = self._CASH_FLOW / financing._TOTAL_CASH_OUTLAY # EXPECT: 10%+
+        self._CASH_ROI_FMT = "%.2f%%" % (self._CASH_ROI * 100)
 
-    TAX_CONSEQUENCES = 0
+        self.TAX_CONSEQUENCES = 0
 
-    _TOTAL_ROI = (_CASH_FLOW + Misc._PROPERTY_APPRECIATION_AMOUNT + Misc._EQUITY_ACCURAL_AMOUNT + TAX_CONSEQUENCES) / Financing._TOTAL_CASH_OUTLAY
-    _TOTAL_ROI_FMT = "%.2f%%" % (_TOTAL_ROI * 100)
+        self._TOTAL_ROI = (self._CASH_FLOW + misc._PROPERTY_APPRECIATION_AMOUNT + misc._EQUITY_ACCURAL_AMOUNT + self.TAX_CONSEQUENCES) / financing._TOTAL_CASH_OUTLAY
+        self._TOTAL_ROI_FMT = "%.2f%%" % (self._TOTAL_ROI * 100)
 
 
 class Summary(object):
@@ -329,47 +393,281 @@ class Summary(object):
         'TOTAL_ROI',
     ]
 
-    RENT_TO_PRICE_RATIO = "%.2f%%" % (Income.MONTHLY_RENT / Purchase.PURCHASE_PRICE * 100)
+    def __init__(self, purchase, financing, income, expenses, metrics):
+        self.RENT_TO_PRICE_RATIO = "%.2f%%" % (income.MONTHLY_RENT / purchase.PURCHASE_PRICE * 100)
+
+        self.PURCHASE_PRICE = purchase.PURCHASE_PRICE
+        self.TOTAL_COST = purchase._TOTAL_COST
+        self.TOTAL_CASH_OUTLAY = financing._TOTAL_CASH_OUTLAY
+
+        self.ANNUAL_GROSS_INCOME = '+%s' % income._ANNUAL_GROSS_INCOME
+        self.ANNUAL_EXPENSES = '-%s' % expenses._TOTAL_ANNUAL_EXPENSES
+        self.NOI = metrics._NOI
+        self.ANNUAL_MORTGAGE_PAYMENT = '-%s' % financing._ANNUAL_MORTGAGE_LOAN_PAYMENT
+        self.ANNUAL_CASH_FLOW = metrics._CASH_FLOW
+
+        self.CAP_RATE = metrics._CAP_RATE_FMT
+
+        self.CASH_ROI = metrics._CASH_ROI_FMT
+
+        self.TOTAL_ROI = metrics._TOTAL_ROI_FMT
+
+
+class Deal(object):
+    """A single deal: every section computed from one parsed data dict"""
+
+    def __init__(self, data):
+        self.data = data
+        self.property = Property(data)
+        self.purchase = Purchase(data)
+        self.financing = Financing(data, self.purchase)
+        self.income = Income(data)
+        self.expenses = Expenses(data, self.purchase, self.income)
+        self.misc = Misc(data, self.purchase, self.financing)
+        self.metrics = Metrics(self.property, self.purchase, self.financing, self.income, self.expenses, self.misc)
+        self.summary = Summary(self.purchase, self.financing, self.income, self.expenses, self.metrics)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data)
+
+    @classmethod
+    def from_yaml(cls, data_file):
+        return cls(load_data(data_file))
+
+    def sections(self):
+        """Sections in report order"""
+        return [
+            self.property,
+            self.purchase,
+            self.income,
+            self.expenses,
+            self.financing,
+            self.misc,
+            self.metrics,
+            self.summary,
+        ]
+
+    def show(self, debug=False, stream=sys.stdout):
+        for section in self.sections():
+            show(section, debug=debug, stream=stream)
+
+
+def flatten_data(data):
+    """Merge the YAML sections into one {FIELD: value} dict of model inputs"""
+    inputs = {}
+    for section in data.values():
+        inputs.update(section)
+    inputs.setdefault("NOTARY_FEES", 0)
+    inputs.setdefault("AGENCY_FEES", 0)
+    return inputs
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def stack_inputs(inputs_list, defaults=None):
+    """Stack the flat inputs of many deals into one dict of 1-D arrays (numeric fields only).
+
+    Every field set by any deal is stacked; deals without it get its value
+    in ``defaults``, or NaN.
+    """
+    defaults = defaults or {}
+    names = []
+    for inputs in inputs_list:
+        names.extend(name for name in inputs if name not in names)
+    stacked = {}
+    for name in names:
+        values = [inputs.get(name, defaults.get(name, np.nan)) for inputs in inputs_list]
+        if all(is_number(v) for v in values):
+            stacked[name] = np.array(values, dtype=float)
+    return stacked
+
+
+def deal_shape(inputs):
+    """Shape the inputs broadcast to: one cell per deal"""
+    return np.broadcast_shapes(*(np.shape(value) for value in inputs.values()))
+
+
+def inputs_from_table(table, data):
+    """One deal per DataFrame row: columns named like an input field override the base deal ``data``"""
+    inputs = flatten_data(data)
+    for name in table.columns:
+        if name in inputs:
+            inputs[name] = table[name].to_numpy(dtype=float)
+    return inputs
+
+
+# Derived fields of the vectorized model: (name, inputs it depends on, formula).
+# Formulas and rounding follow the section classes above; listed in an order
+# where every dependency comes before the fields that use it.
+NODES = [
+    ('ACQUISITION_COSTS', ['IMPROVEMENT_COST', 'CLOSING_COST', 'NOTARY_FEES', 'AGENCY_FEES', 'REGISTRATION_TAX'],
+        lambda improvement, closing, notary, agency, registration: improvement + closing + notary + agency + registration),
+    ('TOTAL_COST', ['PURCHASE_PRICE', 'ACQUISITION_COSTS'],
+        lambda price, acquisition_costs: price + acquisition_costs),
+
+    ('MORTGAGE_LOAN_DOWNPAY_AMOUNT', ['PURCHASE_PRICE', 'MORTGAGE_LOAN_DOWNPAY_PERCENTAGE'],
+        lambda price, downpay_percentage: np.ceil(price * downpay_percentage)),
+    ('MORTGAGE_LOAN_AMOUNT', ['PURCHASE_PRICE', 'MORTGAGE_LOAN_DOWNPAY_PERCENTAGE'],
+        lambda price, downpay_percentage: np.ceil(price * (1 - downpay_percentage))),
+    ('MONTHLY_MORTGAGE_LOAN_PAYMENT', ['MORTGAGE_LOAN_AMOUNT', 'MORTGAGE_LOAN_YRS', 'MORTGAGE_LOAN_APR'],
+        calculate_monthly_mortgage_payments),
+    ('ANNUAL_MORTGAGE_LOAN_PAYMENT', ['MONTHLY_MORTGAGE_LOAN_PAYMENT'],
+        lambda monthly_payment: monthly_payment * 12),
+    ('TOTAL_CASH_OUTLAY', ['MORTGAGE_LOAN_DOWNPAY_AMOUNT', 'ACQUISITION_COSTS'],
+        lambda downpay_amount, acquisition_costs: downpay_amount + acquisition_costs),
+
+    ('MONTHLY_NET_RENT', ['MONTHLY_RENT', 'VACANCY_RATE'],
+        lambda rent, vacancy_rate: np.ceil(rent * (1 - vacancy_rate))),
+    ('ANNUAL_GROSS_INCOME', ['MONTHLY_NET_RENT', 'MONTHLY_OTHER_INCOME'],
+        lambda net_rent, other_income: (net_rent + other_income) * 12),
+
+    ('ANNUAL_PROPERTY_MANAGEMENT_FEE', ['PROPERTY_MANAGEMENT_FEE_RATE', 'MONTHLY_NET_RENT'],
+        lambda fee_rate, net_rent: np.ceil(fee_rate * net_rent) * 12),
+    ('ANNUAL_PROPERTY_TAX', ['PROPERTY_TAX_RATE', 'PURCHASE_PRICE'],
+        lambda tax_rate, price: np.ceil(tax_rate * price)),
+    ('ANNUAL_OTHER_EXPENSES', ['MONTHLY_INSURANCE', 'MONTHLY_HOA', 'MONTHLY_MAINTENANCE', 'MONTHLY_UTILITIES', 'MONTHLY_ADVERTISING', 'MONTHLY_LANDSCAPING'],
+        lambda insurance, hoa, maintenance, utilities, advertising, landscaping:
+            (insurance + hoa + maintenance + utilities + advertising + landscaping) * 12),
+    ('TOTAL_ANNUAL_EXPENSES', ['ANNUAL_PROPERTY_MANAGEMENT_FEE', 'ANNUAL_PROPERTY_TAX', 'ANNUAL_OTHER_EXPENSES'],
+        lambda management_fee, property_tax, other_expenses: management_fee + property_tax + other_expenses),
+
+    ('PROPERTY_APPRECIATION_AMOUNT', ['PROPERTY_APPRECIATION_RATE', 'TOTAL_COST'],
+        lambda appreciation_rate, total_cost: np.ceil(appreciation_rate * total_cost)),
+    ('EQUITY_ACCURAL_AMOUNT', ['MORTGAGE_LOAN_AMOUNT', 'MORTGAGE_LOAN_YRS', 'MORTGAGE_LOAN_APR'],
+        lambda loan, loan_yrs, loan_apr: loan - calculate_mortgage_balances(loan, loan_yrs, loan_apr, 1)),
 
-    PURCHASE_PRICE = Purchase.PURCHASE_PRICE
-    TOTAL_COST = Purchase._TOTAL_COST
-    TOTAL_CASH_OUTLAY = Financing._TOTAL_CASH_OUTLAY
-
-    ANNUAL_GROSS_INCOME = '+%s' % Income._ANNUAL_GROSS_INCOME
-    ANNUAL_EXPENSES = '-%s' % Expenses._TOTAL_ANNUAL_EXPENSES
-    NOI = Metrics._NOI
-    ANNUAL_MORTGAGE_PAYMENT = '-%s' % Financing._ANNUAL_MORTGAGE_LOAN_PAYMENT
-    ANNUAL_CASH_FLOW = Metrics._CASH_FLOW
-
-    CAP_RATE = Metrics._CAP_RATE_FMT
-
-    CASH_ROI = Metrics._CASH_ROI_FMT
+    # NOI = INCOME - EXPENSES
+    ('NOI', ['ANNUAL_GROSS_INCOME', 'TOTAL_ANNUAL_EXPENSES'],
+        lambda income, expenses: income - expenses),
+    # CASH_FLOW = NOI - DEBT
+    ('CASH_FLOW', ['NOI', 'ANNUAL_MORTGAGE_LOAN_PAYMENT'],
+        lambda noi, debt: noi - debt),
+    ('MONTHLY_CASH_FLOW', ['CASH_FLOW'],
+        lambda cash_flow: np.trunc(cash_flow / 12)),
+    ('DSCR', ['NOI', 'ANNUAL_MORTGAGE_LOAN_PAYMENT'],
+        lambda noi, debt: noi / debt),
+    ('CAP_RATE', ['NOI', 'TOTAL_COST'],
+        lambda noi, total_cost: noi / total_cost),
+    ('CASH_ROI', ['CASH_FLOW', 'TOTAL_CASH_OUTLAY'],
+        lambda cash_flow, cash_outlay: cash_flow / cash_outlay),
+    ('TOTAL_ROI', ['CASH_FLOW', 'PROPERTY_APPRECIATION_AMOUNT', 'EQUITY_ACCURAL_AMOUNT', 'TOTAL_CASH_OUTLAY'],
+        lambda cash_flow, appreciation, equity_accural, cash_outlay: (cash_flow + appreciation + equity_accural) / cash_outlay),
+]
+
+NODE_DEPS = dict((name, deps) for name, deps, _ in NODES)
+NODE_FUNCS = dict((name, func) for name, _, func in NODES)
+
+
+def _downstream(nodes):
+    """field -> every derived field that depends on it, directly or not"""
+    downstream = {}
+    # walking backwards, a field's own downstream set is complete before its deps need it
+    for name, deps, _ in reversed(nodes):
+        for dep in deps:
+            downstream.setdefault(dep, set()).update([name], downstream.get(name, ()))
+    return downstream
+
+NODE_DOWNSTREAM = _downstream(NODES)
+
+
+class DealGraph(object):
+    """Lazy evaluation of NODES over array inputs.
+
+    Asking for a field computes and caches only its ancestors; set() changes
+    one input and drops only the cached fields downstream of it, so a
+    what-if on one assumption redoes the affected part of the chain for
+    every deal at once and nothing else.
+    """
+
+    def __init__(self, inputs):
+        self.inputs = dict(inputs)
+        self.values = {}
+
+    def __getitem__(self, name):
+        if name in self.values:
+            return self.values[name]
+        if name not in NODE_FUNCS:
+            return np.asarray(self.inputs[name], dtype=float)
+        args = [self[dep] for dep in NODE_DEPS[name]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = NODE_FUNCS[name](*args)
+        self.values[name] = value
+        return value
+
+    def set(self, name, value, index=None):
+        """Change input ``name``, for every deal or only at ``index``.
+
+        ``name`` can also be a derived field: it then keeps ``value`` until
+        one of the fields it is computed from changes.
+        """
+        if index is not None:
+            # a scalar shared by every deal becomes one value per deal first
+            current = self[name]
+            shape = np.broadcast_shapes(np.shape(current), deal_shape(self.inputs) or (1,))
+            updated = np.array(np.broadcast_to(current, shape), dtype=float)
+            updated[index] = value
+            value = updated
+        for field in NODE_DOWNSTREAM.get(name, ()):
+            self.values.pop(field, None)
+        if name in NODE_FUNCS:
+            self.values[name] = value
+        else:
+            self.inputs[name] = value
+
+    def evaluate(self, names=None):
+        if names is None:
+            names = NODE_FUNCS
+        return dict((name, self[name]) for name in names)
+
+
+def calculate_metrics(inputs):
+    """Vectorized Purchase -> Financing -> Income -> Expenses -> Misc -> Metrics chain.
+
+    ``inputs`` is a flat dict as returned by flatten_data() where any numeric
+    field may be a NumPy array; arrays broadcast together. Rounding follows
+    the section classes, so every cell matches what Deal computes for the
+    same scalar inputs. Returns a dict of arrays with every field in NODES.
+    """
+    return DealGraph(inputs).evaluate()
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    if len(argv) >= 2 and argv[1] in MODES:
+        importlib.import_module(MODES[argv[1]]).main(argv[2:])
+        sys.exit(0)
+
+    if len(argv) >= 2:
+        data_file = argv[1]
+    else:
+        data_file = 'data_file.yml'
 
-    TOTAL_ROI = Metrics._TOTAL_ROI_FMT
+    write_to_output_dir = False
+    if len(argv) >= 3 and argv[2]:
+        write_to_output_dir = True
 
+    print("input: %s" % OUTPUT_PREFIX+data_file)
+    deal = Deal.from_yaml(data_file)
 
-def main():
     stream = sys.stdout
-    if WRITE_TO_OUTPUT_DIR:
+    if write_to_output_dir:
         outfilename = os.path.splitext(os.path.basename(data_file))[0] + '.txt'
         outfile = os.path.join(OUTPUT_DIR, outfilename)
         stream = open(outfile, 'w')
         print("output: %s" % OUTPUT_PREFIX+outfile)
 
-    show(Property, stream=stream)
-    show(Purchase, stream=stream)
-    show(Income, stream=stream)
-    show(Expenses, stream=stream)
-    show(Financing, stream=stream)
-    show(Misc, stream=stream)
-    show(Metrics, stream=stream)
-    show(Summary, stream=stream)
+    deal.show(stream=stream)
 
-    if WRITE_TO_OUTPUT_DIR:
+    if write_to_output_dir:
         stream.close()
 
     sys.exit(0)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
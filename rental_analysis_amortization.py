@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Month-by-month amortization schedules for many loans at once.
+
+Every month of every loan comes from the closed-form balance
+
+    B_k = L * ((1 + c)**n - (1 + c)**k) / ((1 + c)**n - 1)
+
+so a chunk of loans is one (loans x months) NumPy evaluation, not a Python
+loop per month. Chunks are written to the sink as they are produced, which
+keeps memory flat however many loans are in the batch.
+
+usage: rental_analysis.py schedule out.parquet deal.yml [deal.yml ...]
+       rental_analysis.py schedule out.csv --table loans.csv   (columns: id, loan, years, apr)
+"""
+from __future__ import division
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import rental_analysis as ra
+
+
+MONS_PER_YR = 12
+DEFAULT_CHUNK_SIZE = 1000
+SCHEDULE_COLUMNS = ['id', 'month', 'payment', 'interest', 'principal', 'balance', 'cumulative_equity']
+
+
+def schedule_chunk(ids, loans, years, aprs):
+    """Full schedule of a chunk of loans as one long DataFrame"""
+    loans = np.asarray(loans, dtype=float)[:, None]
+    c = np.asarray(aprs, dtype=float)[:, None] / MONS_PER_YR
+    n = (MONS_PER_YR * np.asarray(years)).astype(np.int64)[:, None]
+    k = np.arange(n.max() + 1)[None, :]
+    k = np.minimum(k, n)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + c)**n
+        balance = np.where(
+            c == 0,
+            loans * (n - k) / n,
+            loans * (growth - (1 + c)**k) / (growth - 1)
+        )
+    opening = balance[:, :-1]
+    closing = balance[:, 1:]
+    interest = c * opening
+    principal = opening - closing
+    in_term = np.arange(1, k.shape[1])[None, :] <= n
+
+    rows, cols = np.nonzero(in_term)
+    return pd.DataFrame({
+        'id': np.asarray(ids)[rows],
+        'month': cols + 1,
+        'payment': np.round((interest + principal)[rows, cols], 2),
+        'interest': np.round(interest[rows, cols], 2),
+        'principal': np.round(principal[rows, cols], 2),
+        'balance': np.round(closing[rows, cols], 2),
+        'cumulative_equity': np.round((loans - closing)[rows, cols], 2),
+    }, columns=SCHEDULE_COLUMNS)
+
+
+def iter_schedules(ids, loans, years, aprs, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield schedule DataFrames covering ``chunk_size`` loans each"""
+    ids = np.asarray(ids)
+    loans = np.asarray(loans)
+    years = np.asarray(years)
+    aprs = np.asarray(aprs)
+    for start in range(0, len(ids), chunk_size):
+        end = start + chunk_size
+        yield schedule_chunk(ids[start:end], loans[start:end], years[start:end], aprs[start:end])
+
+
+def write_schedules(outfile, chunks):
+    """Stream schedule chunks to .parquet (one row group per chunk) or .csv; returns rows written"""
+    rows = 0
+    if outfile.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(outfile, table.schema)
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(outfile, 'w', newline='') as f:
+            header = True
+            for chunk in chunks:
+                chunk.to_csv(f, header=header, index=False)
+                header = False
+                rows += len(chunk)
+    return rows
+
+
+def loans_from_deals(data_files):
+    """Loan table (id, loan, years, apr) of the mortgage in every deal file"""
+    records = []
+    for data_file in data_files:
+        inputs = ra.flatten_data(ra.load_data(data_file))
+        metrics = ra.calculate_metrics(inputs)
+        records.append({
+            'id': data_file,
+            'loan': float(metrics['MORTGAGE_LOAN_AMOUNT']),
+            'years': inputs['MORTGAGE_LOAN_YRS'],
+            'apr': inputs['MORTGAGE_LOAN_APR'],
+        })
+    return pd.DataFrame(records, columns=['id', 'loan', 'years', 'apr'])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rental_analysis.py schedule', description='monthly amortization schedules')
+    parser.add_argument('outfile', help='.parquet or .csv')
+    parser.add_argument('data_files', nargs='*')
+    parser.add_argument('--table', help='CSV with id, loan, years, apr columns')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.table:
+        loans = pd.read_csv(args.table)
+    else:
+        loans = loans_from_deals(args.data_files)
+
+    chunks = iter_schedules(loans['id'], loans['loan'], loans['years'], loans['apr'], chunk_size=args.chunk_size)
+    rows = write_schedules(args.outfile, chunks)
+    print("output: %s (%d loans, %d rows)" % (args.outfile, len(loans), rows))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
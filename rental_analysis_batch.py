@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Batch mode: analyse every deal YAML in a directory or glob across a process pool.
+
+Each report is written below OUTPUT_DIR at the deal's path relative to
+--root (the current directory by default) with .txt, so deals/a/x.yml and
+deals/b/x.yml write deals/a/x.txt and deals/b/x.txt whichever patterns
+matched them. A deal is skipped when the sha256 of
+rental_analysis.MODEL_VERSION, its file content and that relative path
+matches the one recorded for its report in the cache index and the report
+still exists, so re-running after editing a few files only recomputes
+those, and moving the whole checkout keeps the cache.
+
+usage: rental_analysis.py batch 'deals/*.yml' [more dirs or globs] [--out-dir result] [--root .] [--workers 8] [--force]
+"""
+from __future__ import division
+import os
+import sys
+import glob
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import rental_analysis as ra
+
+
+CACHE_FILENAME = '.batch_cache.json'
+
+
+def collect_files(patterns):
+    """Deal files matched by directories (every .yml/.yaml inside) or glob patterns"""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.extend(glob.glob(os.path.join(pattern, '*.yml')))
+            files.extend(glob.glob(os.path.join(pattern, '*.yaml')))
+        else:
+            files.extend(glob.glob(pattern))
+    return sorted(set(files))
+
+
+def content_hash(data_file, key):
+    h = hashlib.sha256(ra.MODEL_VERSION.encode('utf-8'))
+    with open(data_file, 'rb') as f:
+        h.update(f.read())
+    h.update(key.encode('utf-8'))
+    return h.hexdigest()
+
+
+def report_key(data_file, root):
+    """Report path of a deal relative to the output directory: its path below ``root`` with .txt"""
+    relative = os.path.relpath(os.path.abspath(data_file), os.path.abspath(root))
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        raise ValueError("deal file outside the batch root %s: %s" % (root, data_file))
+    return os.path.splitext(relative)[0] + '.txt'
+
+
+def load_cache(out_dir):
+    try:
+        with open(os.path.join(out_dir, CACHE_FILENAME), 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_cache(out_dir, cache):
+    path = os.path.join(out_dir, CACHE_FILENAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(cache, f, indent=0, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def analyse(job):
+    """Write the report of one deal; returns (data_file, error or None)"""
+    data_file, outfile = job
+    try:
+        deal = ra.Deal.from_yaml(data_file)
+        with open(outfile, 'w') as stream:
+            deal.show(stream=stream)
+    except Exception as e:
+        return data_file, "%s: %s" % (type(e).__name__, e)
+    return data_file, None
+
+
+def run_batch(patterns, out_dir=ra.OUTPUT_DIR, workers=None, force=False, root=os.curdir):
+    """Analyse every matched deal not already cached; returns (computed, skipped, errors)"""
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    cache = {} if force else load_cache(out_dir)
+
+    hashes = {}
+    jobs = []
+    skipped = 0
+    keys = dict((data_file, report_key(data_file, root)) for data_file in collect_files(patterns))
+    for data_file, key in sorted(keys.items()):
+        outfile = os.path.join(out_dir, key)
+        hashes[key] = content_hash(data_file, key)
+        if cache.get(key) == hashes[key] and os.path.exists(outfile):
+            skipped += 1
+        else:
+            if not os.path.isdir(os.path.dirname(outfile)):
+                os.makedirs(os.path.dirname(outfile))
+            jobs.append((data_file, outfile))
+
+    errors = {}
+    if jobs:
+        if workers == 1:
+            results = [analyse(job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(analyse, jobs, chunksize=max(1, len(jobs) // 256)))
+        for data_file, error in results:
+            key = keys[data_file]
+            if error is None:
+                cache[key] = hashes[key]
+            else:
+                cache.pop(key, None)
+                errors[data_file] = error
+
+    save_cache(out_dir, cache)
+    return len(jobs) - len(errors), skipped, errors
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rental_analysis.py batch', description='analyse a directory of deal YAMLs')
+    parser.add_argument('patterns', nargs='+', help='directories or glob patterns of deal YAMLs')
+    parser.add_argument('--out-dir', default=ra.OUTPUT_DIR)
+    parser.add_argument('--root', default=os.curdir, help='reports keep the deal path relative to this directory')
+    parser.add_argument('--workers', type=int, help='worker processes, default one per CPU')
+    parser.add_argument('--force', action='store_true', help='ignore the cache and recompute everything')
+    args = parser.parse_args(argv)
+
+    computed, skipped, errors = run_batch(args.patterns, args.out_dir, args.workers, args.force, args.root)
+    for data_file, error in sorted(errors.items()):
+        print("ERROR: %s: %s" % (data_file, error))
+    print("output: %s (%d computed, %d cached, %d errors)" % (args.out_dir, computed, skipped, len(errors)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
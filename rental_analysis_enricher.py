@@ -1,9 +1,30 @@
-import requests
-from bs4 import BeautifulSoup
+"""
+Analisi di un immobile: costi, rendita, prezzi di zona e confronto Airbnb.
+
+Importare il modulo non fa richieste di rete: le pagine si scaricano solo
+chiamando scarica_annuncio / get_zone_data o dalla riga di comando.
+
+usage: python rental_analysis_enricher.py                  analisi di analisi_immobili.csv
+       python rental_analysis_enricher.py annuncio [URL]   scarica e stampa i dati di un annuncio
+       python rental_analysis_enricher.py zona URL         scarica la pagina della zona di un annuncio
+       python rental_analysis_enricher.py classifica immobiliare_listings_processed.csv [--out classifica.csv]
+"""
+import sys
+import os
+import json
+import argparse
 import pandas as pd
 import re
 import time
 import traceback
+import unicodedata
+from dataclasses import dataclass
+
+import numpy as np
+
+import imposte_immobili
+from next_data import estrai_next_data, primo_nodo
+from comparabili_airbnb import IndiceGeoAirbnb
 
 
 
@@ -13,7 +34,24 @@ IMMOBILIARE_URL = "https://www.immobiliare.it/annunci/111860595/?entryPoint=map"
 # File paths
 PREZZI_ZONE_FILE = 'prezzi_zone_milano_dettagliato.csv'
 AIRBNB_FILE = 'listing_clean.csv'
+INDICE_AIRBNB_FILE = 'listing_clean_indice.json'
 OUTPUT_FILE = 'analisi_immobili_updated.txt'
+ANALISI_FILE = 'analisi_immobili.csv'
+
+# Stime usate da analizza_immobile e analizza_immobili, in frazione del prezzo
+AFFITTO_MENSILE_SU_PREZZO = 0.004  # 4.8% annuo
+ASSICURAZIONE_SU_PREZZO = 0.001    # 0.1% annuo
+MANUTENZIONE_SU_PREZZO = 0.01      # 1% annuo
+
+# Intestazioni HTTP usate per tutte le richieste
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'it-IT,it;q=0.8,en-US;q=0.5,en;q=0.3',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Cache-Control': 'max-age=0'
+}
 
 # Aggiungi questo dizionario all'inizio del file
 ZONE_MAPPING = {
@@ -47,94 +85,382 @@ ZONE_MAPPING = {
     "udine-lambrate": ["LAMBRATE"]
 }
 
+# Tipi di via riconosciuti all'inizio del nome
+TIPI_VIA = {'via', 'viale', 'piazza', 'piazzale', 'piazzetta', 'corso', 'largo', 'vicolo',
+            'alzaia', 'ripa', 'strada', 'galleria', 'bastioni', 'foro', 'passaggio', 'vico'}
+
+# Abbreviazioni dei tipi di via, senza spazi
+ABBREVIAZIONI_VIE = {
+    'v.le': 'viale', 'vle': 'viale',
+    'p.zza': 'piazza', 'p.za': 'piazza', 'pza': 'piazza', 'p.zzale': 'piazzale', 'p.le': 'piazzale',
+    'c.so': 'corso', 'cso': 'corso',
+    'l.go': 'largo', 'lgo': 'largo',
+    'v.lo': 'vicolo',
+    'v.': 'via',
+}
+ABBREVIAZIONI_VIE_RE = re.compile(r"(?<![a-z0-9])(v\.\s?le|vle|p\.\s?zzale|p\.\s?zza|p\.\s?za|pza|p\.\s?le|c\.\s?so|cso|l\.\s?go|lgo|v\.\s?lo|v\.)(?![a-z0-9])")
+
+# Parole dei titoli degli annunci che non fanno parte dell'indirizzo
+PREFISSI_ANNUNCIO = {'trilocale', 'bilocale', 'quadrilocale', 'monolocale', 'appartamento', 'attico',
+                     'loft', 'mansarda', 'in', 'vendita', 'affitto'}
+
+# Parole che non identificano una via da sole (es. "dei" in "via dei mille")
+PARTICELLE_VIA = {'di', 'de', 'del', 'dei', 'degli', 'della', 'delle', 'dello', 'dal', 'da', 'e', 'ed'}
+
+# Numero civico in fondo all'indirizzo, anche con lettera: "5", "8/a", "12 b"
+CIVICO_RE = re.compile(r"\s\d+\s*/?\s*[a-z]?$")
+
+PUNTEGGIO_MINIMO_VIA = 60.0
+PENALITA_TIPO_VIA = 0.8
+
 # Funzione per estrarre il valore dalle coppie dt/dd
 def get_feature_value(soup, feature_title):
     item = soup.find("dt", string=feature_title)
     return item.find_next("dd").text.strip() if item else "N/A"
 
-# Dizionario con i dati raccolti
-response = requests.get(IMMOBILIARE_URL)
-soup = BeautifulSoup(response.text, 'html.parser')
-
-data = {
-    "ADDRESS": soup.find("h1", class_="re-title__title").text if soup.find("h1") else "",
-    "LINK": IMMOBILIARE_URL,
-    "DESCRIPTION": soup.find("div", class_="in-readAll").get_text(separator=" ", strip=True) if soup.find("div", class_="in-readAll") else "",
-    "TIPOLOGIA": get_feature_value(soup, "Tipologia"),
-    "BEDROOMS": get_feature_value(soup, "Camere da letto"),
-    "BATHROOMS": get_feature_value(soup, "Bagni"),
-    "GARAGE": get_feature_value(soup, "Box, posti auto"),
-    "LOCALi": get_feature_value(soup, "Locali"),
-    "SQFTS": get_feature_value(soup, "Superficie"),
-    "YEAR_BUILT": get_feature_value(soup, "Anno di costruzione"),
-    "ENERGY_CLASS": soup.find("span", {"data-energy-class": True})["data-energy-class"] if soup.find("span", {"data-energy-class": True}) else "N/A",
-    "PURCHASE_PRICE": soup.find("div", class_="re-overview__price").text.strip() if soup.find("div", class_="re-overview__price") else "",
-    "MONTHLY_MAINTENANCE": get_feature_value(soup, "Spese condominio"),
-    "ENERGY_CONSUMPTION": soup.find("p", string=lambda x: x and "kWh/m²" in x).text.split()[0] if soup.find("p", string=lambda x: x and "kWh/m²" in x) else "N/A"
-}
+def scarica_html(url, session=None):
+    """
+    Scarica una pagina e ne restituisce il testo HTML
+    """
+    # importato qui perché serve solo allo scraping
+    import requests
+
+    response = (session or requests).get(url, headers=HEADERS, timeout=10)
+    response.raise_for_status()
+    return response.text
+
+def scarica_pagina(url, session=None):
+    """
+    Scarica una pagina e ne restituisce il BeautifulSoup
+    """
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(scarica_html(url, session), 'html.parser')
+
+def estrai_dati_annuncio(soup, url):
+    """
+    Dizionario con i dati raccolti dalla pagina di un annuncio
+    """
+    return {
+        "ADDRESS": soup.find("h1", class_="re-title__title").text if soup.find("h1") else "",
+        "LINK": url,
+        "DESCRIPTION": soup.find("div", class_="in-readAll").get_text(separator=" ", strip=True) if soup.find("div", class_="in-readAll") else "",
+        "TIPOLOGIA": get_feature_value(soup, "Tipologia"),
+        "BEDROOMS": get_feature_value(soup, "Camere da letto"),
+        "BATHROOMS": get_feature_value(soup, "Bagni"),
+        "GARAGE": get_feature_value(soup, "Box, posti auto"),
+        "LOCALi": get_feature_value(soup, "Locali"),
+        "SQFTS": get_feature_value(soup, "Superficie"),
+        "YEAR_BUILT": get_feature_value(soup, "Anno di costruzione"),
+        "ENERGY_CLASS": soup.find("span", {"data-energy-class": True})["data-energy-class"] if soup.find("span", {"data-energy-class": True}) else "N/A",
+        "PURCHASE_PRICE": soup.find("div", class_="re-overview__price").text.strip() if soup.find("div", class_="re-overview__price") else "",
+        "MONTHLY_MAINTENANCE": get_feature_value(soup, "Spese condominio"),
+        "ENERGY_CONSUMPTION": soup.find("p", string=lambda x: x and "kWh/m²" in x).text.split()[0] if soup.find("p", string=lambda x: x and "kWh/m²" in x) else "N/A"
+    }
+
+def _stringa(el):
+    """
+    Come Tag.string di BeautifulSoup: il testo se l'elemento contiene solo
+    quello, o la stringa del suo unico figlio; None altrimenti
+    """
+    figli = len(el)
+    if not figli:
+        return el.text or ''
+    if figli == 1 and not el.text and not el[0].tail:
+        return _stringa(el[0])
+    return None
+
+def _classi(el):
+    return (el.get('class') or '').split()
+
+def cerca_nodo(nodo, chiavi):
+    """
+    Primo dizionario (in ampiezza) che contiene tutte le ``chiavi``
+    """
+    return primo_nodo(nodo, lambda n: isinstance(n, dict) and all(chiave in n for chiave in chiavi))
+
+def _valore(nodo, *percorsi):
+    """
+    Primo valore non vuoto tra i ``percorsi`` (chiavi separate da punti); dizionari con 'name' o 'value' si aprono
+    """
+    for percorso in percorsi:
+        corrente = nodo
+        for chiave in percorso.split('.'):
+            corrente = corrente.get(chiave) if isinstance(corrente, dict) else None
+        if isinstance(corrente, dict):
+            corrente = corrente.get('name', corrente.get('value'))
+        if corrente not in (None, '', [], {}):
+            return corrente
+    return None
+
+def dati_da_next_data(stato, url):
+    """
+    Lo stesso dizionario di estrai_dati_annuncio, dall'oggetto realEstate
+    dello stato JSON; None se manca il prezzo, così si ripiega sul DOM
+    """
+    immobile = cerca_nodo(stato, ('price', 'properties'))
+    if immobile is None:
+        return None
+    prezzo = _valore(immobile, 'price.formattedValue')
+    if prezzo is None:
+        return None
+    proprieta = immobile['properties'][0] if isinstance(immobile['properties'], list) and immobile['properties'] else {}
+
+    # caratteristiche con etichetta, le stesse dei dt/dd della pagina
+    etichette = {}
+    coda = [proprieta]
+    while coda:
+        corrente = coda.pop()
+        if isinstance(corrente, dict):
+            etichetta = corrente.get('label', corrente.get('title'))
+            if isinstance(etichetta, str) and isinstance(corrente.get('value'), (str, int, float)):
+                etichette.setdefault(etichetta, str(corrente['value']).strip())
+            coda.extend(corrente.values())
+        elif isinstance(corrente, list):
+            coda.extend(corrente)
+
+    def caratteristica(titolo_caratteristica, *percorsi):
+        valore = _valore(proprieta, *percorsi) if percorsi else None
+        if valore is None:
+            valore = etichette.get(titolo_caratteristica)
+        return str(valore).strip() if valore is not None else "N/A"
+
+    superficie = caratteristica("Superficie", 'surface')
+    if superficie != "N/A" and "m²" not in superficie:
+        superficie = f"{superficie} m²"
+    consumo = caratteristica("", 'energy.epi', 'energy.consumption')
+    descrizione = _valore(proprieta, 'description') or _valore(immobile, 'description') or ""
+    return {
+        "ADDRESS": str(_valore(immobile, 'title') or ""),
+        "LINK": url,
+        "DESCRIPTION": ' '.join(str(descrizione).split()),
+        "TIPOLOGIA": caratteristica("Tipologia", 'typologyGA4Translation', 'typology'),
+        "BEDROOMS": caratteristica("Camere da letto", 'bedRoomsNumber'),
+        "BATHROOMS": caratteristica("Bagni", 'bathrooms'),
+        "GARAGE": caratteristica("Box, posti auto", 'ga4Garage', 'garage'),
+        "LOCALi": caratteristica("Locali", 'rooms'),
+        "SQFTS": superficie,
+        "YEAR_BUILT": caratteristica("Anno di costruzione", 'buildYear'),
+        "ENERGY_CLASS": caratteristica("", 'energy.class', 'energy.energyClass'),
+        "PURCHASE_PRICE": str(prezzo).strip(),
+        "MONTHLY_MAINTENANCE": caratteristica("Spese condominio", 'costs.condominiumExpenses', 'condominiumExpenses'),
+        "ENERGY_CONSUMPTION": consumo.split()[0] if consumo != "N/A" else "N/A"
+    }
+
+def estrai_dati_html(html, url):
+    """
+    Come estrai_dati_annuncio, ma senza BeautifulSoup. Se la pagina ha lo
+    stato JSON di Next.js i dati vengono da lì; altrimenti una sola passata
+    sull'HTML con lxml: le coppie dt/dd finiscono in un dizionario mentre si
+    raccolgono titolo, prezzo, classe energetica e descrizione. Senza lxml,
+    o se lxml non riesce a leggere la pagina, usa BeautifulSoup.
+    """
+    stato = estrai_next_data(html)
+    if stato is not None:
+        dati = dati_da_next_data(stato, url)
+        if dati is not None:
+            return dati
+
+    def con_beautifulsoup():
+        from bs4 import BeautifulSoup
+        return estrai_dati_annuncio(BeautifulSoup(html, 'html.parser'), url)
+
+    try:
+        import lxml.etree
+        import lxml.html
+    except ImportError:
+        return con_beautifulsoup()
+    if not html.strip():
+        return con_beautifulsoup()
+    try:
+        # in byte, perché lxml rifiuta le stringhe con la dichiarazione <?xml encoding=...?>
+        radice = lxml.html.fromstring(html.encode('utf-8'), parser=lxml.html.HTMLParser(encoding='utf-8'))
+    except (lxml.etree.ParserError, ValueError):
+        return con_beautifulsoup()
+    titolo = descrizione = prezzo = classe = consumo = None
+    c_e_h1 = False
+    caratteristiche = {}
+    in_attesa = []
+    for el in radice.iter('h1', 'div', 'span', 'p', 'dt', 'dd'):
+        tag = el.tag
+        if tag == 'dt':
+            etichetta = _stringa(el)
+            if etichetta is not None and etichetta not in caratteristiche:
+                in_attesa.append(etichetta)
+        elif tag == 'dd':
+            # ogni dt prende il primo dd che lo segue, come find_next("dd")
+            for etichetta in in_attesa:
+                caratteristiche.setdefault(etichetta, el.text_content().strip())
+            in_attesa = []
+        elif tag == 'h1':
+            c_e_h1 = True
+            if titolo is None and 're-title__title' in _classi(el):
+                titolo = el.text_content()
+        elif tag == 'div':
+            classi = _classi(el)
+            if descrizione is None and 'in-readAll' in classi:
+                descrizione = ' '.join(t.strip() for t in el.itertext() if t.strip())
+            elif prezzo is None and 're-overview__price' in classi:
+                prezzo = el.text_content().strip()
+        elif tag == 'span':
+            if classe is None and el.get('data-energy-class') is not None:
+                classe = el.get('data-energy-class')
+        elif consumo is None:
+            testo = _stringa(el)
+            if testo and "kWh/m²" in testo:
+                consumo = testo.split()[0]
+
+    def caratteristica(titolo_caratteristica):
+        return caratteristiche.get(titolo_caratteristica, "N/A")
+
+    return {
+        "ADDRESS": (titolo or "") if c_e_h1 else "",
+        "LINK": url,
+        "DESCRIPTION": descrizione or "",
+        "TIPOLOGIA": caratteristica("Tipologia"),
+        "BEDROOMS": caratteristica("Camere da letto"),
+        "BATHROOMS": caratteristica("Bagni"),
+        "GARAGE": caratteristica("Box, posti auto"),
+        "LOCALi": caratteristica("Locali"),
+        "SQFTS": caratteristica("Superficie"),
+        "YEAR_BUILT": caratteristica("Anno di costruzione"),
+        "ENERGY_CLASS": classe if classe is not None else "N/A",
+        "PURCHASE_PRICE": prezzo or "",
+        "MONTHLY_MAINTENANCE": caratteristica("Spese condominio"),
+        "ENERGY_CONSUMPTION": consumo or "N/A"
+    }
+
+def scarica_annuncio(url=IMMOBILIARE_URL, session=None):
+    """
+    Scarica un annuncio e ne restituisce i dati
+    """
+    return estrai_dati_html(scarica_html(url, session), url)
+
+def converti_importo(valore):
+    """
+    Importo in euro da "€ 450.000", "€ 1.250,50/mese", "da € 300.000" o da un numero; 0 se manca
+    """
+    if isinstance(valore, (int, float)):
+        return 0.0 if valore != valore else float(valore)
+    numero = re.search(r"\d[\d.]*(?:,\d+)?", str(valore or ""))
+    if not numero:
+        return 0.0
+    return float(numero.group().replace(".", "").replace(",", "."))
+
+def converti_mq(valore):
+    """
+    Metri quadri da "80 m²", "80,5 m²" o da un numero; 0 se manca
+    """
+    if isinstance(valore, (int, float)):
+        return 0.0 if valore != valore else float(valore)
+    numero = re.search(r"\d+(?:[.,]\d+)?", str(valore or ""))
+    return float(numero.group().replace(",", ".")) if numero else 0.0
+
+def converti_intero(valore):
+    """
+    Primo intero di "3", "5+", "2 (di cui 1 in box)" o di un numero; None se manca
+    """
+    if isinstance(valore, (int, float)):
+        return None if valore != valore else int(valore)
+    numero = re.search(r"\d+", str(valore or ""))
+    return int(numero.group()) if numero else None
 
-# Creazione della tabella pandas
-df = pd.DataFrame([data])
+@dataclass(slots=True)
+class Listing:
+    """
+    Un annuncio con i campi già convertiti, una volta sola, dalle stringhe
+    dello scraping. Con __slots__ occupa poco anche a centinaia di migliaia.
+    Gli importi sono in euro (spese_condominio al mese), i campi numerici
+    mancanti sono 0 (prezzo, mq, spese) o None (conteggi).
+    """
+    indirizzo: str
+    link: str
+    descrizione: str
+    tipologia: str
+    prezzo: float
+    mq: float
+    locali: int | None
+    camere: int | None
+    bagni: int | None
+    garage: str
+    anno_costruzione: str
+    classe_energetica: str
+    spese_condominio: float
+    consumo_energetico: float | None
+    categoria_catastale: str | None = None
+    rendita_catastale: float | None = None
+
+    @classmethod
+    def da_dati(cls, data):
+        """Dal dizionario di estrai_dati_annuncio, o da una riga di analisi_immobili.csv"""
+        def campo(*chiavi, default="N/A"):
+            for chiave in chiavi:
+                valore = data.get(chiave)
+                if valore is not None and valore == valore:
+                    return valore
+            return default
 
-# Stampa la tabella
-print(df)
+        consumo = campo("ENERGY_CONSUMPTION")
+        rendita = campo("CADASTRAL_INCOME", default=None)
+        categoria = campo("CADASTRAL_CATEGORY", default=None)
+        return cls(
+            indirizzo=str(campo("ADDRESS", default="")),
+            link=str(campo("LINK", default="")),
+            descrizione=str(campo("DESCRIPTION", default="")),
+            tipologia=str(campo("TIPOLOGIA")),
+            prezzo=converti_importo(campo("PURCHASE_PRICE", default=0)),
+            mq=converti_mq(campo("SQFTS", "MQ", default=0)),
+            locali=converti_intero(campo("LOCALi", "LOCALI", default=None)),
+            camere=converti_intero(campo("BEDROOMS", default=None)),
+            bagni=converti_intero(campo("BATHROOMS", default=None)),
+            garage=str(campo("GARAGE")),
+            anno_costruzione=str(campo("YEAR_BUILT")),
+            classe_energetica=str(campo("ENERGY_CLASS")),
+            spese_condominio=converti_importo(campo("MONTHLY_MAINTENANCE", default=0)),
+            consumo_energetico=converti_mq(consumo) if consumo != "N/A" else None,
+            categoria_catastale=str(categoria) if categoria is not None else None,
+            rendita_catastale=converti_importo(rendita) if rendita is not None else None,
+        )
+
+    @property
+    def prezzo_mq(self):
+        return self.prezzo / self.mq if self.mq > 0 else 0
 
 def stima_componenti_da_locali(n_locali):
     """
-    Stima il numero di componenti basandosi sul numero di locali
+    Stima il numero di componenti basandosi sul numero di locali:
+    1 fino al bilocale, 2 per il trilocale, 3 per il quadrilocale, poi 4
     
     Args:
-        n_locali (int): Numero di locali dell'immobile
+        n_locali (int o array): Numero di locali dell'immobile
     
     Returns:
-        int: Numero stimato di componenti
+        int o array: Numero stimato di componenti
     """
-    if n_locali <= 2:  # Monolocale o bilocale
-        return 1
-    elif n_locali == 3:  # Trilocale
-        return 2
-    elif n_locali == 4:  # Quadrilocale
-        return 3
-    else:  # 5 o più locali
-        return 4
+    componenti = imposte_immobili.stima_componenti(n_locali)
+    return componenti if componenti.ndim else int(componenti)
 
-def calcola_tari(mq, n_componenti=1, tariffa_fissa=1.10, quota_provinciale=0.05):
+def calcola_tari(mq, n_componenti=1, comune=None, regole=None):
     """
-    Calcola la TARI annuale basata sui parametri forniti
+    Calcola la TARI annuale con le tariffe del comune in regole_fiscali.yml
     
     Args:
-        mq (float): Metri quadri dell'immobile
-        n_componenti (int): Numero di componenti del nucleo familiare
-        tariffa_fissa (float): Tariffa al mq (varia per comune)
-        quota_provinciale (float): Percentuale della quota provinciale
+        mq (float o array): Metri quadri dell'immobile
+        n_componenti (int o array): Numero di componenti del nucleo familiare
+        comune (str o array): Comune dell'immobile (DEFAULT se manca)
+        regole (dict): regole fiscali già caricate
     
     Returns:
-        float: Importo annuale TARI
-    """
-    # Tabella esempio delle tariffe variabili per numero componenti
-    tariffe_variabili = {
-        1: 90.00,    # single
-        2: 130.00,   # coppia
-        3: 163.27,   # famiglia di tre
-        4: 190.00,   # famiglia di quattro
-        5: 210.00,   # famiglia di cinque
-        6: 230.00    # famiglia di sei o più
-    }
-    
-    # Calcolo parte fissa
-    parte_fissa = tariffa_fissa * mq
-    
-    # Calcolo parte variabile
-    parte_variabile = tariffe_variabili.get(n_componenti, tariffe_variabili[1])
-    
-    # Calcolo quota provinciale
-    imponibile = parte_fissa + parte_variabile
-    quota_prov = imponibile * quota_provinciale
-    
-    # Totale TARI
-    totale = parte_fissa + parte_variabile + quota_prov
-    
-    return totale
+        float o array: Importo annuale TARI, con la forma degli argomenti
+    """
+    mq, n_componenti, comune = np.broadcast_arrays(mq, n_componenti, np.asarray(comune, dtype=object))
+    tabella = pd.DataFrame({
+        "MQ": mq.ravel(),
+        "N_COMPONENTI": n_componenti.ravel(),
+        "COMUNE": comune.ravel(),
+    })
+    tari = imposte_immobili.calcola_tari(tabella, regole).to_numpy().reshape(mq.shape)
+    return tari if tari.ndim else float(tari)
 
 def get_market_data_url(soup):
     """Estrae l'URL della pagina con i dati di mercato della zona"""
@@ -179,11 +505,110 @@ def get_airbnb_zone(zona_immobiliare):
     """
     return ZONE_MAPPING.get(zona_immobiliare.lower(), [])
 
-def analizza_airbnb_data(zona_immobiliare: str, num_locali: int, num_bagni: int, num_camere: int, df_airbnb: pd.DataFrame):
+class IndiceAirbnb:
+    """
+    Comparabili Airbnb precalcolati per (zona immobiliare, locali, bagni).
+
+    Locali e Bagni si convertono una sola volta; per ogni chiave si tengono
+    il prezzo medio per notte, il numero di annunci e i ``k`` annunci con
+    il prezzo più vicino alla media, così ogni ricerca è un accesso a
+    dizionario. L'indice si salva e si ricarica in JSON.
+    """
+
+    def __init__(self, gruppi=None, annunci_zona=None, k=5):
+        self.gruppi = gruppi or {}
+        self.annunci_zona = annunci_zona or {}
+        self.k = k
+
+    @staticmethod
+    def chiave(zona_immobiliare, num_locali, num_bagni):
+        return (zona_immobiliare.lower(), float(num_locali), float(num_bagni))
+
+    @classmethod
+    def da_dataframe(cls, df_airbnb, k=5):
+        """Costruisce l'indice da listing_clean.csv"""
+        if df_airbnb.empty:
+            return cls(k=k)
+        zone = pd.DataFrame([(zona, zona_airbnb) for zona, zone_airbnb in ZONE_MAPPING.items() for zona_airbnb in zone_airbnb],
+                            columns=['Zona_Immobiliare', 'Zona'])
+        annunci_zona = df_airbnb['Zona'].value_counts()
+        df = df_airbnb.assign(
+            Locali=pd.to_numeric(df_airbnb['Locali'], errors='coerce').fillna(0),
+            Bagni=df_airbnb['Bagni'].str.extract(r'(\d+)', expand=False).astype(float).fillna(0),
+            Ordine=range(len(df_airbnb)))
+        df = df.merge(zone, on='Zona')
+        gruppo = ['Zona_Immobiliare', 'Locali', 'Bagni']
+
+        medie = df.groupby(gruppo)['Prezzo per Notte'].agg(['mean', 'size'])
+        df = df.join(medie['mean'].rename('Prezzo_Medio'), on=gruppo)
+        df['Differenza_Prezzo'] = (df['Prezzo per Notte'] - df['Prezzo_Medio']).abs()
+        # a parità di differenza vince l'annuncio che compare prima, come in nsmallest
+        vicini = df.dropna(subset=['Differenza_Prezzo']).sort_values(gruppo + ['Differenza_Prezzo', 'Ordine']).groupby(gruppo).head(k)
+
+        gruppi = {}
+        for (zona, locali, bagni), (media, numero) in medie.iterrows():
+            gruppi[(zona, locali, bagni)] = {'prezzo_medio': media, 'numero': int(numero), 'simili': []}
+        for row in vicini.to_dict('records'):
+            gruppi[(row['Zona_Immobiliare'], row['Locali'], row['Bagni'])]['simili'].append({
+                'Nome': row['Nome Annuncio'],
+                'Prezzo per Notte': f"€ {row['Prezzo per Notte']:.2f}",
+                'Occupancy Rate': f"{row['Occupancy Rate']:.1f}%",
+                'Rating': row.get('Rating', 'N/A'),
+                'Link': row['Link Airbnb']
+            })
+        return cls(gruppi, dict((zona, int(numero)) for zona, numero in annunci_zona.items()), k)
+
+    def cerca(self, zona_immobiliare, num_locali, num_bagni):
+        """Comparabili di una chiave, None se non ce ne sono"""
+        return self.gruppi.get(self.chiave(zona_immobiliare, num_locali, num_bagni))
+
+    def annunci_nelle_zone(self, zone_airbnb):
+        return sum(self.annunci_zona.get(zona, 0) for zona in zone_airbnb)
+
+    def salva(self, file_indice):
+        with open(file_indice, 'w', encoding='utf-8') as f:
+            json.dump({
+                'k': self.k,
+                'annunci_zona': self.annunci_zona,
+                'gruppi': [list(chiave) + [valore] for chiave, valore in self.gruppi.items()],
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def carica(cls, file_indice):
+        with open(file_indice, encoding='utf-8') as f:
+            dati = json.load(f)
+        gruppi = dict(((zona, locali, bagni), valore) for zona, locali, bagni, valore in dati['gruppi'])
+        return cls(gruppi, dati['annunci_zona'], dati['k'])
+
+def carica_indice_airbnb(file_airbnb=AIRBNB_FILE, file_indice=INDICE_AIRBNB_FILE):
+    """
+    Indice dei comparabili Airbnb, ricostruito solo se il CSV è più recente del file salvato
+    """
+    if os.path.exists(file_indice) and os.path.getmtime(file_indice) >= os.path.getmtime(file_airbnb):
+        return IndiceAirbnb.carica(file_indice)
+    indice = IndiceAirbnb.da_dataframe(pd.read_csv(file_airbnb))
+    indice.salva(file_indice)
+    return indice
+
+def analizza_airbnb_data(zona_immobiliare: str, num_locali: int, num_bagni: int, num_camere: int, df_airbnb,
+                         coordinate=None, indice_geo=None):
     """
     Analizza i dati Airbnb per una specifica zona e caratteristiche dell'immobile
+
+    ``df_airbnb`` è un IndiceAirbnb oppure il DataFrame di listing_clean.csv,
+    da cui l'indice viene costruito a ogni chiamata: per molti immobili
+    conviene costruirlo una volta sola. Con ``coordinate`` (lat, lon) e un
+    comparabili_airbnb.IndiceGeoAirbnb i comparabili sono invece gli annunci
+    più vicini con locali simili, pesati per distanza; se entro il raggio
+    non ce ne sono si torna ai comparabili della zona.
     """
     try:
+        if coordinate is not None and indice_geo is not None and len(indice_geo):
+            vicini = analizza_airbnb_vicini(coordinate, num_locali, indice_geo)
+            if vicini is not None:
+                return vicini
+            print("Nessun annuncio vicino, uso i comparabili della zona")
+
         if not zona_immobiliare:
             print("Zona immobiliare non specificata")
             return {
@@ -192,62 +617,37 @@ def analizza_airbnb_data(zona_immobiliare: str, num_locali: int, num_bagni: int,
                 'Appartamenti_Simili': []
             }
 
+        indice = df_airbnb if isinstance(df_airbnb, IndiceAirbnb) else IndiceAirbnb.da_dataframe(df_airbnb)
+
         # Ottieni le zone Airbnb corrispondenti
         zone_airbnb = get_airbnb_zone(zona_immobiliare)
         print(f"Cerco immobili nelle zone Airbnb: {zone_airbnb}")
+        print(f"Trovati {indice.annunci_nelle_zone(zone_airbnb)} immobili nella zona")
         
-        # Filtra il DataFrame per le zone di interesse
-        df_zona = df_airbnb[df_airbnb['Zona'].isin(zone_airbnb)].copy()
-        print(f"Trovati {len(df_zona)} immobili nella zona")
-        
-        # Converti e pulisci i dati
-        df_zona['Locali'] = pd.to_numeric(df_zona['Locali'], errors='coerce')
-        df_zona['Bagni'] = df_zona['Bagni'].str.extract(r'(\d+)').astype(float)
+        # Comparabili con gli stessi locali e bagni
+        simili = indice.cerca(zona_immobiliare, num_locali, num_bagni)
+        print(f"Trovati {simili['numero'] if simili else 0} immobili con caratteristiche simili")
         
-        # Applica i filtri per caratteristiche simili
-        df_filtered = df_zona[
-            (df_zona['Locali'].fillna(0) == float(num_locali)) &
-            (df_zona['Bagni'].fillna(0) == float(num_bagni))
-        ]
-        print(f"Trovati {len(df_filtered)} immobili con caratteristiche simili")
-        
-        if len(df_filtered) == 0:
+        if not simili:
             return {
                 'Rendita_Annua_Airbnb': 0,
                 'Numero_Annunci_Airbnb_Simili': 0,
                 'Appartamenti_Simili': []
             }
         
-        # Calcola il prezzo medio per notte degli immobili filtrati
-        prezzo_medio_notte = df_filtered['Prezzo per Notte'].mean()
+        prezzo_medio_notte = simili['prezzo_medio']
         print(f"Prezzo medio per notte: €{prezzo_medio_notte:.2f}")
         
-        # Trova i 5 appartamenti con il prezzo più simile alla media
-        df_filtered['Differenza_Prezzo'] = abs(df_filtered['Prezzo per Notte'] - prezzo_medio_notte)
-        top_5 = df_filtered.nsmallest(5, 'Differenza_Prezzo')
-        
         # Calcola la rendita annua con occupancy del 70%
         occupancy_rate = 0.70  # 70% di occupazione
         rendita_annua = prezzo_medio_notte * 365 * occupancy_rate
         
-        # Prepara la lista degli appartamenti simili
-        appartamenti_simili = []
-        for _, row in top_5.iterrows():
-            appartamento = {
-                'Nome': row['Nome Annuncio'],
-                'Prezzo per Notte': f"€ {row['Prezzo per Notte']:.2f}",
-                'Occupancy Rate': f"{row['Occupancy Rate']:.1f}%",
-                'Rating': row.get('Rating', 'N/A'),
-                'Link': row['Link Airbnb']
-            }
-            appartamenti_simili.append(appartamento)
-        
         print(f"Rendita annua Airbnb stimata: €{rendita_annua:.2f}")
         
         return {
             'Rendita_Annua_Airbnb': rendita_annua,
-            'Numero_Annunci_Airbnb_Simili': len(df_filtered),
-            'Appartamenti_Simili': appartamenti_simili
+            'Numero_Annunci_Airbnb_Simili': simili['numero'],
+            'Appartamenti_Simili': [dict(appartamento) for appartamento in simili['simili']]
         }
         
     except Exception as e:
@@ -255,43 +655,77 @@ def analizza_airbnb_data(zona_immobiliare: str, num_locali: int, num_bagni: int,
         traceback.print_exc()
         return None
 
+def analizza_airbnb_vicini(coordinate, num_locali, indice_geo):
+    """
+    Rendita Airbnb dagli annunci più vicini all'immobile, nello stesso formato
+    di analizza_airbnb_data; None se entro il raggio non ce ne sono
+    """
+    lat, lon = coordinate
+    indici, distanze = indice_geo.vicini([lat], [lon], [num_locali])
+    stima = indice_geo.stima_da_vicini(indici, distanze).iloc[0]
+    if not stima['NUMERO_COMPARABILI']:
+        return None
+    print(f"Trovati {int(stima['NUMERO_COMPARABILI'])} immobili vicini con caratteristiche simili "
+          f"(distanza media {stima['DISTANZA_MEDIA_KM']:.2f} km)")
+    print(f"Prezzo medio per notte: €{stima['PREZZO_NOTTE']:.2f}")
+    print(f"Rendita annua Airbnb stimata: €{stima['RENDITA_ANNUA']:.2f}")
+
+    appartamenti_simili = []
+    for indice, distanza in zip(indici[0], distanze[0]):
+        if indice < 0:
+            break
+        row = indice_geo.df.iloc[indice]
+        appartamenti_simili.append({
+            'Nome': row['Nome Annuncio'],
+            'Prezzo per Notte': f"€ {row['Prezzo per Notte']:.2f}",
+            'Occupancy Rate': f"{row['Occupancy Rate']:.1f}%",
+            'Rating': row.get('Rating', 'N/A'),
+            'Link': row['Link Airbnb'],
+            'Distanza': f"{distanza:.2f} km"
+        })
+    return {
+        'Rendita_Annua_Airbnb': stima['RENDITA_ANNUA'],
+        'Numero_Annunci_Airbnb_Simili': int(stima['NUMERO_COMPARABILI']),
+        'Appartamenti_Simili': appartamenti_simili
+    }
+
 def analizza_immobile(data):
-    """Analizza un singolo immobile partendo dal dizionario esistente"""
+    """Analizza un singolo immobile, da un Listing o dal dizionario di estrai_dati_annuncio"""
     global DATI
     
-    def clean_price(price_str):
-        if not price_str or price_str == "N/A":
-            return 0
-        return float(price_str.replace("€ ", "").replace(".", "").replace("/mese", ""))
-    
-    def clean_sqm(sqm_str):
-        if not sqm_str or sqm_str == "N/A":
-            return 0
-        return float(sqm_str.replace(" m²", ""))
-    
-    mq = clean_sqm(data["SQFTS"])
-    n_locali = int(data["LOCALi"]) if data["LOCALi"] != "N/A" else 1
+    annuncio = data if isinstance(data, Listing) else Listing.da_dati(data)
+    mq = annuncio.mq
+    n_locali = annuncio.locali if annuncio.locali is not None else 1
     n_componenti = stima_componenti_da_locali(n_locali)
     
+    # Seconda casa da privato a Milano, salvo diverse indicazioni nell'annuncio
+    imposte = imposte_immobili.calcola_imposte_immobile({
+        "PREZZO": annuncio.prezzo,
+        "CATEGORIA_CATASTALE": annuncio.categoria_catastale,
+        "RENDITA_CATASTALE": annuncio.rendita_catastale,
+        "MQ": mq,
+        "N_COMPONENTI": n_componenti,
+    })
+    
     DATI = {
         "PROPERTY": {
-            "ADDRESS": data["ADDRESS"],
-            "LINK": data["LINK"],
-            "DESCRIPTION": data["DESCRIPTION"],
-            "TIPOLOGIA": data["TIPOLOGIA"],
-            "LOCALI": int(data["LOCALi"]) if data["LOCALi"] != "N/A" else 1,
-            "MQ": clean_sqm(data["SQFTS"]),
-            "ANNO_COSTRUZIONE": data["YEAR_BUILT"],
-            "CLASSE_ENERGETICA": data["ENERGY_CLASS"],
-            "GARAGE": data["GARAGE"]
+            "ADDRESS": annuncio.indirizzo,
+            "LINK": annuncio.link,
+            "DESCRIPTION": annuncio.descrizione,
+            "TIPOLOGIA": annuncio.tipologia,
+            "LOCALI": n_locali,
+            "MQ": mq,
+            "ANNO_COSTRUZIONE": annuncio.anno_costruzione,
+            "CLASSE_ENERGETICA": annuncio.classe_energetica,
+            "GARAGE": annuncio.garage
         },
         "ACQUISTO": {
-            "PREZZO_ACQUISTO": clean_price(data["PURCHASE_PRICE"]),
+            "PREZZO_ACQUISTO": annuncio.prezzo,
             "COSTI_RISTRUTTURAZIONE": 0,  # Da stimare
-            "SPESE_NOTARILI": clean_price(data["PURCHASE_PRICE"]) * 0.03,  # 3% del prezzo
-            "PROVVIGIONE_AGENZIA": clean_price(data["PURCHASE_PRICE"]) * 0.03,  # 3% del prezzo
-            "IMPOSTA_REGISTRO": clean_price(data["PURCHASE_PRICE"]) * 0.02,  # 2% prima casa, 9% seconda
-            "IVA": clean_price(data["PURCHASE_PRICE"]) * 0.04  # 4% prima casa da costruttore, 10% seconda casa
+            "SPESE_NOTARILI": imposte["SPESE_NOTARILI"],
+            "PROVVIGIONE_AGENZIA": imposte["PROVVIGIONE_AGENZIA"],
+            "IMPOSTA_REGISTRO": imposte["IMPOSTA_REGISTRO"],
+            "IVA": imposte["IVA"]
         },
         "FINANZIAMENTO": {
             "PERCENTUALE_ANTICIPO": 0.2,  # 20% di anticipo
@@ -301,21 +735,16 @@ def analizza_immobile(data):
             "PERIZIA": 300
         },
         "RENDITA": {
-            "AFFITTO_MENSILE": clean_price(data["PURCHASE_PRICE"]) * 0.004,  # Stima 4.8% annuo
+            "AFFITTO_MENSILE": annuncio.prezzo * AFFITTO_MENSILE_SU_PREZZO,
             "TASSO_SFITTO": 0.08,  # 8% tasso di sfitto
-            "CEDOLARE_SECCA": 0.21  # 21% regime ordinario, 10% canone concordato
+            "CEDOLARE_SECCA": imposte["ALIQUOTA_CEDOLARE"]
         },
         "SPESE": {
-            "IMU": clean_price(data["PURCHASE_PRICE"]) * 0.0106,  # 1.06% medio
-            "TARI": calcola_tari(
-                mq=mq,
-                n_componenti=n_componenti,
-                tariffa_fissa=1.10,
-                quota_provinciale=0.05
-            ),
-            "ASSICURAZIONE": clean_price(data["PURCHASE_PRICE"]) * 0.001,  # 0.1% annuo
-            "SPESE_CONDOMINIALI": clean_price(data["MONTHLY_MAINTENANCE"]),
-            "MANUTENZIONE": clean_price(data["PURCHASE_PRICE"]) * 0.01,  # 1% annuo
+            "IMU": imposte["IMU"],
+            "TARI": imposte["TARI"],
+            "ASSICURAZIONE": annuncio.prezzo * ASSICURAZIONE_SU_PREZZO,
+            "SPESE_CONDOMINIALI": annuncio.spese_condominio,
+            "MANUTENZIONE": annuncio.prezzo * MANUTENZIONE_SU_PREZZO,
             "GESTIONE_AFFITTO": 0.08  # 8% del canone se in gestione
         },
         "MISC": {
@@ -325,18 +754,18 @@ def analizza_immobile(data):
     
     # Calcoliamo le metriche
     risultati = {
-        'indirizzo': data['ADDRESS'],
-        'prezzo': clean_price(data["PURCHASE_PRICE"]),
-        'mq': clean_sqm(data["SQFTS"]),
-        'prezzo_mq': clean_price(data["PURCHASE_PRICE"]) / clean_sqm(data["SQFTS"]) if clean_sqm(data["SQFTS"]) > 0 else 0,
-        'locali': data["LOCALi"],
-        'spese_cond': clean_price(data["MONTHLY_MAINTENANCE"]),
-        'rendita_lorda': (DATI["RENDITA"]["AFFITTO_MENSILE"] * 12) / clean_price(data["PURCHASE_PRICE"]),
+        'indirizzo': annuncio.indirizzo,
+        'prezzo': annuncio.prezzo,
+        'mq': mq,
+        'prezzo_mq': annuncio.prezzo_mq,
+        'locali': annuncio.locali if annuncio.locali is not None else "N/A",
+        'spese_cond': annuncio.spese_condominio,
+        'rendita_lorda': (DATI["RENDITA"]["AFFITTO_MENSILE"] * 12) / annuncio.prezzo,
         'rendita_netta': ((DATI["RENDITA"]["AFFITTO_MENSILE"] * 12) * (1 - DATI["RENDITA"]["CEDOLARE_SECCA"]) - 
                          DATI["SPESE"]["IMU"] - DATI["SPESE"]["TARI"] - 
                          DATI["SPESE"]["ASSICURAZIONE"] - 
                          (DATI["SPESE"]["SPESE_CONDOMINIALI"] * 12) - 
-                         DATI["SPESE"]["MANUTENZIONE"]) / clean_price(data["PURCHASE_PRICE"]),
+                         DATI["SPESE"]["MANUTENZIONE"]) / annuncio.prezzo,
         'cash_flow_mensile': DATI["RENDITA"]["AFFITTO_MENSILE"] - 
                             (DATI["SPESE"]["IMU"] + DATI["SPESE"]["TARI"] + 
                              DATI["SPESE"]["ASSICURAZIONE"] + 
@@ -346,6 +775,104 @@ def analizza_immobile(data):
     
     return risultati
 
+def _importi(colonna):
+    """converti_importo su una colonna: i numeri restano, le stringhe si leggono con il formato italiano"""
+    if pd.api.types.is_numeric_dtype(colonna):
+        return colonna.astype(float).fillna(0).to_numpy()
+    testo = colonna.where(colonna.map(type) == str)
+    letti = testo.str.extract(r"(\d[\d.]*(?:,\d+)?)", expand=False).str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    numeri = pd.to_numeric(colonna.where(testo.isna()), errors='coerce')
+    return pd.to_numeric(letti, errors='coerce').fillna(numeri).fillna(0).to_numpy(dtype=float)
+
+def _mq(colonna):
+    if pd.api.types.is_numeric_dtype(colonna):
+        return colonna.astype(float).fillna(0).to_numpy()
+    testo = colonna.where(colonna.map(type) == str)
+    letti = testo.str.extract(r"(\d+(?:[.,]\d+)?)", expand=False).str.replace(",", ".", regex=False)
+    numeri = pd.to_numeric(colonna.where(testo.isna()), errors='coerce')
+    return pd.to_numeric(letti, errors='coerce').fillna(numeri).fillna(0).to_numpy(dtype=float)
+
+def _interi(colonna):
+    if pd.api.types.is_numeric_dtype(colonna):
+        return colonna.astype(float).to_numpy()
+    testo = colonna.where(colonna.map(type) == str)
+    letti = pd.to_numeric(testo.str.extract(r"(\d+)", expand=False), errors='coerce')
+    return letti.fillna(pd.to_numeric(colonna.where(testo.isna()), errors='coerce')).to_numpy(dtype=float)
+
+# Colonne lette da analizza_immobili: i nomi di estrai_dati_annuncio, di
+# analisi_immobili.csv e di immobiliare_listings_processed.csv
+COLONNE_ANNUNCI = {
+    'indirizzo': ['ADDRESS', 'indirizzo', 'titolo'],
+    'prezzo': ['PURCHASE_PRICE', 'prezzo'],
+    'mq': ['SQFTS', 'MQ', 'metratura'],
+    'locali': ['LOCALi', 'LOCALI', 'n_locali'],
+    'spese_cond': ['MONTHLY_MAINTENANCE', 'spese_condominio'],
+    'categoria_catastale': ['CADASTRAL_CATEGORY'],
+    'rendita_catastale': ['CADASTRAL_INCOME'],
+    'comune': ['COMUNE', 'comune'],
+}
+
+def analizza_immobili(tabella):
+    """
+    analizza_immobile su un'intera tabella di annunci, per colonne
+
+    Args:
+        tabella (pd.DataFrame): annunci con le colonne di COLONNE_ANNUNCI
+            (stringhe dello scraping o numeri già puliti)
+
+    Returns:
+        pd.DataFrame: per annuncio, con lo stesso indice, i risultati di
+        analizza_immobile più IMU, TARI e MANUTENZIONE annue
+    """
+    def colonna(campo, default=None):
+        for nome in COLONNE_ANNUNCI[campo]:
+            if nome in tabella:
+                return tabella[nome]
+        return pd.Series(default, index=tabella.index, dtype=object)
+
+    prezzo = _importi(colonna('prezzo', 0))
+    mq = _mq(colonna('mq', 0))
+    locali = _interi(colonna('locali'))
+    spese_cond = _importi(colonna('spese_cond', 0))
+
+    # Seconda casa da privato a Milano, salvo diverse indicazioni nell'annuncio;
+    # i componenti per la TARI si stimano dai locali
+    dati_fiscali = pd.DataFrame({
+        "PREZZO": prezzo,
+        "CATEGORIA_CATASTALE": colonna('categoria_catastale').to_numpy(),
+        "RENDITA_CATASTALE": colonna('rendita_catastale').to_numpy(),
+        "MQ": mq,
+        "LOCALI": np.nan_to_num(locali, nan=1),
+    })
+    if any(nome in tabella for nome in COLONNE_ANNUNCI['comune']):
+        dati_fiscali["COMUNE"] = colonna('comune').to_numpy()
+    imposte = imposte_immobili.calcola_imposte(dati_fiscali)
+    imu = imposte["IMU"].to_numpy(dtype=float)
+    cedolare = imposte["ALIQUOTA_CEDOLARE"].to_numpy(dtype=float)
+    tari = imposte["TARI"].to_numpy(dtype=float)
+    affitto_mensile = prezzo * AFFITTO_MENSILE_SU_PREZZO
+    assicurazione = prezzo * ASSICURAZIONE_SU_PREZZO
+    manutenzione = prezzo * MANUTENZIONE_SU_PREZZO
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prezzo_valido = np.where(prezzo > 0, prezzo, np.nan)
+        risultati = pd.DataFrame({
+            'indirizzo': colonna('indirizzo', "").to_numpy(),
+            'prezzo': prezzo,
+            'mq': mq,
+            'prezzo_mq': np.where(mq > 0, prezzo / np.where(mq > 0, mq, 1), 0),
+            'locali': locali,
+            'spese_cond': spese_cond,
+            'rendita_lorda': affitto_mensile * 12 / prezzo_valido,
+            'rendita_netta': (affitto_mensile * 12 * (1 - cedolare) - imu - tari - assicurazione
+                              - spese_cond * 12 - manutenzione) / prezzo_valido,
+            'cash_flow_mensile': affitto_mensile - (imu + tari + assicurazione + manutenzione) / 12 - spese_cond,
+            'IMU': imu,
+            'TARI': tari,
+            'MANUTENZIONE': manutenzione,
+        }, index=tabella.index)
+    return risultati
+
 def salva_analisi_formattata(data, output_file='analisi_immobili_updated.txt'):
     """
     Salva i dati dell'analisi in un formato leggibile
@@ -377,21 +904,15 @@ def get_zone_data(listing_url):
     """
     Estrae i dati della zona partendo dall'URL dell'annuncio
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'it-IT,it;q=0.8,en-US;q=0.5,en;q=0.3',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Cache-Control': 'max-age=0'
-    }
-    
+    import requests
+    from bs4 import BeautifulSoup
+
     try:
         # Aggiungi un delay per evitare di sovraccaricare il server
         time.sleep(2)
         
         session = requests.Session()
-        response = session.get(listing_url, headers=headers, timeout=10)
+        response = session.get(listing_url, headers=HEADERS, timeout=10)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -410,49 +931,61 @@ def get_zone_data(listing_url):
         print(f"Errore generico: {str(e)}")
         return None
 
-# Test
-url = "https://www.immobiliare.it/annunci/111133703/?entryPoint=map"  # sostituisci con il tuo URL
-result = get_zone_data(url)
-print(f"\nRisultato: {result}")
-    
-def estrai_indirizzo_da_url(url_annuncio):
+def estrai_indirizzo_da_url(url_annuncio, data):
     """
     Non abbiamo bisogno di estrarre l'indirizzo dall'URL perché lo abbiamo già nei dati
     """
     return data['ADDRESS']
 
+def normalizza_via(indirizzo):
+    """
+    Nome canonico della via di un indirizzo: minuscolo, senza accenti e
+    punteggiatura, abbreviazioni sciolte, senza il tipo di immobile prima
+    della via e senza numero civico (es. "Bilocale in V.le Stelvio 5, Isola"
+    diventa "viale stelvio")
+    """
+    testo = unicodedata.normalize('NFKD', str(indirizzo).split(',')[0].lower())
+    testo = ''.join(c for c in testo if not unicodedata.combining(c))
+    testo = ABBREVIAZIONI_VIE_RE.sub(lambda m: ABBREVIAZIONI_VIE[m.group(1).replace(' ', '')] + ' ', testo)
+    testo = CIVICO_RE.sub('', testo.strip())
+    parole = re.sub(r"[^a-z0-9]+", ' ', testo).split()
+    # tutto quello che precede il tipo di via (trilocale, in vendita, ...) non fa parte del nome
+    for i, parola in enumerate(parole):
+        if parola in TIPI_VIA:
+            parole = parole[i:]
+            break
+    else:
+        parole = [parola for parola in parole if parola not in PREFISSI_ANNUNCIO]
+    while parole and (parole[-1][0].isdigit() or parole[-1] in ('snc', 'sn')):
+        parole.pop()
+    return ' '.join(parole)
+
+def dividi_via(via):
+    """
+    (tipo, nome) di una via normalizzata; tipo è '' se manca
+    """
+    tipo, _, nome = via.partition(' ')
+    return (tipo, nome) if tipo in TIPI_VIA and nome else ('', via)
+
+def parola_significativa(nome):
+    """
+    Ultima parola del nome di una via che la identifica da sola (es. il
+    cognome in "giuseppe verdi"), None se non ce n'è
+    """
+    for parola in reversed(nome.split()):
+        if len(parola) > 2 and parola not in PARTICELLE_VIA and not parola[0].isdigit():
+            return parola
+    return None
+
+def trigrammi(testo):
+    testo = f"  {testo} "
+    return {testo[i:i + 3] for i in range(len(testo) - 2)}
+
 def estrai_nome_via(indirizzo):
     """
     Estrae il nome della via dall'indirizzo completo
     """
-    # Converti in minuscolo e splitta per virgola
-    parti = indirizzo.lower().split(',')[0]
-    
-    # Rimuovi prefissi comuni
-    prefissi = ['trilocale', 'bilocale', 'quadrilocale', 'appartamento', 'attico']
-    for prefisso in prefissi:
-        if parti.startswith(prefisso):
-            parti = parti.replace(prefisso, '').strip()
-    
-    # Per viale/piazza, prendi il nome dopo
-    if "viale" in parti:
-        # Splitta per "viale" e prendi la parte dopo
-        nome = parti.split("viale")[1].strip()
-        # Prendi solo la prima parola (il nome del viale)
-        nome = nome.split()[0]
-        return nome
-    
-    if "piazza" in parti:
-        nome = parti.split("piazza")[1].strip()
-        nome = nome.split()[0]
-        return nome
-    
-    # Per via, prendi il cognome
-    if "via" in parti:
-        nome = parti.split("via")[1].strip()
-        return nome.split()[-1]
-    
-    return None
+    return normalizza_via(indirizzo) or None
 
 def trova_corrispondenza_via(nome_via):
     """
@@ -482,44 +1015,137 @@ def trova_zona_da_via(via):
     
     return mappa_vie_zone.get(via)
 
+class IndiceVie:
+    """
+    Indice delle vie di prezzi_zone_milano_dettagliato.csv.
+
+    Le vie sono salvate col nome canonico di normalizza_via, quindi la
+    corrispondenza esatta è un accesso a dizionario. Per il resto c'è un
+    indice di trigrammi sul nome senza tipo di via: i candidati si contano
+    in un colpo solo con bincount e il punteggio (0-100) è la similarità di
+    Jaccard dei trigrammi, ridotta se il tipo di via non coincide. Sotto la
+    soglia si ripiega sulle vie che contengono l'ultima parola significativa
+    del nome, così "Via Verdi" trova "Via Giuseppe Verdi".
+    """
+
+    def __init__(self, df_prezzi_zone):
+        self.df = df_prezzi_zone.reset_index(drop=True)
+        if 'tipo' in self.df:
+            vie = self.df['tipo'] == 'via'
+        else:
+            vie = self.df['indirizzo'] != 'TOTALE ZONA'
+        self.esatte = {}
+        self.vie = []
+        for riga, indirizzo in self.df.loc[vie, 'indirizzo'].dropna().items():
+            via = normalizza_via(indirizzo)
+            # a parità di nome vale la prima riga, come con str.contains(...).iloc[0]
+            if via and via not in self.esatte:
+                self.esatte[via] = riga
+                self.vie.append((via, riga))
+
+        self.tipi = np.array([dividi_via(via)[0] for via, _ in self.vie], dtype=object)
+        self.righe = np.array([riga for _, riga in self.vie], dtype=np.int64)
+        self.n_trigrammi = np.zeros(len(self.vie), dtype=np.int64)
+        liste = {}
+        parole = {}
+        for i, (via, _) in enumerate(self.vie):
+            nome = dividi_via(via)[1]
+            gruppo = trigrammi(nome)
+            self.n_trigrammi[i] = len(gruppo)
+            for trigramma in gruppo:
+                liste.setdefault(trigramma, []).append(i)
+            for parola in set(nome.split()):
+                parole.setdefault(parola, []).append(i)
+        self.liste = dict((trigramma, np.array(ids, dtype=np.int64)) for trigramma, ids in liste.items())
+        self.parole = dict((parola, np.array(ids, dtype=np.int64)) for parola, ids in parole.items())
+
+        # prima riga di ogni zona, per il ripiego sul nome della zona
+        self.zone = {}
+        for riga, zona in self.df['zona'].dropna().items():
+            self.zone.setdefault(zona, riga)
+
+    def cerca(self, indirizzo, soglia=PUNTEGGIO_MINIMO_VIA):
+        """
+        (riga della tabella, punteggio) della via più simile, None sotto la soglia
+        """
+        via = normalizza_via(indirizzo)
+        if not via:
+            return None
+        if via in self.esatte:
+            return self.esatte[via], 100.0
+        tipo, nome = dividi_via(via)
+        gruppo = trigrammi(nome)
+        liste = [self.liste[t] for t in gruppo if t in self.liste]
+        if not liste:
+            return None
+        comuni = np.bincount(np.concatenate(liste), minlength=len(self.vie))
+        punteggi = 100.0 * comuni / (len(gruppo) + self.n_trigrammi - comuni)
+        if tipo:
+            punteggi = np.where((self.tipi == tipo) | (self.tipi == ''), punteggi, punteggi * PENALITA_TIPO_VIA)
+        migliore = int(np.argmax(punteggi))
+        if punteggi[migliore] < soglia:
+            # ripiego: la più simile tra le vie che contengono la parola, es. il cognome
+            candidati = self.parole.get(parola_significativa(nome))
+            if candidati is None:
+                return None
+            migliore = int(candidati[np.argmax(punteggi[candidati])])
+        return int(self.righe[migliore]), float(punteggi[migliore])
+
+    def cerca_zona(self, testo):
+        """
+        Prima riga della zona il cui nome contiene ``testo`` (es. "porta romana")
+        """
+        testo = re.sub(r"[^a-z0-9]+", '-', normalizza_via(testo)).strip('-')
+        if not testo:
+            return None
+        for zona, riga in self.zone.items():
+            if testo in str(zona).lower():
+                return riga
+        return None
+
 def analizza_prezzi_zona(url_annuncio, df_prezzi_zone, data):
     """
-    Analizza i prezzi della zona partendo dall'URL dell'annuncio
+    Analizza i prezzi della zona di un Listing (o del dizionario dei suoi dati)
+
+    ``df_prezzi_zone`` è un IndiceVie oppure il DataFrame di
+    prezzi_zone_milano_dettagliato.csv; per molti annunci conviene
+    costruire l'indice una volta sola.
     """
     try:
-        # Debug: stampa le chiavi disponibili
-        print("Chiavi disponibili in data:", data.keys())
-        print("Contenuto di data:", data)
+        annuncio = data if isinstance(data, Listing) else Listing.da_dati(data)
+        print("Contenuto di data:", annuncio)
 
-        # Calcola il prezzo al metro quadro usando i nomi corretti delle chiavi
-        mq_totali = float(data.get('MQ', 0))  # o 'SQFTS' a seconda del nome reale
-        prezzo_totale = float(data.get('PURCHASE_PRICE', 0))
-        prezzo_mq = prezzo_totale / mq_totali if mq_totali > 0 else 0
-        spese_mensili = float(data.get('MONTHLY_MAINTENANCE', '0').replace('€', '').replace(',', '').strip()) if data.get('MONTHLY_MAINTENANCE') != 'N/A' else 0
+        mq_totali = annuncio.mq
+        prezzo_totale = annuncio.prezzo
+        prezzo_mq = annuncio.prezzo_mq
+        spese_mensili = annuncio.spese_condominio
         
         # Estrai l'indirizzo
-        indirizzo = data['ADDRESS']
+        indirizzo = annuncio.indirizzo
         print(f"Indirizzo trovato: {indirizzo}")
         
+        indice = df_prezzi_zone if isinstance(df_prezzi_zone, IndiceVie) else IndiceVie(df_prezzi_zone)
+        
         # Estrai il nome della via
         nome_via = estrai_nome_via(indirizzo)
         print(f"Nome via estratto: {nome_via}")
         
-        # Cerca la via nel DataFrame delle zone
+        # Cerca la via nell'indice delle vie
         zona_trovata = None
-        if nome_via:
-            mask = df_prezzi_zone['indirizzo'].str.contains(nome_via, case=False, na=False)
-            if mask.any():
-                zona_trovata = df_prezzi_zone[mask].iloc[0]
+        punteggio_via = 0.0
+        corrispondenza = indice.cerca(indirizzo)
+        if corrispondenza:
+            riga, punteggio_via = corrispondenza
+            zona_trovata = indice.df.iloc[riga]
+            print(f"Via trovata: {zona_trovata['indirizzo']} (punteggio {punteggio_via:.0f})")
         
         # Se non trovi la via, usa la zona
         if zona_trovata is None:
             parti = indirizzo.split(',')
             if len(parti) > 1:
-                zona = parti[1].strip().lower()
-                mask = df_prezzi_zone['zona'].str.contains(zona, case=False, na=False)
-                if mask.any():
-                    zona_trovata = df_prezzi_zone[mask].iloc[0]
+                riga = indice.cerca_zona(parti[1])
+                if riga is not None:
+                    zona_trovata = indice.df.iloc[riga]
         
         if zona_trovata is not None:
             prezzo_medio = float(zona_trovata['vendita_medio'])
@@ -535,7 +1161,7 @@ def analizza_prezzi_zona(url_annuncio, df_prezzi_zone, data):
             
             # Calcolo rendita netta
             spese_annue = spese_mensili * 12
-            tasse_rendita = rendita_annua_lorda * 0.21  # cedolare secca 21%
+            tasse_rendita = rendita_annua_lorda * imposte_immobili.carica_regole()["CEDOLARE_SECCA"]["ORDINARIA"]
             rendita_annua_netta = rendita_annua_lorda - spese_annue - tasse_rendita
             rendita_percentuale_netta = (rendita_annua_netta / prezzo_totale) * 100
             
@@ -548,7 +1174,8 @@ def analizza_prezzi_zona(url_annuncio, df_prezzi_zone, data):
                 'Affitto medio/m²': affitto_medio,
                 'Rendita annua lorda': rendita_annua_lorda,
                 'Rendita % annua lorda': rendita_percentuale_lorda,
-                'Rendita % annua netta': rendita_percentuale_netta
+                'Rendita % annua netta': rendita_percentuale_netta,
+                'Punteggio via': punteggio_via
             }
             
         return None
@@ -568,7 +1195,7 @@ def aggiorna_analisi_immobile(csv_input, output_file, df_prezzi_zone, df_airbnb)
         print(data)
         
         # Analizza i prezzi della zona
-        analisi = analizza_prezzi_zona(IMMOBILIARE_URL, df_prezzi_zone, data)
+        analisi = analizza_prezzi_zona(IMMOBILIARE_URL, df_prezzi_zone, Listing.da_dati(data))
         
         # Aggiungi analisi Airbnb usando il nome corretto della chiave per la zona
         analisi_airbnb = analizza_airbnb_data(
@@ -599,7 +1226,7 @@ def aggiorna_analisi_immobile(csv_input, output_file, df_prezzi_zone, df_airbnb)
         print(f"Errore nell'aggiornamento del file: {str(e)}")
         traceback.print_exc()
 
-def main():
+def analizza():
     try:
         print(f"\n=== ANALISI IMMOBILE ===")
         print(f"URL: {IMMOBILIARE_URL}")
@@ -608,33 +1235,43 @@ def main():
         df_prezzi_zone = pd.read_csv(PREZZI_ZONE_FILE)
         print("Dati zone caricati con successo")
         
-        # Carica i dati Airbnb
+        # Carica l'indice dei dati Airbnb
         try:
-            df_airbnb = pd.read_csv(AIRBNB_FILE)
-            print(f"Dati Airbnb caricati con successo: {len(df_airbnb)} record trovati")
+            indice_airbnb = carica_indice_airbnb()
+            print(f"Dati Airbnb caricati con successo: {sum(indice_airbnb.annunci_zona.values())} record trovati")
         except FileNotFoundError:
             print(f"ATTENZIONE: File {AIRBNB_FILE} non trovato")
-            df_airbnb = pd.DataFrame()
+            indice_airbnb = IndiceAirbnb()
         except Exception as e:
             print(f"Errore nel caricamento dei dati Airbnb: {str(e)}")
-            df_airbnb = pd.DataFrame()
+            indice_airbnb = IndiceAirbnb()
         
         # Leggi il file CSV dell'immobile
-        data = pd.read_csv('analisi_immobili.csv', encoding='utf-8-sig').iloc[0].to_dict()
+        data = pd.read_csv(ANALISI_FILE, encoding='utf-8-sig').iloc[0].to_dict()
         
         # Debug: stampa i dati letti
         print("\nDati immobile:")
         print(data)
         
+        # Con le coordinate dell'immobile si usano gli annunci Airbnb più vicini
+        coordinate = indice_geo = None
+        if pd.notna(data.get('LATITUDE')) and pd.notna(data.get('LONGITUDE')) and indice_airbnb.annunci_zona:
+            df_airbnb = pd.read_csv(AIRBNB_FILE)
+            if 'Latitudine' in df_airbnb:
+                coordinate = (float(data['LATITUDE']), float(data['LONGITUDE']))
+                indice_geo = IndiceGeoAirbnb(df_airbnb)
+        
         # Analisi Airbnb
-        if not df_airbnb.empty:
+        if indice_airbnb.annunci_zona:
             print("Avvio analisi Airbnb...")
             analisi_airbnb = analizza_airbnb_data(
                 zona_immobiliare=data.get('Zona di Milano'),
                 num_locali=int(data.get('LOCALI', 0)),
                 num_bagni=int(data.get('BATHROOMS', 0)),
                 num_camere=int(data.get('BEDROOMS', 0)),
-                df_airbnb=df_airbnb
+                df_airbnb=indice_airbnb,
+                coordinate=coordinate,
+                indice_geo=indice_geo
             )
             
             if analisi_airbnb:
@@ -653,6 +1290,37 @@ def main():
         print(f"\nErrore durante l'esecuzione: {str(e)}")
         traceback.print_exc()
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="analisi di un immobile")
+    comandi = parser.add_subparsers(dest="comando")
+    annuncio = comandi.add_parser("annuncio", help="scarica e stampa i dati di un annuncio")
+    annuncio.add_argument("url", nargs="?", default=IMMOBILIARE_URL)
+    annuncio.add_argument("--out", help="salva i dati in questo CSV")
+    zona = comandi.add_parser("zona", help="scarica la pagina della zona di un annuncio")
+    zona.add_argument("url")
+    classifica = comandi.add_parser("classifica", help="analizza una tabella di annunci e la ordina per rendita netta")
+    classifica.add_argument("tabella", help="CSV di annunci, es. immobiliare_listings_processed.csv")
+    classifica.add_argument("--out", help="salva la classifica in questo CSV")
+    classifica.add_argument("--primi", type=int, default=20, help="annunci da stampare")
+    args = parser.parse_args(argv)
+
+    if args.comando == "annuncio":
+        df = pd.DataFrame([scarica_annuncio(args.url)])
+        print(df)
+        if args.out:
+            df.to_csv(args.out, index=False, encoding='utf-8-sig')
+    elif args.comando == "zona":
+        print(f"\nRisultato: {get_zone_data(args.url)}")
+    elif args.comando == "classifica":
+        risultati = analizza_immobili(pd.read_csv(args.tabella)).sort_values('rendita_netta', ascending=False)
+        if args.out:
+            risultati.to_csv(args.out, index=False)
+            print(f"output: {args.out} ({len(risultati)} annunci)")
+        else:
+            print(risultati.head(args.primi).to_string(index=False))
+    else:
+        analizza()
+
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
   
\ No newline at end of file
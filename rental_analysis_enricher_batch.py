@@ -0,0 +1,182 @@
+"""
+Arricchimento in parallelo di molti annunci con httpx asincrono.
+
+Tutte le richieste passano da un unico httpx.AsyncClient (un solo pool di
+connessioni), al massimo ``concorrenza`` alla volta. Ogni host ha un
+token bucket di ``richieste_al_secondo`` con raffica ``raffica``: le
+richieste partono appena c'e' un gettone, quindi la velocita' dipende solo
+dal limite e non da pause fisse. Errori di rete, 429 e 5xx si ritentano
+fino a ``tentativi`` volte con attesa esponenziale e jitter (o quella
+indicata da Retry-After). Per ogni annuncio si ottiene lo stesso
+dizionario di rental_analysis_enricher.scarica_annuncio.
+
+usage: python rental_analysis_enricher_batch.py urls.txt [--concorrenza 10] [--richieste-al-secondo 2] [--out annunci.csv]
+"""
+import sys
+import random
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+
+import httpx
+import pandas as pd
+
+from rental_analysis_enricher import HEADERS, estrai_dati_html
+
+
+CONCORRENZA = 10
+RICHIESTE_AL_SECONDO = 2.0
+RAFFICA = 4
+TENTATIVI = 4
+ATTESA_BASE = 1.0
+ATTESA_MASSIMA = 60.0
+STATI_DA_RITENTARE = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Limite di ``velocita`` gettoni al secondo con al massimo ``capacita`` accumulati
+    """
+
+    def __init__(self, velocita, capacita):
+        self.velocita = velocita
+        self.capacita = capacita
+        self.gettoni = capacita
+        self.ultimo = None
+        self.lock = asyncio.Lock()
+
+    async def prendi(self):
+        """Attende finché c'è un gettone e lo consuma"""
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                adesso = loop.time()
+                if self.ultimo is not None:
+                    self.gettoni = min(self.capacita, self.gettoni + (adesso - self.ultimo) * self.velocita)
+                self.ultimo = adesso
+                if self.gettoni >= 1:
+                    self.gettoni -= 1
+                    return
+                await asyncio.sleep((1 - self.gettoni) / self.velocita)
+
+
+class LimitiPerHost:
+    """
+    Un TokenBucket per host, creato alla prima richiesta
+    """
+
+    def __init__(self, velocita, capacita):
+        self.velocita = velocita
+        self.capacita = capacita
+        self.bucket = {}
+
+    def __call__(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.bucket:
+            self.bucket[host] = TokenBucket(self.velocita, self.capacita)
+        return self.bucket[host]
+
+
+def attesa(tentativo, risposta=None):
+    """
+    Secondi da attendere prima del tentativo successivo
+    """
+    if risposta is not None and risposta.headers.get('Retry-After', '').isdigit():
+        return min(float(risposta.headers['Retry-After']), ATTESA_MASSIMA)
+    # backoff esponenziale con jitter pieno
+    return random.uniform(0, min(ATTESA_MASSIMA, ATTESA_BASE * 2**tentativo))
+
+
+async def scarica(client, url, limiti, semaforo, tentativi=TENTATIVI):
+    """
+    Testo della pagina ``url``; solleva l'ultimo errore se i tentativi finiscono
+    """
+    if tentativi < 1:
+        raise ValueError("tentativi deve essere almeno 1: %s" % tentativi)
+    for tentativo in range(tentativi):
+        await limiti(url).prendi()
+        risposta = None
+        try:
+            async with semaforo:
+                risposta = await client.get(url)
+            if risposta.status_code not in STATI_DA_RITENTARE:
+                risposta.raise_for_status()
+                return risposta.text
+            errore = httpx.HTTPStatusError(f"HTTP {risposta.status_code}", request=risposta.request, response=risposta)
+        except httpx.TransportError as e:
+            errore = e
+        if tentativo + 1 < tentativi:
+            await asyncio.sleep(attesa(tentativo, risposta))
+    raise errore
+
+
+async def arricchisci_annunci(urls, concorrenza=CONCORRENZA, richieste_al_secondo=RICHIESTE_AL_SECONDO,
+                              raffica=RAFFICA, tentativi=TENTATIVI, client=None):
+    """
+    Dati di ogni annuncio in ``urls``, nello stesso ordine
+
+    Args:
+        urls (list): URL degli annunci
+        concorrenza (int): richieste contemporanee al massimo
+        richieste_al_secondo (float): limite per host
+        raffica (int): richieste consecutive concesse a un host inattivo
+        tentativi (int): tentativi per annuncio
+        client (httpx.AsyncClient): client da usare al posto di uno nuovo
+
+    Returns:
+        list: per ogni URL il dizionario dei dati, o l'eccezione se non è
+        stato scaricato o letto
+    """
+    if tentativi < 1:
+        raise ValueError("tentativi deve essere almeno 1: %s" % tentativi)
+    limiti = LimitiPerHost(richieste_al_secondo, raffica)
+    semaforo = asyncio.Semaphore(concorrenza)
+
+    async def uno(client, url):
+        try:
+            testo = await scarica(client, url, limiti, semaforo, tentativi)
+            return estrai_dati_html(testo, url)
+        except Exception as e:
+            # un annuncio illeggibile non deve far perdere gli altri
+            return e
+
+    if client is not None:
+        return await asyncio.gather(*(uno(client, url) for url in urls))
+    async with httpx.AsyncClient(headers=HEADERS, timeout=10, follow_redirects=True,
+                                 limits=httpx.Limits(max_connections=concorrenza,
+                                                     max_keepalive_connections=concorrenza)) as client:
+        return await asyncio.gather(*(uno(client, url) for url in urls))
+
+
+def arricchisci(urls, **opzioni):
+    """
+    Versione sincrona di arricchisci_annunci
+    """
+    return asyncio.run(arricchisci_annunci(urls, **opzioni))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rental_analysis_enricher_batch.py', description="scarica i dati di molti annunci")
+    parser.add_argument('urls', help="file con un URL di annuncio per riga")
+    parser.add_argument('--concorrenza', type=int, default=CONCORRENZA)
+    parser.add_argument('--richieste-al-secondo', type=float, default=RICHIESTE_AL_SECONDO, help="limite per host")
+    parser.add_argument('--raffica', type=int, default=RAFFICA)
+    parser.add_argument('--tentativi', type=int, default=TENTATIVI)
+    parser.add_argument('--out', default='annunci.csv')
+    args = parser.parse_args(argv)
+
+    with open(args.urls, encoding='utf-8') as f:
+        urls = [riga.strip() for riga in f if riga.strip() and not riga.startswith('#')]
+    risultati = arricchisci(urls, concorrenza=args.concorrenza, richieste_al_secondo=args.richieste_al_secondo,
+                            raffica=args.raffica, tentativi=args.tentativi)
+
+    dati = [r for r in risultati if isinstance(r, dict)]
+    for url, r in zip(urls, risultati):
+        if not isinstance(r, dict):
+            print(f"Errore su {url}: {r}", file=sys.stderr)
+    pd.DataFrame(dati).to_csv(args.out, index=False, encoding='utf-8-sig')
+    print(f"output: {args.out} ({len(dati)} annunci, {len(urls) - len(dati)} errori)")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
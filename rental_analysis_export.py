@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""
+Export mode: one typed row per deal with every input and metric, for bulk runs.
+
+Deal.show() writes a free-text report meant for a person. This writes the
+same numbers as columns (id, the PROPERTY..MISC inputs, then every field of
+rental_analysis.NODES) to JSON Lines, CSV or Parquet, chosen by the output
+extension. Deals are loaded and evaluated through the vectorized model
+``--batch-size`` at a time and each batch is written in one call.
+
+usage: rental_analysis.py export deals.parquet 'deals/*.yml' [more dirs or globs] [--batch-size 10000] [--workers 8]
+       rental_analysis.py export deals.jsonl --table listings.csv --base data_file.yml
+"""
+from __future__ import division
+import abc
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import rental_analysis as ra
+import rental_analysis_batch
+
+
+DEFAULT_BATCH_SIZE = 10000
+TEXT_FIELDS = ['ADDRESS', 'LINK', 'DESCRIPTION']
+COUNT_FIELDS = ['BEDROOMS', 'BATHROOMS', 'UNITS', 'MORTGAGE_LOAN_YRS']
+
+
+def _whole(numbers):
+    return np.all(np.isnan(numbers) | (np.isfinite(numbers) & (numbers == np.floor(numbers))))
+
+
+def text_column(values):
+    return np.where(pd.isnull(values), None, values.astype(str))
+
+
+def count_column(values, fractional=False):
+    """Nullable integers when every value is whole, floats when some are (or ``fractional``), text otherwise"""
+    try:
+        numbers = values.astype(float)
+    except (TypeError, ValueError):
+        return text_column(values)
+    if fractional or not _whole(numbers):
+        return numbers
+    return pd.array(numbers, dtype='Int64')
+
+
+def fractional_counts(inputs):
+    """Names of the count fields of ``inputs`` holding a number that is not whole"""
+    fractional = set()
+    for name in COUNT_FIELDS:
+        try:
+            numbers = np.asarray(inputs.get(name, np.nan), dtype=float)
+        except (TypeError, ValueError):
+            continue
+        if not _whole(numbers):
+            fractional.add(name)
+    return fractional
+
+
+def deal_records(ids, inputs, fractional=()):
+    """DataFrame with one row per deal: id, inputs, metrics
+
+    Count fields are integers unless a value in this batch, or their name
+    in ``fractional``, says otherwise; pass fractional_counts() of every
+    deal to get the same column types in every batch.
+    """
+    ids = np.asarray(ids)
+    metrics = ra.calculate_metrics(inputs)
+    columns = {'id': ids.astype(str)}
+    for name, value in list(inputs.items()) + list(metrics.items()):
+        if name in TEXT_FIELDS:
+            columns[name] = text_column(np.broadcast_to(np.asarray(value, dtype=object), ids.shape))
+        elif name in COUNT_FIELDS:
+            columns[name] = count_column(np.broadcast_to(np.asarray(value, dtype=object), ids.shape), name in fractional)
+        else:
+            columns[name] = np.broadcast_to(np.asarray(value, dtype=float), ids.shape)
+    return pd.DataFrame(columns)
+
+
+class RecordWriter(abc.ABC):
+    """Buffers record frames and writes them ``batch_size`` rows at a time.
+
+    ``columns`` fixes the schema, by default the columns of the first
+    frame. Frames missing some of them are reindexed to it, so every batch
+    lands with the same columns; a frame with a column outside the schema
+    raises ValueError rather than losing it.
+    """
+
+    def __init__(self, outfile, batch_size=DEFAULT_BATCH_SIZE, columns=None):
+        self.outfile = outfile
+        self.batch_size = batch_size
+        self.columns = list(columns) if columns is not None else None
+        self.rows = 0
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, frame):
+        if self.columns is None:
+            self.columns = list(frame.columns)
+        unknown = frame.columns.difference(self.columns)
+        if len(unknown):
+            raise ValueError("columns outside the schema of %s: %s" % (self.outfile, ', '.join(unknown)))
+        self._buffer.append(frame.reindex(columns=self.columns))
+        self._buffered += len(frame)
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        frame = self._buffer[0] if len(self._buffer) == 1 else pd.concat(self._buffer, ignore_index=True)
+        self._write_frame(frame)
+        self.rows += len(frame)
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+
+    @abc.abstractmethod
+    def _write_frame(self, frame):
+        """Write one batch of records"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonLinesWriter(RecordWriter):
+    def __init__(self, outfile, batch_size=DEFAULT_BATCH_SIZE, columns=None):
+        super(JsonLinesWriter, self).__init__(outfile, batch_size, columns)
+        self._file = open(outfile, 'w')
+
+    def _write_frame(self, frame):
+        text = frame.to_json(orient='records', lines=True, double_precision=15)
+        # older pandas leaves off the newline after the last record
+        self._file.write(text if text.endswith('\n') else text + '\n')
+
+    def close(self):
+        super(JsonLinesWriter, self).close()
+        self._file.close()
+
+
+class CsvWriter(RecordWriter):
+    def __init__(self, outfile, batch_size=DEFAULT_BATCH_SIZE, columns=None):
+        super(CsvWriter, self).__init__(outfile, batch_size, columns)
+        self._file = open(outfile, 'w', newline='')
+
+    def _write_frame(self, frame):
+        frame.to_csv(self._file, header=self.rows == 0, index=False)
+
+    def close(self):
+        super(CsvWriter, self).close()
+        self._file.close()
+
+
+class ParquetWriter(RecordWriter):
+    """One row group per batch"""
+
+    def __init__(self, outfile, batch_size=DEFAULT_BATCH_SIZE, columns=None):
+        super(ParquetWriter, self).__init__(outfile, batch_size, columns)
+        self._writer = None
+
+    def _write_frame(self, frame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self._writer is None:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            self._writer = pq.ParquetWriter(self.outfile, table.schema)
+        else:
+            table = pa.Table.from_pandas(frame, schema=self._writer.schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        super(ParquetWriter, self).close()
+        if self._writer is not None:
+            self._writer.close()
+
+
+WRITERS = {
+    '.jsonl': JsonLinesWriter,
+    '.csv': CsvWriter,
+    '.parquet': ParquetWriter,
+}
+
+
+def open_writer(outfile, batch_size=DEFAULT_BATCH_SIZE, columns=None):
+    """Record writer picked by the extension of ``outfile``"""
+    for extension, writer in WRITERS.items():
+        if outfile.endswith(extension):
+            return writer(outfile, batch_size, columns)
+    raise ValueError("unknown output format: %s (expected %s)" % (outfile, ', '.join(sorted(WRITERS))))
+
+
+def load_inputs(data_file):
+    return ra.flatten_data(ra.load_data(data_file))
+
+
+def record_fields(data_file):
+    """Input fields deal_records() writes for one deal file, and its fractional count fields"""
+    inputs = load_inputs(data_file)
+    names = [name for name, value in inputs.items() if ra.is_number(value) or name in TEXT_FIELDS + COUNT_FIELDS]
+    return names, fractional_counts(inputs)
+
+
+def iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stack_records(inputs_list):
+    """stack_inputs() plus the text and count fields it leaves out"""
+    stacked = ra.stack_inputs(inputs_list)
+    for name in TEXT_FIELDS + COUNT_FIELDS:
+        if any(name in inputs for inputs in inputs_list) and name not in stacked:
+            stacked[name] = np.array([inputs.get(name) for inputs in inputs_list], dtype=object)
+    return stacked
+
+
+def export_files(outfile, data_files, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+    """Write the records of every deal file; returns rows written
+
+    A first pass over the files collects the fields set by any deal and the
+    fractional count fields, so the columns and their types are the same
+    whatever the batch size.
+    """
+    if workers == 1:
+        return _export_files(outfile, data_files, batch_size, map)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return _export_files(outfile, data_files, batch_size,
+                             lambda func, items: pool.map(func, items, chunksize=max(1, len(items) // 256)))
+
+
+def _export_files(outfile, data_files, batch_size, map_files):
+    names = {}
+    fractional = set()
+    for fields, counts in map_files(record_fields, data_files):
+        names.update(dict.fromkeys(fields))
+        fractional |= counts
+    columns = ['id'] + list(dict.fromkeys(list(names) + list(ra.NODE_FUNCS)))
+    with open_writer(outfile, batch_size, columns) as writer:
+        for batch in iter_batches(data_files, batch_size):
+            loaded = list(map_files(load_inputs, batch))
+            writer.write(deal_records(batch, stack_records(loaded), fractional))
+    return writer.rows
+
+
+def export_table(outfile, table, data, batch_size=DEFAULT_BATCH_SIZE):
+    """Write the records of every row of ``table`` over the base deal ``data``; returns rows written"""
+    fractional = fractional_counts(ra.inputs_from_table(table, data))
+    with open_writer(outfile, batch_size) as writer:
+        for start in range(0, len(table), batch_size):
+            chunk = table.iloc[start:start + batch_size]
+            writer.write(deal_records(chunk.index.to_numpy(), ra.inputs_from_table(chunk, data), fractional))
+    return writer.rows
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rental_analysis.py export', description='inputs and metrics of many deals as JSON Lines, CSV or Parquet')
+    parser.add_argument('outfile', help='.jsonl, .csv or .parquet')
+    parser.add_argument('patterns', nargs='*', help='directories or glob patterns of deal YAMLs')
+    parser.add_argument('--table', help='CSV with one deal per row, columns named like input fields')
+    parser.add_argument('--base', default='data_file.yml', help='deal YAML supplying fields missing from --table')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, help='worker processes loading YAMLs, default one per CPU')
+    args = parser.parse_args(argv)
+
+    if args.table:
+        rows = export_table(args.outfile, pd.read_csv(args.table), ra.load_data(args.base), args.batch_size)
+    else:
+        data_files = rental_analysis_batch.collect_files(args.patterns)
+        rows = export_files(args.outfile, data_files, args.batch_size, args.workers)
+    print("output: %s (%d deals)" % (args.outfile, rows))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
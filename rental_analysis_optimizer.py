@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+"""
+Acquisition optimizer: the subset of scraped listings worth buying.
+
+Every listing in immobiliare_listings_processed.csv (ImmobiliareScraper.process_data)
+becomes a deal over the --base YAML: PURCHASE_PRICE from ``prezzo`` and
+MONTHLY_RENT from ``annual_yield``, which already accounts for occupancy,
+so VACANCY_RATE is 0. The objective per listing is one of
+
+    cash_flow   CASH_FLOW of the one-year model
+    npv         NPV of the hold projection at DISCOUNT_RATE
+    irr         projection IRR x TOTAL_CASH_OUTLAY (a money-weighted IRR;
+                a portfolio IRR is not additive over listings)
+
+and the chosen set maximizes its sum subject to
+
+    sum TOTAL_CASH_OUTLAY <= budget
+    listings per zona_standard <= max per zone
+    sum MORTGAGE_LOAN_AMOUNT <= max leverage * sum PURCHASE_PRICE
+
+The budget is solved exactly by dynamic programming over cash rounded up
+to ``budget / buckets`` (so the real outlay never exceeds it), zone by
+zone with the count taken in the current zone as a second state, which
+enforces the zone cap without enumerating combinations. The leverage
+constraint is priced in with a Lagrange multiplier found by bisection;
+that always yields a compliant set but, unlike the budget, not always the
+best one, so the greedy pick below is kept when it does better.
+Problems whose DP table would not fit fall back to a greedy pass by value
+per euro of cash.
+
+usage: rental_analysis.py acquire immobiliare_listings_processed.csv --base data_file.yml --budget 500000 \\
+           [--objective cash_flow] [--max-per-zone 2] [--max-leverage 0.7] [--out chosen.csv]
+"""
+from __future__ import division
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import rental_analysis as ra
+import rental_analysis_projection
+
+
+DEFAULT_BUCKETS = 2000
+MAX_DP_CELLS = 2 * 10**8
+LEVERAGE_ITERATIONS = 20
+OBJECTIVES = ['cash_flow', 'npv', 'irr']
+
+
+def listing_inputs(listings, data):
+    """Deal inputs of every listing over the base deal ``data``"""
+    table = pd.DataFrame({
+        'PURCHASE_PRICE': listings['prezzo'],
+        'MONTHLY_RENT': listings['annual_yield'] / 100 * listings['prezzo'] / 12,
+        'VACANCY_RATE': 0.0,
+    }, index=listings.index)
+    return ra.inputs_from_table(table, data)
+
+
+def listing_values(inputs, objective):
+    """Objective value, cash needed, price and loan of every listing"""
+    metrics = ra.calculate_metrics(inputs)
+    if objective == 'cash_flow':
+        value = metrics['CASH_FLOW']
+    elif objective == 'npv':
+        value = rental_analysis_projection.project(inputs)['NPV']
+    elif objective == 'irr':
+        value = rental_analysis_projection.project(inputs)['IRR'] * metrics['TOTAL_CASH_OUTLAY']
+    else:
+        raise ValueError("unknown objective: %s" % objective)
+    return {
+        'VALUE': np.asarray(value, dtype=float),
+        'CASH': np.asarray(metrics['TOTAL_CASH_OUTLAY'], dtype=float),
+        'PRICE': np.asarray(inputs['PURCHASE_PRICE'], dtype=float),
+        'LOAN': np.asarray(metrics['MORTGAGE_LOAN_AMOUNT'], dtype=float),
+    }
+
+
+def _shift(values, cost):
+    shifted = np.full_like(values, -np.inf)
+    if cost < values.shape[-1]:
+        shifted[..., cost:] = values[..., :values.shape[-1] - cost]
+    return shifted
+
+
+def knapsack(values, costs, zones, budget, max_per_zone):
+    """Indices maximizing sum ``values`` with sum ``costs`` <= ``budget`` and at most ``max_per_zone`` per zone.
+
+    ``costs`` and ``budget`` are whole budget units. Only listings with a
+    positive value are worth taking.
+    """
+    candidates = np.flatnonzero((values > 0) & (costs <= budget))
+    order = candidates[np.argsort(zones[candidates], kind='stable')]
+    best = np.zeros(budget + 1)
+    steps = []
+    start = 0
+    while start < len(order):
+        zone = zones[order[start]]
+        end = start
+        while end < len(order) and zones[order[end]] == zone:
+            end += 1
+        members = order[start:end]
+        cap = min(max_per_zone, len(members))
+
+        # taken[c, b]: best value at cash b with c listings taken so far in this zone
+        taken = np.full((cap + 1, budget + 1), -np.inf)
+        taken[0] = best
+        decisions = []
+        for item in members:
+            candidate = _shift(taken[:-1], costs[item]) + values[item]
+            take = candidate > taken[1:]
+            taken[1:] = np.where(take, candidate, taken[1:])
+            decisions.append(take)
+        counts = np.argmax(taken, axis=0)
+        best = taken[counts, np.arange(budget + 1)]
+        steps.append((members, decisions, counts))
+        start = end
+
+    chosen = []
+    cash = budget
+    for members, decisions, counts in reversed(steps):
+        count = counts[cash]
+        for item, take in zip(members[::-1], decisions[::-1]):
+            if count and take[count - 1, cash]:
+                chosen.append(item)
+                cash -= costs[item]
+                count -= 1
+    return np.array(sorted(chosen), dtype=np.int64)
+
+
+def greedy(values, costs, zones, budget, max_per_zone, loans=None, prices=None, max_leverage=None):
+    """Indices picked by value per unit of cost while the budget, zone caps and leverage allow"""
+    ratio = np.where(costs > 0, values / np.maximum(costs, 1e-9), np.inf)
+    order = np.argsort(-ratio, kind='stable')
+    chosen = []
+    cash = 0
+    loan = price = 0.0
+    per_zone = {}
+    for item in order:
+        if values[item] <= 0 or cash + costs[item] > budget or per_zone.get(zones[item], 0) >= max_per_zone:
+            continue
+        if max_leverage is not None and loan + loans[item] > max_leverage * (price + prices[item]):
+            continue
+        chosen.append(item)
+        cash += costs[item]
+        loan += loans[item]
+        price += prices[item]
+        per_zone[zones[item]] = per_zone.get(zones[item], 0) + 1
+    return np.array(sorted(chosen), dtype=np.int64)
+
+
+def optimize(values, cash, prices, loans, zones, budget, max_per_zone=np.inf, max_leverage=None, buckets=DEFAULT_BUCKETS):
+    """Indices of the best affordable set; see the module docstring for the constraints"""
+    zones = np.asarray(pd.Series(zones).fillna('').astype(str).to_numpy())
+    # a listing without a zone is a zone of its own
+    unzoned = zones == ''
+    zones = np.where(unzoned, np.char.add('#', np.arange(len(zones)).astype(str)), zones).astype(object)
+    max_per_zone = int(min(max_per_zone, len(values) or 1))
+
+    unit = max(budget / buckets, 1.0)
+    costs = np.ceil(np.maximum(cash, 0) / unit).astype(np.int64)
+    units = int(budget // unit)
+    if len(values) * (min(max_per_zone, len(values)) + 1) * (units + 1) > MAX_DP_CELLS:
+        return greedy(values, cash, zones, budget, max_per_zone, loans, prices, max_leverage)
+
+    def solve(penalty):
+        adjusted = values - penalty * (loans - max_leverage * prices) if penalty else values
+        return knapsack(adjusted, costs, zones, units, max_per_zone)
+
+    def leverage_ok(chosen):
+        return max_leverage is None or loans[chosen].sum() <= max_leverage * prices[chosen].sum() + 1e-6
+
+    chosen = solve(0)
+    if leverage_ok(chosen):
+        return chosen
+
+    # price leverage in: grow the multiplier until the set complies, then bisect down
+    low, high = 0.0, 1.0
+    feasible = None
+    for _ in range(LEVERAGE_ITERATIONS):
+        chosen = solve(high)
+        if leverage_ok(chosen):
+            feasible = chosen
+            break
+        low, high = high, high * 4
+    if feasible is None:
+        return greedy(values, cash, zones, budget, max_per_zone, loans, prices, max_leverage)
+    for _ in range(LEVERAGE_ITERATIONS // 2):
+        middle = 0.5 * (low + high)
+        chosen = solve(middle)
+        if leverage_ok(chosen):
+            feasible, high = chosen, middle
+        else:
+            low = middle
+    # the multiplier can overshoot between two sets; keep the greedy pick if it does better
+    fallback = greedy(values, cash, zones, budget, max_per_zone, loans, prices, max_leverage)
+    return fallback if values[fallback].sum() > values[feasible].sum() else feasible
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rental_analysis.py acquire', description='best set of listings to buy within a budget')
+    parser.add_argument('listings', help='immobiliare_listings_processed.csv')
+    parser.add_argument('--base', default='data_file.yml', help='deal YAML with financing and expense assumptions')
+    parser.add_argument('--budget', type=float, required=True, help='cash available for down payments and acquisition costs')
+    parser.add_argument('--objective', choices=OBJECTIVES, default='cash_flow')
+    parser.add_argument('--max-per-zone', type=int, default=sys.maxsize)
+    parser.add_argument('--max-leverage', type=float, help='max total loan / total price')
+    parser.add_argument('--buckets', type=int, default=DEFAULT_BUCKETS, help='budget resolution of the DP')
+    parser.add_argument('--out', help='write the chosen listings to this CSV')
+    args = parser.parse_args(argv)
+
+    listings = pd.read_csv(args.listings)
+    listings = listings[(listings['prezzo'] > 0) & listings['annual_yield'].notna()].reset_index(drop=True)
+    inputs = listing_inputs(listings, ra.load_data(args.base))
+    values = listing_values(inputs, args.objective)
+    chosen = optimize(values['VALUE'], values['CASH'], values['PRICE'], values['LOAN'], listings['zona_standard'],
+                      args.budget, args.max_per_zone, args.max_leverage, args.buckets)
+
+    result = listings.iloc[chosen].copy()
+    result['VALUE'] = values['VALUE'][chosen]
+    result['TOTAL_CASH_OUTLAY'] = values['CASH'][chosen]
+    result['MORTGAGE_LOAN_AMOUNT'] = values['LOAN'][chosen]
+
+    if args.out:
+        result.to_csv(args.out, index=False)
+        print("output: %s" % args.out)
+    else:
+        columns = [c for c in ['indirizzo', 'zona_standard', 'prezzo', 'annual_yield', 'TOTAL_CASH_OUTLAY', 'VALUE'] if c in result]
+        result[columns].to_string(sys.stdout, index=False)
+        sys.stdout.write("\n")
+    print("chosen: %d of %d listings, %s: %.0f, cash: %.0f of %.0f, leverage: %.2f" % (
+        len(result), len(listings), args.objective, result['VALUE'].sum(), result['TOTAL_CASH_OUTLAY'].sum(), args.budget,
+        result['MORTGAGE_LOAN_AMOUNT'].sum() / result['prezzo'].sum() if len(result) else 0))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+Portfolio of deals on one consolidated monthly timeline.
+
+Every property owned gets one row in a dense (properties x months) matrix
+per stream:
+
+    RENT            net rent + other income, growing yearly by RENT_GROWTH
+    EXPENSES        TOTAL_ANNUAL_EXPENSES / 12, the management fee growing
+                    with rent and the rest with EXPENSE_INFLATION
+    DEBT_SERVICE    MONTHLY_MORTGAGE_LOAN_PAYMENT while the loan runs
+    EQUITY          PURCHASE_PRICE grown by PROPERTY_APPRECIATION_RATE less
+                    the remaining mortgage balance, at the end of the month
+
+Months before a property's ACQUISITION_DATE are zero, so in its first
+twelve months the streams add up to the single-deal report's annual figures.
+Rows live in preallocated arrays that grow by doubling: adding properties
+only computes their own rows and removing one moves the last row into its
+slot. Slicing by ZONE or acquisition year is a mask over the rows.
+
+A deal YAML can set ZONE and ACQUISITION_DATE (YYYY-MM or YYYY) in any
+section; RENT_GROWTH and EXPENSE_INFLATION default as in the projection.
+
+usage: rental_analysis.py portfolio deals/*.yml --start 2025-01 [--years 10] [--zone NAVIGLI] [--acquired 2025] [--out timeline.csv]
+       rental_analysis.py portfolio --table immobiliare_listings_processed.csv --base data_file.yml --column prezzo=PURCHASE_PRICE --zone-column zona_standard
+"""
+from __future__ import division
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import rental_analysis as ra
+import rental_analysis_projection
+
+
+MONS_PER_YR = 12
+STREAMS = ['RENT', 'EXPENSES', 'DEBT_SERVICE', 'EQUITY']
+
+
+def month_index(date):
+    """Months since year 0 of a YYYY-MM string, a YYYY year, a date or a (year, month) pair"""
+    if isinstance(date, tuple):
+        year, month = date
+    elif hasattr(date, 'month'):
+        year, month = date.year, date.month
+    elif isinstance(date, str) and '-' in date:
+        year, month = date.split('-')[:2]
+    else:
+        year, month = date, 1
+    return int(year) * MONS_PER_YR + int(month) - 1
+
+
+def property_streams(inputs, ages):
+    """Monthly streams of every deal in ``inputs`` at ``ages`` months since acquisition, zero where negative"""
+    inputs = rental_analysis_projection.with_defaults(inputs)
+    metrics = ra.calculate_metrics(inputs)
+    count = ages.shape[0]
+
+    def column(name):
+        value = metrics[name] if name in metrics else inputs[name]
+        return np.broadcast_to(np.asarray(value, dtype=float), (count,))[:, None]
+
+    owned = ages >= 0
+    age = np.maximum(ages, 0)
+    rent_factor = (1 + column('RENT_GROWTH'))**(age // MONS_PER_YR)
+    expense_factor = (1 + column('EXPENSE_INFLATION'))**(age // MONS_PER_YR)
+
+    management_fee = column('ANNUAL_PROPERTY_MANAGEMENT_FEE') / MONS_PER_YR
+    other_expenses = column('TOTAL_ANNUAL_EXPENSES') / MONS_PER_YR - management_fee
+    term = MONS_PER_YR * column('MORTGAGE_LOAN_YRS')
+    paid_months = np.minimum(age + 1, term)
+    balance = ra.calculate_mortgage_balances(column('MORTGAGE_LOAN_AMOUNT'), column('MORTGAGE_LOAN_YRS'),
+                                             column('MORTGAGE_LOAN_APR'), paid_months / MONS_PER_YR)
+    value = column('PURCHASE_PRICE') * (1 + column('PROPERTY_APPRECIATION_RATE'))**((age + 1) / MONS_PER_YR)
+
+    streams = {
+        'RENT': (column('MONTHLY_NET_RENT') + column('MONTHLY_OTHER_INCOME')) * rent_factor,
+        'EXPENSES': management_fee * rent_factor + other_expenses * expense_factor,
+        'DEBT_SERVICE': np.where(age < term, column('MONTHLY_MORTGAGE_LOAN_PAYMENT'), 0.0),
+        'EQUITY': value - balance,
+    }
+    return dict((name, np.where(owned, stream, 0.0)) for name, stream in streams.items())
+
+
+class Portfolio(object):
+    """Deals on a shared calendar of ``months`` months starting at ``start``"""
+
+    def __init__(self, start, months):
+        self.start = month_index(start)
+        self.months = months
+        self.ids = []
+        self._rows = {}
+        self._capacity = 0
+        self._zones = np.empty(0, dtype=object)
+        self._acquired = np.empty(0, dtype=np.int64)
+        self._streams = dict((name, np.empty((0, months))) for name in STREAMS)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _reserve(self, size):
+        if size <= self._capacity:
+            return
+        capacity = max(size, 2 * self._capacity, 16)
+        zones = np.empty(capacity, dtype=object)
+        zones[:len(self)] = self._zones[:len(self)]
+        acquired = np.zeros(capacity, dtype=np.int64)
+        acquired[:len(self)] = self._acquired[:len(self)]
+        for name in STREAMS:
+            grown = np.zeros((capacity, self.months))
+            grown[:len(self)] = self._streams[name][:len(self)]
+            self._streams[name] = grown
+        self._zones = zones
+        self._acquired = acquired
+        self._capacity = capacity
+
+    def add(self, ids, inputs, zones=None, acquired=None):
+        """Add deals ``ids`` (inputs as scalars or 1-D arrays over them); only their rows are computed"""
+        ids = list(ids)
+        count = len(ids)
+        for deal_id in ids:
+            if deal_id in self._rows:
+                raise ValueError("already in portfolio: %s" % deal_id)
+        zones = np.broadcast_to(np.asarray(zones if zones is not None else inputs.get('ZONE'), dtype=object), (count,))
+        if acquired is None:
+            acquired = inputs.get('ACQUISITION_DATE', (self.start // MONS_PER_YR, self.start % MONS_PER_YR + 1))
+        if isinstance(acquired, (str, int, tuple)) or hasattr(acquired, 'month'):
+            acquired = [acquired] * count
+        acquired = np.array([month_index(date) for date in acquired], dtype=np.int64)
+
+        ages = self.start + np.arange(self.months)[None, :] - acquired[:, None]
+        streams = property_streams(inputs, ages)
+
+        first = len(self)
+        self._reserve(first + count)
+        rows = slice(first, first + count)
+        self._zones[rows] = zones
+        self._acquired[rows] = acquired
+        for name in STREAMS:
+            self._streams[name][rows] = streams[name]
+        for row, deal_id in enumerate(ids, first):
+            self._rows[deal_id] = row
+        self.ids.extend(ids)
+
+    def remove(self, deal_id):
+        """Drop one deal; the last row moves into its slot"""
+        row = self._rows.pop(deal_id)
+        last = len(self) - 1
+        if row != last:
+            moved = self.ids[last]
+            self.ids[row] = moved
+            self._rows[moved] = row
+            self._zones[row] = self._zones[last]
+            self._acquired[row] = self._acquired[last]
+            for name in STREAMS:
+                self._streams[name][row] = self._streams[name][last]
+        self.ids.pop()
+        for name in STREAMS:
+            self._streams[name][last] = 0
+
+    def mask(self, zone=None, acquisition_year=None):
+        """Boolean mask over the rows of the deals in ``zone`` and/or bought in ``acquisition_year``"""
+        selected = np.ones(len(self), dtype=bool)
+        if zone is not None:
+            selected &= self._zones[:len(self)] == zone
+        if acquisition_year is not None:
+            selected &= self._acquired[:len(self)] // MONS_PER_YR == int(acquisition_year)
+        return selected
+
+    def timeline(self, stream, zone=None, acquisition_year=None):
+        """(deals x months) matrix of one stream for the selected deals"""
+        matrix = self._streams[stream][:len(self)]
+        if zone is None and acquisition_year is None:
+            return matrix
+        return matrix[self.mask(zone, acquisition_year)]
+
+    def consolidated(self, zone=None, acquisition_year=None):
+        """Monthly totals of every stream, plus NET_CASH_FLOW, over the selected deals"""
+        selected = self.mask(zone, acquisition_year)
+        totals = dict((name, self._streams[name][:len(self)][selected].sum(axis=0)) for name in STREAMS)
+        totals['NET_CASH_FLOW'] = totals['RENT'] - totals['EXPENSES'] - totals['DEBT_SERVICE']
+        index = pd.PeriodIndex.from_ordinals(self.start - 1970 * MONS_PER_YR + np.arange(self.months), freq='M')
+        return pd.DataFrame(totals, index=index, columns=STREAMS + ['NET_CASH_FLOW'])
+
+    @classmethod
+    def from_yamls(cls, data_files, start, months):
+        portfolio = cls(start, months)
+        for data_file in data_files:
+            portfolio.add([data_file], ra.flatten_data(ra.load_data(data_file)))
+        return portfolio
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rental_analysis.py portfolio', description='consolidated monthly timeline of a portfolio')
+    parser.add_argument('data_files', nargs='*')
+    parser.add_argument('--table', help='CSV with one deal per row, columns named like input fields')
+    parser.add_argument('--base', default='data_file.yml', help='deal YAML supplying fields missing from --table')
+    parser.add_argument('--column', action='append', default=[], metavar='SRC=FIELD', help='read input FIELD from table column SRC')
+    parser.add_argument('--zone-column', help='table column holding the zone')
+    parser.add_argument('--start', required=True, help='first month of the timeline, YYYY-MM')
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--zone', help='only deals in this zone')
+    parser.add_argument('--acquired', type=int, help='only deals bought in this year')
+    parser.add_argument('--out', help='write the monthly timeline to this CSV instead of yearly totals to stdout')
+    args = parser.parse_args(argv)
+
+    months = MONS_PER_YR * args.years
+    if args.table:
+        table = pd.read_csv(args.table)
+        renamed = table.rename(columns=dict(spec.split('=', 1) for spec in args.column))
+        portfolio = Portfolio(args.start, months)
+        zones = table[args.zone_column].to_numpy(dtype=object) if args.zone_column else None
+        portfolio.add(table.index.tolist(), ra.inputs_from_table(renamed, ra.load_data(args.base)), zones=zones)
+    else:
+        portfolio = Portfolio.from_yamls(args.data_files, args.start, months)
+
+    timeline = portfolio.consolidated(args.zone, args.acquired)
+    if args.out:
+        timeline.to_csv(args.out, index_label='month')
+        print("output: %s (%d deals, %d months)" % (args.out, portfolio.mask(args.zone, args.acquired).sum(), months))
+    else:
+        yearly = timeline.groupby(timeline.index.year).agg(dict(
+            [(name, 'sum') for name in STREAMS if name != 'EQUITY'] + [('EQUITY', 'last'), ('NET_CASH_FLOW', 'sum')]))
+        yearly.round(0).to_string(sys.stdout)
+        sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
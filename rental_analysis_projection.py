@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""
+Multi-year hold projection with IRR, NPV and equity multiple.
+
+Metrics._TOTAL_ROI is a one-year snapshot. Here every deal gets a yearly
+cash-flow vector over the hold:
+
+    year 0      -TOTAL_CASH_OUTLAY
+    year 1..N   NOI - debt service, rents growing by RENT_GROWTH and
+                expenses by EXPENSE_INFLATION (year 1 == Metrics._CASH_FLOW)
+    year N      + PURCHASE_PRICE grown by PROPERTY_APPRECIATION_RATE,
+                less SALE_COST_RATE and the remaining mortgage balance
+
+N is the deal's own HOLD_YRS (or --years for all); a deal held shorter
+than the longest hold has zeros after its sale year. The simulate mode
+grows the property value from PURCHASE_PRICE the same way.
+
+All deals are stacked into one (deals x years) matrix and the IRR is solved
+for every row at once with a bracketed Newton iteration.
+
+The assumptions below can be overridden per deal with a PROJECTION section
+in its YAML file, or per row with columns of the same name in --table.
+
+usage: rental_analysis.py project deal.yml [deal.yml ...] [--years 10] [--out ranking.csv]
+       rental_analysis.py project --table listings.csv --base data_file.yml
+"""
+from __future__ import division
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import rental_analysis as ra
+
+
+PROJECTION_DEFAULTS = {
+    'HOLD_YRS': 10,
+    'RENT_GROWTH': 0.02,
+    'EXPENSE_INFLATION': 0.02,
+    'SALE_COST_RATE': 0.05,
+    'DISCOUNT_RATE': 0.08,
+}
+
+
+def with_defaults(inputs):
+    inputs = dict(inputs)
+    for name, value in PROJECTION_DEFAULTS.items():
+        inputs.setdefault(name, value)
+    return inputs
+
+
+def project_cash_flows(inputs, years=None):
+    """(deals x years + 1) matrix of yearly equity cash flows, year 0 first.
+
+    Each deal is sold at the end of its own HOLD_YRS, or of ``years`` when
+    given; the columns past a deal's sale are zero.
+    """
+    inputs = with_defaults(inputs)
+    base = ra.calculate_metrics(inputs)
+    shape = ra.deal_shape(inputs) or (1,)
+
+    def column(values):
+        return np.broadcast_to(np.asarray(values, dtype=float), shape).reshape(-1)[:, None]
+
+    def field(name):
+        return column(inputs[name])
+
+    def first_year(name):
+        return column(base[name])
+
+    hold = np.maximum(np.rint(field('HOLD_YRS') if years is None else column(years)), 1).astype(np.int64)
+    deals = hold.shape[0]
+    horizon = int(hold.max())
+    t = np.arange(1, horizon + 1)[None, :]
+    rent_factor = (1 + field('RENT_GROWTH'))**(t - 1)
+    expense_factor = (1 + field('EXPENSE_INFLATION'))**(t - 1)
+
+    management_fee = first_year('ANNUAL_PROPERTY_MANAGEMENT_FEE')
+    other_expenses = first_year('TOTAL_ANNUAL_EXPENSES') - management_fee
+    noi = (first_year('ANNUAL_GROSS_INCOME') - management_fee) * rent_factor - other_expenses * expense_factor
+
+    loan = first_year('MORTGAGE_LOAN_AMOUNT')
+    loan_yrs = field('MORTGAGE_LOAN_YRS')
+    debt = np.where(t <= loan_yrs, first_year('ANNUAL_MORTGAGE_LOAN_PAYMENT'), 0.0)
+
+    cash_flows = np.empty((deals, horizon + 1))
+    cash_flows[:, 0] = -first_year('TOTAL_CASH_OUTLAY')[:, 0]
+    cash_flows[:, 1:] = np.where(t <= hold, noi - debt, 0.0)
+
+    sale_price = field('PURCHASE_PRICE') * (1 + field('PROPERTY_APPRECIATION_RATE'))**hold
+    balance = ra.calculate_mortgage_balances(loan, loan_yrs, field('MORTGAGE_LOAN_APR'), np.minimum(hold, loan_yrs))
+    proceeds = sale_price * (1 - field('SALE_COST_RATE')) - balance
+    cash_flows[np.arange(deals), hold[:, 0]] += proceeds[:, 0]
+    return cash_flows
+
+
+def npv(cash_flows, rates):
+    """NPV of every row of ``cash_flows`` at the matching rate in ``rates``"""
+    t = np.arange(cash_flows.shape[1])
+    rates = np.broadcast_to(np.asarray(rates, dtype=float), cash_flows.shape[:1])[:, None]
+    return (cash_flows / (1 + rates)**t).sum(axis=1)
+
+
+def _npv_and_derivative(cash_flows, rates):
+    t = np.arange(cash_flows.shape[1])
+    discount = (1 + rates[:, None])**-t
+    value = (cash_flows * discount).sum(axis=1)
+    derivative = (-t * cash_flows * discount / (1 + rates[:, None])).sum(axis=1)
+    return value, derivative
+
+
+def irr(cash_flows, low=-0.99, high=10.0, tol=1e-10, maxiter=100):
+    """IRR of every row of ``cash_flows``.
+
+    Newton steps that leave the current sign-change bracket are replaced by
+    bisection, so each row converges as long as NPV changes sign between
+    ``low`` and ``high``; rows without a sign change get NaN.
+    """
+    cash_flows = np.atleast_2d(np.asarray(cash_flows, dtype=float))
+    rows = cash_flows.shape[0]
+    lo = np.full(rows, low)
+    hi = np.full(rows, high)
+    f_lo = npv(cash_flows, lo)
+    f_hi = npv(cash_flows, hi)
+    bracketed = np.sign(f_lo) != np.sign(f_hi)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # start from the rate that compounds the outlay into the sum of the inflows
+        multiple = cash_flows[:, 1:].sum(axis=1) / -cash_flows[:, 0]
+        rate = np.sign(multiple) * np.abs(multiple)**(1 / (cash_flows.shape[1] - 1)) - 1
+        rate = np.where((rate > lo) & (rate < hi), rate, 0.5 * (lo + hi))
+        active = bracketed.copy()
+        for _ in range(maxiter):
+            value, derivative = _npv_and_derivative(cash_flows, rate)
+            same_side = np.sign(value) == np.sign(f_lo)
+            lo = np.where(same_side, rate, lo)
+            f_lo = np.where(same_side, value, f_lo)
+            hi = np.where(same_side, hi, rate)
+
+            newton = rate - value / derivative
+            converged = (value == 0) | (np.abs(newton - rate) < tol)
+            outside = ~((newton > np.minimum(lo, hi)) & (newton < np.maximum(lo, hi)))
+            new_rate = np.where(outside & ~converged, 0.5 * (lo + hi), newton)
+            new_rate = np.where(value == 0, rate, new_rate)
+            # converged rows are frozen so later iterations cannot move them
+            rate = np.where(active, new_rate, rate)
+            active &= ~converged
+            if not active.any():
+                break
+    return np.where(bracketed, rate, np.nan)
+
+
+def project(inputs, years=None):
+    """IRR, NPV and equity multiple of every deal in ``inputs``, each held HOLD_YRS unless ``years`` is given"""
+    inputs = with_defaults(inputs)
+    cash_flows = project_cash_flows(inputs, years)
+    discount_rate = np.broadcast_to(np.asarray(inputs['DISCOUNT_RATE'], dtype=float), ra.deal_shape(inputs)).reshape(-1)
+    return {
+        'CASH_FLOWS': cash_flows,
+        'IRR': irr(cash_flows),
+        'NPV': npv(cash_flows, discount_rate),
+        'EQUITY_MULTIPLE': cash_flows[:, 1:].sum(axis=1) / -cash_flows[:, 0],
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rental_analysis.py project', description='multi-year hold projection and IRR ranking')
+    parser.add_argument('data_files', nargs='*')
+    parser.add_argument('--table', help='CSV with one deal per row, columns named like input fields')
+    parser.add_argument('--base', default='data_file.yml', help='deal YAML supplying fields missing from --table')
+    parser.add_argument('--years', type=int, help='hold period, default HOLD_YRS')
+    parser.add_argument('--out', help='write the ranking to this CSV instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.table:
+        table = pd.read_csv(args.table)
+        inputs = ra.inputs_from_table(table, ra.load_data(args.base))
+        for name in PROJECTION_DEFAULTS:
+            if name in table:
+                inputs[name] = table[name].to_numpy(dtype=float)
+        ids = table.index.to_numpy()
+    else:
+        inputs = ra.stack_inputs([ra.flatten_data(ra.load_data(f)) for f in args.data_files], PROJECTION_DEFAULTS)
+        ids = args.data_files
+
+    result = project(inputs, args.years)
+    ranking = pd.DataFrame({
+        'id': ids,
+        'IRR': result['IRR'],
+        'NPV': result['NPV'],
+        'EQUITY_MULTIPLE': result['EQUITY_MULTIPLE'],
+    }).sort_values('IRR', ascending=False)
+
+    if args.out:
+        ranking.to_csv(args.out, index=False)
+        print("output: %s" % args.out)
+    else:
+        ranking.to_string(sys.stdout, index=False)
+        sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+"""
+Monte Carlo simulation of rental deals.
+
+Instead of the single point estimates in the deal YAML, every scenario draws
+its own vacancy, rent growth, expense inflation and appreciation for each
+year of the hold, plus one mortgage APR for the life of the loan. The
+property value grows from PURCHASE_PRICE, as in the projection mode, and
+TOTAL_ROI nets the acquisition costs off it, so for the same rates it is
+the projection's equity multiple minus one before sale costs. Scenarios
+are simulated in fixed-size chunks, each seeded from a SeedSequence spawned
+from (seed, deal index, chunk index), so results are identical whatever the
+number of worker processes.
+
+usage: rental_analysis.py simulate deal.yml [deal.yml ...] -n 100000 --years 10 --workers 4 [--config simulation.yml]
+
+The optional config file overrides the defaults below (YEARS only when
+--years is not given), e.g.
+
+    YEARS: 15
+    VACANCY_RATE: {dist: triangular, left: 0.02, mode: 0.06, right: 0.20}
+    MORTGAGE_LOAN_APR: {dist: normal, mean: 0.04, std: 0.01, min: 0}
+"""
+from __future__ import division
+import sys
+import argparse
+import itertools
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import yaml
+
+import rental_analysis as ra
+
+
+DEFAULT_YEARS = 10
+DEFAULT_CHUNK_SIZE = 50000
+PERCENTILES = [5, 25, 50, 75, 95]
+
+# drawn once per scenario, everything else once per scenario and year
+PER_SCENARIO = ['MORTGAGE_LOAN_APR']
+
+
+def default_distributions(inputs):
+    """Distributions centred on the deal's own point estimates"""
+    return {
+        'VACANCY_RATE': {'dist': 'normal', 'mean': inputs['VACANCY_RATE'], 'std': 0.03, 'min': 0, 'max': 1},
+        'RENT_GROWTH': {'dist': 'normal', 'mean': 0.02, 'std': 0.015},
+        'EXPENSE_INFLATION': {'dist': 'fixed', 'value': 0.02},
+        'PROPERTY_APPRECIATION_RATE': {'dist': 'normal', 'mean': inputs['PROPERTY_APPRECIATION_RATE'], 'std': 0.03},
+        'MORTGAGE_LOAN_APR': {'dist': 'normal', 'mean': inputs['MORTGAGE_LOAN_APR'], 'std': 0.005, 'min': 0},
+    }
+
+
+def draw(rng, spec, size):
+    """Draw ``size`` samples from a distribution spec dict"""
+    dist = spec.get('dist', 'fixed')
+    if dist == 'fixed':
+        samples = np.full(size, float(spec['value']))
+    elif dist == 'normal':
+        samples = rng.normal(spec['mean'], spec['std'], size)
+    elif dist == 'uniform':
+        samples = rng.uniform(spec['low'], spec['high'], size)
+    elif dist == 'triangular':
+        samples = rng.triangular(spec['left'], spec['mode'], spec['right'], size)
+    elif dist == 'lognormal':
+        samples = rng.lognormal(spec['mean'], spec['sigma'], size)
+    else:
+        raise ValueError("unknown distribution: %s" % dist)
+    if 'min' in spec or 'max' in spec:
+        samples = np.clip(samples, spec.get('min', -np.inf), spec.get('max', np.inf))
+    return samples
+
+
+def growth_index(rates):
+    """(n, years) annual rates -> factor applied in each year, 1 in year one"""
+    index = np.ones_like(rates)
+    index[:, 1:] = np.cumprod(1 + rates[:, :-1], axis=1)
+    return index
+
+
+def simulate_chunk(inputs, distributions, years, n, seed_seq):
+    """Simulate ``n`` scenarios of one deal, vectorized over scenarios"""
+    rng = np.random.default_rng(seed_seq)
+    draws = {}
+    for name in sorted(distributions):
+        size = n if name in PER_SCENARIO else (n, years)
+        draws[name] = draw(rng, distributions[name], size)
+
+    base = ra.calculate_metrics(inputs)
+    price = float(inputs['PURCHASE_PRICE'])
+    total_cost = float(base['TOTAL_COST'])
+    loan = float(base['MORTGAGE_LOAN_AMOUNT'])
+    outlay = float(base['TOTAL_CASH_OUTLAY'])
+    loan_yrs = inputs['MORTGAGE_LOAN_YRS']
+
+    t = np.arange(1, years + 1)
+    apr = draws['MORTGAGE_LOAN_APR']
+    annual_debt = ra.calculate_monthly_mortgage_payments(loan, loan_yrs, apr)[:, None] * 12.0
+    annual_debt = np.where(t <= loan_yrs, annual_debt, 0.0)
+    balance = ra.calculate_mortgage_balances(loan, loan_yrs, apr[:, None], np.minimum(t, loan_yrs))
+
+    net_rent = 12 * inputs['MONTHLY_RENT'] * growth_index(draws['RENT_GROWTH']) * (1 - draws['VACANCY_RATE'])
+    income = net_rent + 12 * inputs['MONTHLY_OTHER_INCOME']
+    fixed_expenses = 12 * (
+        inputs['MONTHLY_INSURANCE'] +
+        inputs['MONTHLY_HOA'] +
+        inputs['MONTHLY_MAINTENANCE'] +
+        inputs['MONTHLY_UTILITIES'] +
+        inputs['MONTHLY_ADVERTISING'] +
+        inputs['MONTHLY_LANDSCAPING']
+    ) + inputs['PROPERTY_TAX_RATE'] * inputs['PURCHASE_PRICE']
+    expenses = inputs['PROPERTY_MANAGEMENT_FEE_RATE'] * net_rent + fixed_expenses * growth_index(draws['EXPENSE_INFLATION'])
+
+    cash_flow = income - expenses - annual_debt
+    # market value grows from the purchase price, like the sale price in the projection mode
+    value = price * np.cumprod(1 + draws['PROPERTY_APPRECIATION_RATE'], axis=1)
+    equity = value - balance
+
+    # TOTAL_ROI over the hold, same terms as Metrics._TOTAL_ROI; the acquisition
+    # costs are spent, so the final value is measured against TOTAL_COST
+    total_roi = (cash_flow.sum(axis=1) + (value[:, -1] - total_cost) + (loan - balance[:, -1])) / outlay
+
+    return {
+        'TOTAL_ROI': total_roi.astype(np.float32),
+        'CASH_FLOW': cash_flow.astype(np.float32),
+        'EQUITY': equity.astype(np.float32),
+    }
+
+
+def _run_chunk(job):
+    inputs, distributions, years, n, seed_seq = job
+    return simulate_chunk(inputs, distributions, years, n, seed_seq)
+
+
+def load_config(config_file):
+    if not config_file:
+        return {}
+    with open(config_file, 'r') as f:
+        return yaml.load(f, Loader=yaml.SafeLoader) or {}
+
+
+def plan_jobs(data, n, years, seed, deal_index, chunk_size, config):
+    inputs = ra.flatten_data(data)
+    distributions = default_distributions(inputs)
+    distributions.update(dict((k, v) for k, v in config.items() if k != 'YEARS'))
+    chunks = [chunk_size] * (n // chunk_size)
+    if n % chunk_size:
+        chunks.append(n % chunk_size)
+    seeds = np.random.SeedSequence(seed, spawn_key=(deal_index,)).spawn(len(chunks))
+    return [(inputs, distributions, years, size, seed_seq) for size, seed_seq in zip(chunks, seeds)]
+
+
+def summarize(chunks):
+    """Merge chunk results of one deal into percentile bands"""
+    total_roi = np.concatenate([c['TOTAL_ROI'] for c in chunks])
+    cash_flow = np.concatenate([c['CASH_FLOW'] for c in chunks])
+    equity = np.concatenate([c['EQUITY'] for c in chunks])
+    return {
+        'SCENARIOS': len(total_roi),
+        'PERCENTILES': PERCENTILES,
+        'TOTAL_ROI': np.percentile(total_roi, PERCENTILES),
+        'CASH_FLOW': np.percentile(cash_flow, PERCENTILES, axis=0),
+        'EQUITY': np.percentile(equity, PERCENTILES, axis=0),
+        'PROB_NEGATIVE_CASH_FLOW_YEAR_1': float(np.mean(cash_flow[:, 0] < 0)),
+        'PROB_NEGATIVE_CASH_FLOW_ANY_YEAR': float(np.mean((cash_flow < 0).any(axis=1))),
+        'PROB_NEGATIVE_CUMULATIVE_CASH_FLOW': float(np.mean(cash_flow.sum(axis=1) < 0)),
+    }
+
+
+def _in_order(pool, jobs, window):
+    """Chunk results of ``jobs`` in order, with at most ``window`` of them pending"""
+    pending = collections.deque()
+    for job in jobs:
+        pending.append(pool.submit(_run_chunk, job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def simulate_portfolio(datas, n=100000, years=None, seed=0, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, config=None):
+    """Simulate every deal in ``datas`` and return one summary per deal.
+
+    ``years`` defaults to the config's YEARS, then DEFAULT_YEARS. Each deal
+    is summarized as soon as its last chunk arrives, so only one deal's
+    scenarios (plus the chunks in flight) are held at a time.
+    """
+    config = config or {}
+    if years is None:
+        years = config.get('YEARS', DEFAULT_YEARS)
+    if n < 1:
+        raise ValueError("number of scenarios must be at least 1, got %s" % n)
+    if years < 1:
+        raise ValueError("years must be at least 1, got %s" % years)
+    jobs = []
+    owners = []
+    for deal_index, data in enumerate(datas):
+        deal_jobs = plan_jobs(data, n, years, seed, deal_index, chunk_size, config)
+        jobs.extend(deal_jobs)
+        owners.extend([deal_index] * len(deal_jobs))
+
+    def summarize_deals(results):
+        return [summarize([result for _, result in chunks])
+                for _, chunks in itertools.groupby(zip(owners, results), key=lambda pair: pair[0])]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return summarize_deals(_in_order(pool, jobs, 2 * workers))
+    return summarize_deals(_run_chunk(job) for job in jobs)
+
+
+def simulate(data, n=100000, years=None, seed=0, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, config=None):
+    return simulate_portfolio([data], n, years, seed, workers, chunk_size, config)[0]
+
+
+def show_summary(name, summary, stream=sys.stdout):
+    stream.write("== SIMULATION: %s ==\n" % name)
+    stream.write("SCENARIOS: %s\n" % summary['SCENARIOS'])
+    stream.write("TOTAL_ROI %s: %s\n" % (
+        '/'.join('P%d' % p for p in summary['PERCENTILES']),
+        ' '.join("%.2f%%" % (v * 100) for v in summary['TOTAL_ROI'])))
+    stream.write("PROB_NEGATIVE_CASH_FLOW_YEAR_1: %.2f%%\n" % (summary['PROB_NEGATIVE_CASH_FLOW_YEAR_1'] * 100))
+    stream.write("PROB_NEGATIVE_CASH_FLOW_ANY_YEAR: %.2f%%\n" % (summary['PROB_NEGATIVE_CASH_FLOW_ANY_YEAR'] * 100))
+    stream.write("PROB_NEGATIVE_CUMULATIVE_CASH_FLOW: %.2f%%\n" % (summary['PROB_NEGATIVE_CUMULATIVE_CASH_FLOW'] * 100))
+    for year, (cash_flow, equity) in enumerate(zip(summary['CASH_FLOW'].T, summary['EQUITY'].T), 1):
+        stream.write("YEAR %d CASH_FLOW: %s EQUITY: %s\n" % (
+            year,
+            '/'.join('%d' % v for v in cash_flow),
+            '/'.join('%d' % v for v in equity)))
+    stream.write("\n")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rental_analysis.py simulate', description='Monte Carlo simulation of deals')
+    parser.add_argument('data_files', nargs='+')
+    parser.add_argument('-n', '--scenarios', type=int, default=100000)
+    parser.add_argument('--years', type=int, help='hold period, default YEARS from --config or %d' % DEFAULT_YEARS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--config', help='YAML file with YEARS and distribution overrides')
+    args = parser.parse_args(argv)
+
+    datas = [ra.load_data(data_file) for data_file in args.data_files]
+    summaries = simulate_portfolio(
+        datas,
+        n=args.scenarios,
+        years=args.years,
+        seed=args.seed,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        config=load_config(args.config),
+    )
+    for data_file, summary in zip(args.data_files, summaries):
+        show_summary(data_file, summary)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""
+Reverse solver: the highest PURCHASE_PRICE that still meets a target metric.
+
+With every other assumption fixed, NOI, debt service, TOTAL_COST and
+TOTAL_CASH_OUTLAY are linear in the price P:
+
+    NOI          = A - PROPERTY_TAX_RATE * P
+    annual debt  = D * P            (D: annual payment per euro of price)
+    TOTAL_COST   = P + K            (K: improvement, closing, notary, ...)
+    CASH_OUTLAY  = DOWNPAY * P + K
+
+so CAP_RATE, CASH_ROI and DSCR targets have a closed-form bound. The model
+rounds some terms up to whole euros, so that bound is only polished by a
+short vectorized bisection. Any other metric returned by
+rental_analysis.calculate_metrics() that falls as the price rises, such as
+MONTHLY_CASH_FLOW, is solved by bisection alone. TOTAL_ROI is not one of
+them: with leverage, appreciation and equity accrual grow with the price.
+
+usage: rental_analysis.py maxbid deal.yml [deal.yml ...] --cap-rate 0.06 [--cash-roi 0.08] [--dscr 1.2]
+       rental_analysis.py maxbid --table immobiliare_listings_processed.csv --base data_file.yml \\
+           --column affitto_mensile=MONTHLY_RENT --cap-rate 0.06 --out max_bid.csv
+"""
+from __future__ import division
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import rental_analysis as ra
+
+
+CLOSED_FORM_METRICS = ['CAP_RATE', 'CASH_ROI', 'DSCR']
+MAX_PRICE = 1e7
+
+
+def linear_terms(inputs):
+    """A, tax rate, D, K and down payment share of the price-linear model"""
+    monthly_net_rent = np.ceil(np.asarray(inputs['MONTHLY_RENT'], dtype=float) * (1 - np.asarray(inputs['VACANCY_RATE'], dtype=float)))
+    gross_income = (monthly_net_rent + inputs['MONTHLY_OTHER_INCOME']) * 12
+    management_fee = np.ceil(np.asarray(inputs['PROPERTY_MANAGEMENT_FEE_RATE'], dtype=float) * monthly_net_rent) * 12
+    other_expenses = (np.asarray(inputs['MONTHLY_INSURANCE'], dtype=float) +
+                      inputs['MONTHLY_HOA'] +
+                      inputs['MONTHLY_MAINTENANCE'] +
+                      inputs['MONTHLY_UTILITIES'] +
+                      inputs['MONTHLY_ADVERTISING'] +
+                      inputs['MONTHLY_LANDSCAPING']) * 12
+    acquisition_costs = np.asarray(inputs['IMPROVEMENT_COST'], dtype=float) + \
+        inputs['CLOSING_COST'] + inputs['NOTARY_FEES'] + inputs['AGENCY_FEES'] + inputs['REGISTRATION_TAX']
+
+    downpay = np.asarray(inputs['MORTGAGE_LOAN_DOWNPAY_PERCENTAGE'], dtype=float)
+    c = np.asarray(inputs['MORTGAGE_LOAN_APR'], dtype=float) / 12
+    n = 12 * np.asarray(inputs['MORTGAGE_LOAN_YRS'], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = np.where(c == 0, 1 / n, c * (1 + c)**n / ((1 + c)**n - 1))
+    debt_per_euro = 12 * annuity * (1 - downpay)
+
+    return {
+        'A': gross_income - management_fee - other_expenses,
+        'TAX': np.asarray(inputs['PROPERTY_TAX_RATE'], dtype=float),
+        'D': debt_per_euro,
+        'K': acquisition_costs,
+        'DOWNPAY': downpay,
+    }
+
+
+def closed_form_max_price(inputs, metric, target):
+    """Upper bound on the price meeting ``target`` for CAP_RATE, CASH_ROI or DSCR, NaN when unreachable"""
+    terms = linear_terms(inputs)
+    A, tax, D, K, downpay = terms['A'], terms['TAX'], terms['D'], terms['K'], terms['DOWNPAY']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'CAP_RATE':
+            # (A - tax P) / (P + K) >= target
+            price = (A - target * K) / (target + tax)
+        elif metric == 'CASH_ROI':
+            # (A - tax P - D P) / (downpay P + K) >= target
+            price = (A - target * K) / (tax + D + target * downpay)
+        elif metric == 'DSCR':
+            # (A - tax P) / (D P) >= target
+            price = A / (target * D + tax)
+        else:
+            raise ValueError("no closed form for %s" % metric)
+    return np.where(price > 0, price, np.nan)
+
+
+def evaluate_metric(inputs, metric, prices):
+    inputs = dict(inputs)
+    inputs['PURCHASE_PRICE'] = prices
+    return ra.calculate_metrics(inputs)[metric]
+
+
+def bisect_max_price(inputs, metric, target, low, high, tol=1.0, maxiter=100):
+    """Largest price in [low, high] whose ``metric`` is still >= ``target``, per deal.
+
+    Deals that miss the target even at ``low`` get NaN; deals that meet it
+    at ``high`` get ``high``.
+    """
+    low, high = np.broadcast_arrays(np.asarray(low, dtype=float), np.asarray(high, dtype=float))
+    low = low.copy()
+    high = high.copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        feasible = evaluate_metric(inputs, metric, low) >= target
+        capped = evaluate_metric(inputs, metric, high) >= target
+        for _ in range(maxiter):
+            if np.all(high - low <= tol):
+                break
+            mid = 0.5 * (low + high)
+            ok = evaluate_metric(inputs, metric, mid) >= target
+            low = np.where(ok, mid, low)
+            high = np.where(ok, high, mid)
+        # the whole euros left in [low, high) are floor(low) and possibly floor(high)
+        top = np.floor(high)
+        top_ok = (top >= low) & (evaluate_metric(inputs, metric, top) >= target)
+    price = np.where(capped, high, np.where(top_ok, top, np.floor(low)))
+    return np.where(feasible, price, np.nan)
+
+
+def max_offer_price(inputs, metric, target):
+    """Highest whole-euro PURCHASE_PRICE with ``metric`` >= ``target`` for every deal in ``inputs``"""
+    if metric in CLOSED_FORM_METRICS:
+        bound = closed_form_max_price(inputs, metric, target)
+        bound = np.where(np.isfinite(bound), bound, 0.0)
+        # rounding up in the model costs at most a few euros of NOI, so the
+        # answer sits just below the bound; widen to the full range otherwise
+        low = np.maximum(bound * 0.98 - 1000, 1.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            low = np.where(evaluate_metric(inputs, metric, low) >= target, low, 1.0)
+        return bisect_max_price(inputs, metric, target, low, bound + 1)
+    return bisect_max_price(inputs, metric, target, 1.0, MAX_PRICE)
+
+
+def max_bids(inputs, targets):
+    """Max price per target metric and MAX_BID, the lowest of them"""
+    result = {}
+    for metric, target in targets.items():
+        result['MAX_PRICE_%s' % metric] = max_offer_price(inputs, metric, target)
+    result['MAX_BID'] = np.fmin.reduce([np.atleast_1d(v) for v in result.values()])
+    return result
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rental_analysis.py maxbid', description='maximum offer price for target metrics')
+    parser.add_argument('data_files', nargs='*')
+    parser.add_argument('--table', help='CSV with one deal per row, columns named like input fields')
+    parser.add_argument('--base', default='data_file.yml', help='deal YAML supplying fields missing from --table')
+    parser.add_argument('--column', action='append', default=[], metavar='SRC=FIELD', help='read input FIELD from table column SRC')
+    parser.add_argument('--cap-rate', type=float)
+    parser.add_argument('--cash-roi', type=float)
+    parser.add_argument('--dscr', type=float)
+    parser.add_argument('--monthly-cash-flow', type=float)
+    parser.add_argument('--out', help='write the table with MAX_BID columns to this CSV')
+    args = parser.parse_args(argv)
+
+    targets = {}
+    for metric, target in [('CAP_RATE', args.cap_rate), ('CASH_ROI', args.cash_roi), ('DSCR', args.dscr), ('MONTHLY_CASH_FLOW', args.monthly_cash_flow)]:
+        if target is not None:
+            targets[metric] = target
+    if not targets:
+        parser.error('at least one of --cap-rate, --cash-roi, --dscr, --monthly-cash-flow is required')
+
+    if args.table:
+        table = pd.read_csv(args.table)
+        renamed = table.rename(columns=dict(spec.split('=', 1) for spec in args.column))
+        inputs = ra.inputs_from_table(renamed, ra.load_data(args.base))
+    else:
+        table = pd.DataFrame({'data_file': args.data_files})
+        inputs = ra.stack_inputs([ra.flatten_data(ra.load_data(f)) for f in args.data_files])
+
+    for name, values in max_bids(inputs, targets).items():
+        table[name] = np.broadcast_to(values, (len(table),))
+
+    if args.out:
+        table.to_csv(args.out, index=False)
+        print("output: %s" % args.out)
+    else:
+        table.to_string(sys.stdout, index=False)
+        sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
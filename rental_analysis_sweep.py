@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Sensitivity sweep: one deal over a grid of PURCHASE_PRICE, MORTGAGE_LOAN_APR,
+MONTHLY_RENT and VACANCY_RATE.
+
+rental_analysis.calculate_metrics() broadcasts, so every axis becomes an
+array along its own dimension and the whole grid is evaluated in one pass.
+The CAP_RATE, CASH_ROI, DSCR and MONTHLY_CASH_FLOW cubes are written as
+compressed .npz (cubes plus axes) or as .parquet (one row per grid point).
+
+usage: rental_analysis.py sweep deal.yml out.npz --price 200000:300000:50 --apr 0.02:0.06:50 --rent 900:1500:20 --vacancy 0:0.15:10
+"""
+from __future__ import division
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import rental_analysis as ra
+
+
+SWEEP_AXES = ['PURCHASE_PRICE', 'MORTGAGE_LOAN_APR', 'MONTHLY_RENT', 'VACANCY_RATE']
+SWEEP_METRICS = ['CAP_RATE', 'CASH_ROI', 'DSCR', 'MONTHLY_CASH_FLOW']
+
+
+def sweep(data, grid, metrics=SWEEP_METRICS):
+    """Evaluate a deal over the cartesian product of ``grid`` in one pass.
+
+    ``grid`` maps input field names to 1-D value arrays; axis i of every
+    returned cube follows the i-th key of ``grid``.
+    """
+    inputs = ra.flatten_data(data)
+    axes = list(grid)
+    for i, name in enumerate(axes):
+        shape = [1] * len(axes)
+        shape[i] = -1
+        inputs[name] = np.asarray(grid[name], dtype=float).reshape(shape)
+    shape = tuple(len(grid[name]) for name in axes)
+    result = ra.calculate_metrics(inputs)
+    return dict((name, np.broadcast_to(result[name], shape)) for name in metrics)
+
+
+def write_sweep(outfile, grid, cubes):
+    """Write a sweep as .npz (dense cubes + axes) or .parquet (one row per grid point)"""
+    if outfile.endswith('.parquet'):
+        axes = list(grid)
+        index = pd.MultiIndex.from_product([grid[name] for name in axes], names=axes)
+        df = pd.DataFrame(dict((name, np.ravel(cube)) for name, cube in cubes.items()), index=index)
+        df.astype('float32').reset_index().to_parquet(outfile, index=False)
+    else:
+        arrays = dict(('axis_%s' % name, np.asarray(values)) for name, values in grid.items())
+        arrays['axes'] = np.array(list(grid))
+        for name, cube in cubes.items():
+            arrays[name] = np.ascontiguousarray(cube, dtype=np.float32)
+        np.savez_compressed(outfile, **arrays)
+
+
+def parse_range(spec):
+    """'start:stop:num' -> np.linspace(start, stop, num); a plain number -> [number]"""
+    parts = spec.split(':')
+    if len(parts) == 1:
+        return np.array([float(parts[0])])
+    start, stop, num = parts
+    return np.linspace(float(start), float(stop), int(num))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rental_analysis.py sweep', description='sensitivity grid of a deal')
+    parser.add_argument('data_file')
+    parser.add_argument('outfile', help='.npz or .parquet')
+    parser.add_argument('--price', help='PURCHASE_PRICE range start:stop:num')
+    parser.add_argument('--apr', help='MORTGAGE_LOAN_APR range start:stop:num')
+    parser.add_argument('--rent', help='MONTHLY_RENT range start:stop:num')
+    parser.add_argument('--vacancy', help='VACANCY_RATE range start:stop:num')
+    args = parser.parse_args(argv)
+
+    data = ra.load_data(args.data_file)
+    inputs = ra.flatten_data(data)
+    grid = {}
+    for name, spec in zip(SWEEP_AXES, [args.price, args.apr, args.rent, args.vacancy]):
+        grid[name] = parse_range(spec) if spec else np.array([float(inputs[name])])
+
+    cubes = sweep(data, grid)
+    write_sweep(args.outfile, grid, cubes)
+    print("output: %s %s" % (args.outfile, 'x'.join(str(len(v)) for v in grid.values())))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
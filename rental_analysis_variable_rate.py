@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""
+Variable and mixed-rate mortgages driven by Euribor paths.
+
+Financing assumes MORTGAGE_LOAN_APR for the whole MORTGAGE_LOAN_YRS. Here a
+loan keeps MORTGAGE_LOAN_APR for its first MORTGAGE_FIXED_YRS (0 for a
+plain variable loan), then pays Euribor + MORTGAGE_LOAN_SPREAD, never less
+than MORTGAGE_RATE_FLOOR. Every MORTGAGE_RESET_MONTHS the installment is
+recomputed on the remaining balance and term. All loans and all paths step
+through the months together as one (loans x paths) array.
+
+Each year's debt service and principal repaid then replace the fixed-rate
+ones in the deal's DealGraph, so DSCR, CASH_FLOW, CASH_ROI and TOTAL_ROI
+come from the same formulas as the single-deal report, per loan, path and
+year.
+
+The rate path is either a CSV with ``month`` (1 = first month of the loan)
+and ``euribor`` columns as fractions, plus an optional ``path`` column for
+several paths, or simulated with a mean-reverting (Vasicek) model. A path
+shorter than the loan repeats its last rate.
+
+usage: rental_analysis.py variable deal.yml [deal.yml ...] --euribor euribor.csv
+       rental_analysis.py variable deal.yml --simulate 10000 [--euribor-start 0.03 --euribor-mean 0.025 --euribor-vol 0.01]
+       rental_analysis.py variable --table listings.csv --base data_file.yml --simulate 1000 --out dscr.csv
+"""
+from __future__ import division
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import rental_analysis as ra
+
+
+MONS_PER_YR = 12
+PERCENTILES = [5, 50, 95]
+
+VARIABLE_RATE_DEFAULTS = {
+    'MORTGAGE_LOAN_SPREAD': 0.015,
+    'MORTGAGE_FIXED_YRS': 0,
+    'MORTGAGE_RESET_MONTHS': 12,
+    'MORTGAGE_RATE_FLOOR': 0.0,
+}
+
+VARIABLE_RATE_METRICS = ['ANNUAL_MORTGAGE_LOAN_PAYMENT', 'DSCR', 'CASH_FLOW', 'MONTHLY_CASH_FLOW', 'CASH_ROI', 'TOTAL_ROI']
+
+
+def with_defaults(inputs):
+    inputs = dict(inputs)
+    for name, value in VARIABLE_RATE_DEFAULTS.items():
+        inputs.setdefault(name, value)
+    return inputs
+
+
+def load_rate_paths(rate_file):
+    """(paths x months) Euribor matrix from a CSV with month, euribor and optionally path columns"""
+    table = pd.read_csv(rate_file)
+    if 'path' not in table:
+        table['path'] = 0
+    wide = table.pivot(index='path', columns='month', values='euribor').sort_index(axis=1)
+    return wide.ffill(axis=1).to_numpy(dtype=float)
+
+
+def simulate_rate_paths(paths, months, start=0.03, mean=0.025, speed=0.3, vol=0.01, seed=0):
+    """(paths x months) monthly Euribor fixings from a Vasicek model, first month == ``start``"""
+    rng = np.random.default_rng(seed)
+    dt = 1 / MONS_PER_YR
+    shocks = rng.standard_normal((paths, months - 1)) * vol * np.sqrt(dt)
+    rates = np.empty((paths, months))
+    rates[:, 0] = start
+    for t in range(1, months):
+        rates[:, t] = rates[:, t - 1] + speed * (mean - rates[:, t - 1]) * dt + shocks[:, t - 1]
+    return rates
+
+
+def _annuity_payment(balance, c, months):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(c == 0, balance / months, balance * c / (1 - (1 + c)**-months))
+
+
+def loan_amounts(inputs):
+    """MORTGAGE_LOAN_AMOUNT of every loan, one per cell of the broadcast inputs"""
+    loans = ra.calculate_metrics(inputs)['MORTGAGE_LOAN_AMOUNT']
+    return np.broadcast_to(loans, ra.deal_shape(inputs) or (1,)).reshape(-1)
+
+
+def amortize(inputs, euribor):
+    """Yearly debt service and year-end balance of every loan on every Euribor path.
+
+    Args:
+        inputs: flat deal inputs (scalars or 1-D arrays over loans)
+        euribor: (paths x months) Euribor fixings
+
+    Returns:
+        dict with ANNUAL_MORTGAGE_LOAN_PAYMENT and MORTGAGE_LOAN_BALANCE,
+        both (loans x paths x years), payments in whole euros per month like
+        calculate_monthly_mortgage_payment()
+    """
+    inputs = with_defaults(inputs)
+    loans = loan_amounts(inputs)
+    count = loans.shape[0]
+
+    def column(name):
+        return np.broadcast_to(np.asarray(inputs[name], dtype=float), (count,))[:, None]
+
+    term = (MONS_PER_YR * column('MORTGAGE_LOAN_YRS')).astype(np.int64)
+    fixed = (MONS_PER_YR * column('MORTGAGE_FIXED_YRS')).astype(np.int64)
+    reset_every = column('MORTGAGE_RESET_MONTHS').astype(np.int64)
+    fixed_apr = column('MORTGAGE_LOAN_APR')
+    spread = column('MORTGAGE_LOAN_SPREAD')
+    floor = column('MORTGAGE_RATE_FLOOR')
+
+    euribor = np.atleast_2d(np.asarray(euribor, dtype=float))
+    months = int(term.max())
+    if euribor.shape[1] < months:
+        euribor = np.concatenate([euribor, np.repeat(euribor[:, -1:], months - euribor.shape[1], axis=1)], axis=1)
+    years = -(-months // MONS_PER_YR)
+
+    shape = (count, euribor.shape[0])
+    balance = np.broadcast_to(loans[:, None], shape).astype(float)
+    payment = np.zeros(shape)
+    rate = np.zeros(shape)
+    annual_payment = np.zeros(shape + (years,))
+    year_end_balance = np.zeros(shape + (years,))
+
+    for t in range(months):
+        remaining = term - t
+        reset = (t == 0) | ((t >= fixed) & ((t - fixed) % reset_every == 0))
+        if reset.any():
+            new_rate = np.where(t < fixed, fixed_apr, np.maximum(euribor[None, :, t] + spread, floor))
+            rate = np.where(reset, new_rate, rate)
+            payment = np.where(reset, _annuity_payment(balance, rate / MONS_PER_YR, np.maximum(remaining, 1)), payment)
+        paid = np.where(remaining > 0, payment, 0.0)
+        balance = np.where(remaining > 1, balance * (1 + rate / MONS_PER_YR) - paid, 0.0)
+        annual_payment[:, :, t // MONS_PER_YR] += np.ceil(paid)
+        if t % MONS_PER_YR == MONS_PER_YR - 1 or t == months - 1:
+            year_end_balance[:, :, t // MONS_PER_YR] = balance
+
+    return {
+        'ANNUAL_MORTGAGE_LOAN_PAYMENT': annual_payment,
+        'MORTGAGE_LOAN_BALANCE': np.ceil(year_end_balance),
+    }
+
+
+def variable_rate_metrics(inputs, euribor):
+    """Deal metrics of every loan, path and year under the variable rate: (loans x paths x years) each"""
+    inputs = with_defaults(inputs)
+    schedule = amortize(inputs, euribor)
+    loans = loan_amounts(inputs)
+    balance = schedule['MORTGAGE_LOAN_BALANCE']
+    opening = np.concatenate([np.broadcast_to(loans[:, None, None], balance.shape[:2] + (1,)), balance[:, :, :-1]], axis=2)
+
+    # every input as (loans x 1 x 1) so the graph broadcasts against the yearly arrays
+    graph = ra.DealGraph(dict(
+        (name, np.reshape(value, (-1, 1, 1)) if np.ndim(value) else value)
+        for name, value in inputs.items()))
+    graph.set('ANNUAL_MORTGAGE_LOAN_PAYMENT', schedule['ANNUAL_MORTGAGE_LOAN_PAYMENT'])
+    graph.set('EQUITY_ACCURAL_AMOUNT', opening - balance)
+    metrics = graph.evaluate(VARIABLE_RATE_METRICS)
+    metrics['MORTGAGE_LOAN_BALANCE'] = balance
+    return metrics
+
+
+def summarize(metrics, deal_index):
+    """Percentiles over paths, per year, of one deal's metrics"""
+    shape = metrics['ANNUAL_MORTGAGE_LOAN_PAYMENT'].shape
+
+    def deal(name):
+        return np.broadcast_to(metrics[name], shape)[deal_index]
+
+    summary = {}
+    for name in ['ANNUAL_MORTGAGE_LOAN_PAYMENT', 'DSCR', 'MONTHLY_CASH_FLOW', 'MORTGAGE_LOAN_BALANCE']:
+        summary[name] = np.percentile(deal(name), PERCENTILES, axis=0)
+    in_term = deal('ANNUAL_MORTGAGE_LOAN_PAYMENT') > 0
+    summary['PROB_DSCR_BELOW_1'] = float(np.mean(((deal('DSCR') < 1) & in_term).any(axis=1)))
+    summary['PROB_NEGATIVE_CASH_FLOW'] = float(np.mean((deal('CASH_FLOW') < 0).any(axis=1)))
+    return summary
+
+
+def show_summary(name, summary, stream=sys.stdout):
+    stream.write("== VARIABLE RATE: %s ==\n" % name)
+    stream.write("PROB_DSCR_BELOW_1: %.2f%%\n" % (summary['PROB_DSCR_BELOW_1'] * 100))
+    stream.write("PROB_NEGATIVE_CASH_FLOW: %.2f%%\n" % (summary['PROB_NEGATIVE_CASH_FLOW'] * 100))
+    bands = '/'.join('P%d' % p for p in PERCENTILES)
+    for year in range(summary['DSCR'].shape[1]):
+        stream.write("YEAR %d %s ANNUAL_MORTGAGE_LOAN_PAYMENT: %s DSCR: %s MONTHLY_CASH_FLOW: %s\n" % (
+            year + 1, bands,
+            '/'.join('%d' % v for v in summary['ANNUAL_MORTGAGE_LOAN_PAYMENT'][:, year]),
+            '/'.join('%.2f' % v for v in summary['DSCR'][:, year]),
+            '/'.join('%d' % v for v in summary['MONTHLY_CASH_FLOW'][:, year])))
+    stream.write("\n")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rental_analysis.py variable', description='variable and mixed-rate mortgages on Euribor paths')
+    parser.add_argument('data_files', nargs='*')
+    parser.add_argument('--table', help='CSV with one deal per row, columns named like input fields')
+    parser.add_argument('--base', default='data_file.yml', help='deal YAML supplying fields missing from --table')
+    parser.add_argument('--euribor', help='CSV with month, euribor and optionally path columns')
+    parser.add_argument('--simulate', type=int, metavar='PATHS', help='simulate this many Euribor paths instead')
+    parser.add_argument('--euribor-start', type=float, default=0.03)
+    parser.add_argument('--euribor-mean', type=float, default=0.025)
+    parser.add_argument('--euribor-speed', type=float, default=0.3)
+    parser.add_argument('--euribor-vol', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write per-deal P50 DSCR by year and PROB_DSCR_BELOW_1 to this CSV')
+    args = parser.parse_args(argv)
+
+    if args.table:
+        table = pd.read_csv(args.table)
+        inputs = ra.inputs_from_table(table, ra.load_data(args.base))
+        for name in VARIABLE_RATE_DEFAULTS:
+            if name in table:
+                inputs[name] = table[name].to_numpy(dtype=float)
+        ids = table.index.to_numpy()
+    else:
+        inputs = ra.stack_inputs([ra.flatten_data(ra.load_data(f)) for f in args.data_files], VARIABLE_RATE_DEFAULTS)
+        ids = args.data_files
+
+    if args.euribor:
+        euribor = load_rate_paths(args.euribor)
+    elif args.simulate:
+        months = int(MONS_PER_YR * np.max(inputs['MORTGAGE_LOAN_YRS']))
+        euribor = simulate_rate_paths(args.simulate, months, args.euribor_start, args.euribor_mean, args.euribor_speed, args.euribor_vol, args.seed)
+    else:
+        parser.error('one of --euribor or --simulate is required')
+
+    metrics = variable_rate_metrics(inputs, euribor)
+    summaries = [summarize(metrics, i) for i in range(len(ids))]
+
+    if args.out:
+        rows = []
+        for deal_id, summary in zip(ids, summaries):
+            row = {'id': deal_id, 'PROB_DSCR_BELOW_1': summary['PROB_DSCR_BELOW_1']}
+            for year, dscr in enumerate(summary['DSCR'][PERCENTILES.index(50)], 1):
+                row['DSCR_P50_YEAR_%d' % year] = dscr
+            rows.append(row)
+        pd.DataFrame(rows).to_csv(args.out, index=False)
+        print("output: %s" % args.out)
+    else:
+        for deal_id, summary in zip(ids, summaries):
+            show_summary(deal_id, summary)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])